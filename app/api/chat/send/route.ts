@@ -111,6 +111,8 @@ export async function POST(request: NextRequest) {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // Per-user rate limits in the backend (all calls come from this server's IP)
+          'X-User-ID': user.id,
         },
         signal: controller.signal,
         body: JSON.stringify({
@@ -206,7 +208,12 @@ export async function POST(request: NextRequest) {
             ? JSON.parse(user.profile.badges)
             : (user.profile.badges || [])
 
-        const newBadges: string[] = []
+        // The backend batches XP, level, mastery, XP badges and the
+        // leaderboard row (write-behind). user.profile.xp can trail by a
+        // flush interval then, so the badges earned come from the backend
+        const progressPersisted = aiBackendResponse.headers.get('X-Progress-Persisted') === 'true'
+        const newBadges: string[] = progressPersisted ? aiResponse.newBadges || [] : []
+        // Same milestones as XP_BADGES in backend/core/progress.py
         const xpMilestones = [
           { xp: 100, id: 'xp-100' },
           { xp: 200, id: 'xp-200' },
@@ -219,38 +226,40 @@ export async function POST(request: NextRequest) {
         ]
 
         xpMilestones.forEach(milestone => {
-          if (newXP >= milestone.xp && !currentBadges.includes(milestone.id)) {
+          if (!progressPersisted && newXP >= milestone.xp && !currentBadges.includes(milestone.id)) {
             currentBadges.push(milestone.id)
             newBadges.push(milestone.id)
           }
         })
 
-        await prisma.profile.update({
-          where: { userId: user.id },
-          data: {
-            xp: newXP,
-            level: newLevel,
-            mastery: JSON.stringify(updatedMastery),
-            badges: JSON.stringify(currentBadges),
-            lastActive: new Date(),
-          },
-        })
+        if (!progressPersisted) {
+          await prisma.profile.update({
+            where: { userId: user.id },
+            data: {
+              xp: newXP,
+              level: newLevel,
+              mastery: JSON.stringify(updatedMastery),
+              badges: JSON.stringify(currentBadges),
+              lastActive: new Date(),
+            },
+          })
 
-        // Update leaderboard
-        await prisma.leaderboard.upsert({
-          where: { userId: user.id },
-          update: {
-            totalXP: newXP,
-            level: newLevel,
-          },
-          create: {
-            userId: user.id,
-            displayName: user.displayName || 'Anonymous',
-            photoURL: user.photoURL,
-            totalXP: newXP,
-            level: newLevel,
-          },
-        })
+          // Update leaderboard
+          await prisma.leaderboard.upsert({
+            where: { userId: user.id },
+            update: {
+              totalXP: newXP,
+              level: newLevel,
+            },
+            create: {
+              userId: user.id,
+              displayName: user.displayName || 'Anonymous',
+              photoURL: user.photoURL,
+              totalXP: newXP,
+              level: newLevel,
+            },
+          })
+        }
 
         // Add new badges to response
         aiResponse.newBadges = newBadges
@@ -1,4 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server'
+import { prisma } from '@/lib/prisma'
+
+const pythonBackendUrl = () => process.env.PYTHON_BACKEND_URL || 'http://localhost:8001'
 
 export async function POST(request: NextRequest) {
   try {
@@ -15,17 +18,26 @@ export async function POST(request: NextRequest) {
       )
     }
 
-    // Call Python backend for Gemini evaluation
-    const pythonBackendUrl = process.env.PYTHON_BACKEND_URL || 'http://localhost:8001'
-    
+    // The backend rate-limits per learner by the Prisma user id, the same
+    // identity /api/chat/send uses; learners without a row yet are limited
+    // by their firebaseUid (read-only: evaluating a quiz creates no rows)
+    const existing =
+      firebaseUid === 'dev-test-uid'
+        ? { id: 'dev-user' }
+        : await prisma.user.findUnique({ where: { firebaseUid }, select: { id: true } })
+    const userId = existing?.id ?? firebaseUid
+
+    // Call Python backend: scores and template feedback come back at once,
+    // Gemini's feedback is written in the background (feedbackJobId, see GET)
     console.log('🎓 Evaluating quiz with Gemini...')
-    console.log('📤 Sending to backend:', `${pythonBackendUrl}/api/v1/evaluate-quiz`)
+    console.log('📤 Sending to backend:', `${pythonBackendUrl()}/api/v1/evaluate-quiz`)
     console.log('📋 Questions:', JSON.stringify(questions, null, 2))
     
-    const evaluationResponse = await fetch(`${pythonBackendUrl}/api/v1/evaluate-quiz`, {
+    const evaluationResponse = await fetch(`${pythonBackendUrl()}/api/v1/evaluate-quiz?mode=fast&enrich=true`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-User-ID': userId,
       },
       body: JSON.stringify({ questions }),
     })
@@ -52,3 +64,25 @@ export async function POST(request: NextRequest) {
     )
   }
 }
+
+// Poll the Gemini feedback job started by POST: { status, feedback }
+export async function GET(request: NextRequest) {
+  const jobId = request.nextUrl.searchParams.get('jobId')
+  if (!jobId) {
+    return NextResponse.json({ error: 'Missing jobId' }, { status: 400 })
+  }
+
+  try {
+    const jobResponse = await fetch(
+      `${pythonBackendUrl()}/api/v1/evaluate-quiz/feedback/${encodeURIComponent(jobId)}`,
+      { cache: 'no-store' }
+    )
+    return NextResponse.json(await jobResponse.json(), { status: jobResponse.status })
+  } catch (error: any) {
+    console.error('❌ Error polling quiz feedback:', error)
+    return NextResponse.json(
+      { error: error.message || 'Internal server error' },
+      { status: 500 }
+    )
+  }
+}
@@ -120,6 +120,35 @@ export default function OnboardingPage() {
     setSelectedQuestions(shuffled.slice(0, 8))
   }, [router])
 
+  useEffect(() => {
+    // The evaluation arrives with template feedback; swap in Gemini's once it's written
+    const jobId = evaluationResult?.feedbackJobId
+    if (!jobId) return
+
+    let attempts = 0
+    const timer = setInterval(async () => {
+      attempts += 1
+      try {
+        const response = await fetch(`/api/onboarding/evaluate?jobId=${encodeURIComponent(jobId)}`)
+        const job = response.ok ? await response.json() : { status: 'failed' }
+        if (job.status === 'done' && job.feedback) {
+          setEvaluationResult((previous: any) => ({ ...previous, feedback: job.feedback, feedbackJobId: undefined }))
+          const user = auth.currentUser
+          if (user) {
+            await setDoc(doc(db, 'users', user.uid), {
+              quizResults: { evaluation: { feedback: job.feedback } },
+            }, { merge: true })
+          }
+        }
+        if (job.status !== 'pending' || attempts >= 10) clearInterval(timer)
+      } catch (error) {
+        console.error('Feedback poll error:', error)
+        clearInterval(timer)
+      }
+    }, 1500)
+    return () => clearInterval(timer)
+  }, [evaluationResult?.feedbackJobId])
+
   const handleStartQuiz = () => {
     setCurrentStep('quiz')
   }
@@ -2,13 +2,52 @@
 Chat API endpoint for Socratic tutor
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
+import asyncio
+import json
+import logging
+import threading
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Callable, List, Dict, Any, Optional
+from core.admission import AdmissionController, get_admission
+from core.leaderboard import get_leaderboard
+from core.log import debug_payload, get_logger, log_fields
+from core.metrics import stage_timer
+from core.progress import get_progress_writer
+from core.sessions import ChatSession, SessionStore, session_store_from_env
+from core.sort_engine import MAX_LESSON_ARRAY
 from core.tutor import SocraticTutor
 
 router = APIRouter()
-tutor = SocraticTutor()
+logger = get_logger("api.chat")
+# Built on first use (the app lifespan does it before serving), not at
+# import, so importing the app - and serve.py's preloading parent - never
+# opens caches or session databases
+_tutor: Optional[SocraticTutor] = None
+_sessions: Optional[SessionStore] = None
+_init_lock = threading.Lock()
+
+
+def get_tutor() -> SocraticTutor:
+    """FastAPI dependency returning the shared tutor."""
+    global _tutor
+    if _tutor is None:
+        with _init_lock:
+            if _tutor is None:
+                _tutor = SocraticTutor()
+    return _tutor
+
+
+def get_sessions() -> SessionStore:
+    """FastAPI dependency returning the shared session store."""
+    global _sessions
+    if _sessions is None:
+        with _init_lock:
+            if _sessions is None:
+                _sessions = session_store_from_env()
+    return _sessions
 
 
 class ChatMessage(BaseModel):
@@ -20,7 +59,7 @@ class ChatRequest(BaseModel):
     chatHistory: List[ChatMessage]
     algorithm: str
     learnerMastery: Dict[str, float]
-    currentArray: List[int] = []
+    currentArray: List[int] = Field(default=[], max_length=MAX_LESSON_ARRAY)
 
 
 class ChatResponse(BaseModel):
@@ -29,48 +68,328 @@ class ChatResponse(BaseModel):
     learnerMasteryUpdate: Dict[str, float]
     visualizerStateUpdate: Dict[str, Any]
     xpAwarded: int
+    # XP badges this turn earned, when the backend persists progress
+    newBadges: List[str] = []
+
+
+class SessionCreateRequest(BaseModel):
+    algorithm: str
+    learnerMastery: Dict[str, float] = {}
+    currentArray: List[int] = Field(default=[], max_length=MAX_LESSON_ARRAY)
+    userId: Optional[str] = None
+    chatHistory: List[ChatMessage] = []
+
+
+class SessionMessageRequest(BaseModel):
+    message: str
+    # Only needed when the client changed the array outside the chat
+    currentArray: Optional[List[int]] = Field(default=None, max_length=MAX_LESSON_ARRAY)
+
+
+class SessionState(BaseModel):
+    sessionId: str
+    algorithm: str
+    learnerMastery: Dict[str, float]
+    currentArray: Optional[List[int]]
+    chatHistory: List[ChatMessage]
+    turns: int
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def process_chat(request: ChatRequest):
+async def process_chat(
+    request: ChatRequest,
+    http_request: Request,
+    http_response: Response,
+    tutor: SocraticTutor = Depends(get_tutor),
+    admission: AdmissionController = Depends(get_admission),
+):
     """
     Process a chat message and return Socratic guidance.
     """
-    import sys
-    sys.stdout.flush()
-    sys.stderr.flush()
-    
-    print(f"\n🚀 CHAT ENDPOINT HIT! 🚀", flush=True)
-    print(f"Algorithm: {request.algorithm}", flush=True)
-    print(f"Chat history length: {len(request.chatHistory)}", flush=True)
+    log_fields(
+        logger, logging.INFO, "chat request",
+        algorithm=request.algorithm, historyLength=len(request.chatHistory),
+    )
+    cost = tutor.estimate_prompt_tokens(request.algorithm, request.learnerMastery)
+    await admission.admit("chat", admission.client_key(http_request), cost)
     
     try:
-        print(f"\n=== PROCESSING CHAT REQUEST ===", flush=True)
-        
         # Convert Pydantic models to dicts
         chat_history = [
             {"role": msg.role, "content": msg.content}
             for msg in request.chatHistory
         ]
         
-        print(f"Chat history converted: {chat_history}")
-        print(f"Current array: {request.currentArray}")
+        debug_payload(
+            logger, "chat payload",
+            chatHistory=chat_history, currentArray=request.currentArray,
+        )
         
         # Generate response using the tutor
-        response = tutor.generate_response(
+        response = await tutor.generate_response_async(
             algorithm=request.algorithm,
             chat_history=chat_history,
             learner_mastery=request.learnerMastery,
             current_array=request.currentArray if request.currentArray else None,
+            refund=lambda: admission.refund("chat", cost),
         )
         
-        print(f"Response generated: {response}")
-        
-        return ChatResponse(**response)
+        with stage_timer("chat", "response_validation"):
+            validated = ChatResponse(**response)
+        badges = await _record_progress(admission.user_id(http_request), response)
+        if badges is not None:
+            # The Next.js route skips its own profile write when it sees this
+            http_response.headers["X-Progress-Persisted"] = "true"
+            validated.newBadges = badges
+        return validated
         
     except Exception as e:
-        print(f"Error in chat endpoint: {e}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("chat endpoint failed")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+
+@router.post("/chat/stream")
+async def stream_chat(
+    request: ChatRequest,
+    http_request: Request,
+    tutor: SocraticTutor = Depends(get_tutor),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Process a chat message and stream the Socratic question as Server-Sent Events.
+    
+    Emits `token` events ({"text": ...}) while socraticQuestion is being
+    generated, then one `final` event carrying the full ChatResponse.
+    """
+    cost = tutor.estimate_prompt_tokens(request.algorithm, request.learnerMastery)
+    await admission.admit("chat_stream", admission.client_key(http_request), cost)
+    chat_history = [
+        {"role": msg.role, "content": msg.content}
+        for msg in request.chatHistory
+    ]
+    
+    async def events():
+        async for event, data in tutor.stream_response_async(
+            algorithm=request.algorithm,
+            chat_history=chat_history,
+            learner_mastery=request.learnerMastery,
+            current_array=request.currentArray if request.currentArray else None,
+            refund=lambda: admission.refund("chat_stream", cost),
+        ):
+            if event == "token":
+                payload = {"text": data}
+            else:
+                with stage_timer("chat", "response_validation"):
+                    payload = ChatResponse(**data).model_dump()
+                badges = await _record_progress(admission.user_id(http_request), payload)
+                if badges is not None:
+                    payload["newBadges"] = badges
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/chat/cache")
+async def cache_stats(tutor: SocraticTutor = Depends(get_tutor)):
+    """
+    Hit/miss counters for the tutor response cache.
+    """
+    if tutor.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **tutor.cache.stats()}
+
+
+@router.get("/chat/single-flight")
+async def single_flight_stats(tutor: SocraticTutor = Depends(get_tutor)):
+    """
+    How many LLM-bound turns shared an identical in-flight call.
+    """
+    return tutor.flights.stats()
+
+
+async def _admit_turn(
+    admission: AdmissionController,
+    http_request: Request,
+    route: str,
+    tutor: SocraticTutor,
+    session: ChatSession,
+) -> Callable[[], None]:
+    """
+    Admission for a session turn, keyed on the session's user when it has one.
+
+    Returns the refund for the tutor to call if the turn doesn't need the LLM.
+    """
+    cost = tutor.estimate_prompt_tokens(session.algorithm, session.learner_mastery)
+    await admission.admit(route, admission.client_key(http_request, session.user_id), cost)
+    return lambda: admission.refund(route, cost)
+
+
+def _session_or_404(store: SessionStore, session_id: str) -> ChatSession:
+    session = store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session
+
+
+def _turn_args(session: ChatSession, request: SessionMessageRequest) -> Dict[str, Any]:
+    """Tutor arguments for a session turn: stored history plus the new message."""
+    if request.currentArray is not None:
+        session.current_array = list(request.currentArray) or None
+    return {
+        "algorithm": session.algorithm,
+        "chat_history": list(session.history) + [{"role": "user", "content": request.message}],
+        "learner_mastery": session.learner_mastery,
+        "current_array": session.current_array,
+        "summary": session.summary,
+    }
+
+
+async def _record_progress(user_id: Optional[str], response: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Feed a turn's XP to the leaderboard and queue XP and mastery for the
+    write-behind writer. Returns the XP badges the turn earned, or None
+    when the backend doesn't persist progress.
+    """
+    if not user_id:
+        return None
+    xp = response.get("xpAwarded") or 0
+    leaderboard, writer = get_leaderboard(), get_progress_writer()
+
+    def record() -> Optional[List[str]]:
+        leaderboard.award(user_id, xp)
+        if writer is None:
+            return None
+        return writer.record(user_id, xp, response.get("learnerMasteryUpdate") or {})
+
+    # The first award for a learner reads their row, and the progress log
+    # append (and fsync, if configured) blocks: both stay off the event loop
+    return await asyncio.to_thread(record)
+
+
+async def _finish_turn(
+    store: SessionStore, session: ChatSession, message: str, response: Dict[str, Any]
+) -> Optional[List[str]]:
+    appended = session.record_turn(message, response)
+    badges = await _record_progress(session.user_id, response)
+    if store.messages is not None and session.user_id:
+        await asyncio.to_thread(store.persist, session, appended)
+    return badges
+
+
+@router.post("/chat/sessions", response_model=SessionState)
+async def create_session(
+    request: SessionCreateRequest,
+    http_request: Request,
+    store: SessionStore = Depends(get_sessions),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Start a chat session; later turns only send the new message.
+    
+    History is seeded from chatHistory or, for a userId with persistence
+    enabled, from the user's stored messages for the algorithm. userId (the
+    Prisma user id) is only accepted from a trusted proxy, like X-User-ID.
+    """
+    session = store.create(
+        algorithm=request.algorithm,
+        learner_mastery=request.learnerMastery,
+        current_array=request.currentArray,
+        user_id=request.userId if admission.trusted(http_request) else None,
+        chat_history=[{"role": m.role, "content": m.content} for m in request.chatHistory],
+    )
+    log_fields(logger, logging.INFO, "session created", algorithm=request.algorithm)
+    return session.snapshot()
+
+
+@router.get("/chat/sessions/{session_id}", response_model=SessionState)
+async def get_session(session_id: str, store: SessionStore = Depends(get_sessions)):
+    """
+    Current state of a session (recent history, mastery, array).
+    """
+    return _session_or_404(store, session_id).snapshot()
+
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_session(session_id: str, store: SessionStore = Depends(get_sessions)):
+    """
+    End a session.
+    """
+    if not store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"deleted": True}
+
+
+@router.post("/chat/sessions/{session_id}/messages", response_model=ChatResponse)
+async def session_message(
+    session_id: str,
+    request: SessionMessageRequest,
+    http_request: Request,
+    tutor: SocraticTutor = Depends(get_tutor),
+    store: SessionStore = Depends(get_sessions),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Process one message in a session and return Socratic guidance.
+    """
+    session = _session_or_404(store, session_id)
+    refund = await _admit_turn(admission, http_request, "chat", tutor, session)
+    async with session.lock:
+        try:
+            response = await tutor.generate_response_async(
+                **_turn_args(session, request), refund=refund
+            )
+            with stage_timer("chat", "response_validation"):
+                validated = ChatResponse(**response)
+        except Exception as e:
+            logger.exception("session chat failed")
+            raise HTTPException(status_code=500, detail=str(e))
+        validated.newBadges = await _finish_turn(store, session, request.message, response) or []
+    return validated
+
+
+@router.post("/chat/sessions/{session_id}/stream")
+async def stream_session_message(
+    session_id: str,
+    request: SessionMessageRequest,
+    http_request: Request,
+    tutor: SocraticTutor = Depends(get_tutor),
+    store: SessionStore = Depends(get_sessions),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Streaming variant of the session message endpoint (same events as /chat/stream).
+    """
+    session = _session_or_404(store, session_id)
+    refund = await _admit_turn(admission, http_request, "chat_stream", tutor, session)
+    
+    async def events():
+        async with session.lock:
+            async for event, data in tutor.stream_response_async(
+                **_turn_args(session, request), refund=refund
+            ):
+                if event == "token":
+                    payload = {"text": data}
+                else:
+                    with stage_timer("chat", "response_validation"):
+                        payload = ChatResponse(**data).model_dump()
+                    payload["newBadges"] = await _finish_turn(store, session, request.message, data) or []
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/chat/sessions")
+async def session_stats(store: SessionStore = Depends(get_sessions)):
+    """
+    Session store counters.
+    """
+    return store.stats()
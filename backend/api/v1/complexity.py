@@ -0,0 +1,56 @@
+"""
+Complexity lab API endpoint for Stage 5 (Mastery)
+"""
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, Field
+
+from core.admission import AdmissionController, get_admission
+from core.complexity import DISTRIBUTIONS, ComplexityLab, get_complexity_lab
+from core.sort_engine import SORTING_ALGORITHMS
+
+router = APIRouter()
+
+
+class ComplexityRequest(BaseModel):
+    algorithms: List[str] = list(SORTING_ALGORITHMS)
+    sizes: List[int] = [250, 500, 1000, 2000]
+    distributions: List[str] = list(DISTRIBUTIONS)
+    trials: int = Field(default=1, ge=1, le=10)
+    seed: int = 0
+
+
+@router.post("/complexity")
+async def run_complexity_lab(
+    request: ComplexityRequest,
+    http_request: Request,
+    lab: ComplexityLab = Depends(get_complexity_lab),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Count comparisons and swaps over input sizes and distributions and fit
+    a growth model to each curve (see core/complexity.py).
+
+    Identical configurations are served from cache.
+    """
+    try:
+        lab.validate(request.algorithms, request.sizes, request.distributions, request.trials)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    # Per-learner rate limit only; the lab doesn't spend LLM tokens
+    await admission.admit("complexity", admission.client_key(http_request), 0)
+    return await lab.run(
+        request.algorithms, request.sizes, request.distributions, request.trials, request.seed
+    )
+
+
+@router.get("/complexity/stats")
+async def complexity_lab_stats(lab: ComplexityLab = Depends(get_complexity_lab)):
+    """
+    Pool size, queued runs and cache counters of the complexity lab.
+    """
+    return lab.stats()
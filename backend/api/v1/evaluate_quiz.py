@@ -1,14 +1,29 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict
-import google.generativeai as genai
+from typing import Any, List, Dict, Literal
+import asyncio
 import json
+import logging
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from core.admission import AdmissionController, get_admission
+from core.llm_client import ModelClient, classify_error, get_model_client
+from core.llm_json import parse_llm_json
+from core.llm_schemas import QuizFeedbackOutput
+from core.log import get_logger, log_fields
+from core.metrics import record_fallback, stage_timer
+from core.prompts import estimate_tokens
+from core.quiz_feedback import (
+    DEFAULT_FEEDBACK,
+    feedback_jobs,
+    feedback_signature,
+    score_quiz,
+    template_feedback,
+)
 
 router = APIRouter()
+logger = get_logger("api.quiz")
 
 class QuizQuestion(BaseModel):
     question: str
@@ -20,49 +35,24 @@ class QuizQuestion(BaseModel):
 class QuizEvaluationRequest(BaseModel):
     questions: List[QuizQuestion]
 
-@router.post("/evaluate-quiz")
-async def evaluate_quiz(request: QuizEvaluationRequest):
-    """
-    Evaluate user's quiz answers using Gemini AI
-    """
-    try:
-        print(f"📥 Received quiz evaluation request with {len(request.questions)} questions", flush=True)
-        
-        # Initialize Gemini
-        api_key = os.getenv("GOOGLE_AI_API_KEY")
-        if not api_key:
-            print("❌ API key not configured!", flush=True)
-            raise HTTPException(status_code=500, detail="API key not configured")
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        print("✅ Gemini model initialized", flush=True)
-        
-        # Calculate score from MCQ answers
-        correct_count = sum(1 for q in request.questions if q.isCorrect)
-        total_questions = len(request.questions)
-        
-        # Determine skill level based on score
-        if correct_count <= 3:
-            skill_level = "basic"
-        elif correct_count <= 6:
-            skill_level = "intermediate"
-        else:
-            skill_level = "advanced"
-        
-        # Prepare evaluation prompt for feedback
-        questions_text = "\n\n".join([
-            f"Question {i+1} ({q.category}): {q.question}\n"
-            f"User's Answer: {q.answer}\n"
-            f"Correct Answer: {q.correctAnswer}\n"
-            f"Result: {'✓ Correct' if q.isCorrect else '✗ Incorrect'}"
-            for i, q in enumerate(request.questions)
-        ])
-        
-        prompt = f"""You are an expert computer science educator. A student just completed a sorting algorithms quiz.
+class QuizBatchRequest(BaseModel):
+    quizzes: List[QuizEvaluationRequest]
+
+
+def _feedback_prompt(questions: List[QuizQuestion], correct_count: int, skill_level: str) -> str:
+    """Prompt asking Gemini for 2-3 sentences of feedback on a scored quiz."""
+    questions_text = "\n\n".join([
+        f"Question {i+1} ({q.category}): {q.question}\n"
+        f"User's Answer: {q.answer}\n"
+        f"Correct Answer: {q.correctAnswer}\n"
+        f"Result: {'✓ Correct' if q.isCorrect else '✗ Incorrect'}"
+        for i, q in enumerate(questions)
+    ])
+    
+    return f"""You are an expert computer science educator. A student just completed a sorting algorithms quiz.
 
 Quiz Results:
-- Score: {correct_count}/{total_questions} correct
+- Score: {correct_count}/{len(questions)} correct
 - Skill Level: {skill_level}
 
 {questions_text}
@@ -77,55 +67,214 @@ Respond ONLY with valid JSON in this exact format:
   "questionScores": [<array of 0 or 1 for each question>]
 }}"""
 
-        print("🚀 Calling Gemini for feedback...", flush=True)
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        print(f"✅ Gemini feedback received", flush=True)
-        
-        # Clean and parse JSON
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        try:
-            gemini_response = json.loads(response_text)
-            feedback = gemini_response.get("feedback", "Great effort! Keep practicing to improve your understanding.")
-        except json.JSONDecodeError:
-            # If JSON parsing fails, use the raw text as feedback
-            feedback = response_text if len(response_text) < 500 else "Great effort! Keep practicing to improve your understanding."
+
+async def _llm_feedback(client: ModelClient, prompt: str) -> str:
+    """Ask Gemini for feedback text; the model's own score is ignored."""
+    with stage_timer("quiz", "llm_call"):
+        response = await client.generate_async(prompt)
+    response_text = response.text.strip()
+    
+    try:
+        with stage_timer("quiz", "json_parse"):
+            parsed, _ = parse_llm_json(response_text, QuizFeedbackOutput, "quiz")
+        return parsed.feedback
+    except json.JSONDecodeError:
+        # If JSON parsing fails, use the raw text as feedback
+        record_fallback("quiz", "json_decode")
+        return response_text if len(response_text) < 500 else DEFAULT_FEEDBACK
+
+
+@router.post("/evaluate-quiz")
+async def evaluate_quiz(
+    request: QuizEvaluationRequest,
+    http_request: Request,
+    mode: Literal["full", "fast"] = Query("full"),
+    enrich: bool = Query(False),
+    client: ModelClient = Depends(get_model_client),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Evaluate user's quiz answers using Gemini AI
+    
+    mode=full waits for Gemini to write the feedback (cached per score and
+    missed-category signature). mode=fast answers immediately with template
+    feedback; with enrich=true it also starts LLM feedback in the background
+    and returns a feedbackJobId to poll.
+    """
+    # Template-only evaluations never reach the LLM, so only the rate limit applies
+    uses_llm = mode == "full" or enrich
+    await admission.admit(
+        "quiz",
+        admission.client_key(http_request),
+        estimate_tokens(_feedback_prompt(request.questions, 0, "")) if uses_llm else 0,
+    )
+    try:
+        # Scoring is deterministic; only the feedback text involves the LLM
+        with stage_timer("quiz", "scoring"):
+            scored = score_quiz(request.questions)
+        correct_count = scored["score"]
+        skill_level = scored["skillLevel"]
+        missed = scored["missedCategories"]
+        signature = feedback_signature(correct_count, scored["totalQuestions"], missed)
         
-        # Return evaluation with actual score
         evaluation = {
             "score": correct_count,
-            "totalQuestions": total_questions,
+            "totalQuestions": scored["totalQuestions"],
             "skillLevel": skill_level,
-            "feedback": feedback,
-            "questionScores": [1 if q.isCorrect else 0 for q in request.questions]
+            "feedback": feedback_jobs.cached(signature),
+            "questionScores": scored["questionScores"],
         }
         
-        print(f"📊 Evaluation complete: {skill_level} level, score: {correct_count}/{total_questions}", flush=True)
+        if mode == "fast":
+            if evaluation["feedback"] is None:
+                evaluation["feedback"] = template_feedback(skill_level, missed)
+                if enrich and client.configured:
+                    prompt = _feedback_prompt(request.questions, correct_count, skill_level)
+                    evaluation["feedbackJobId"] = feedback_jobs.submit(
+                        signature, lambda: _llm_feedback(client, prompt)
+                    )
+            return evaluation
+        
+        if evaluation["feedback"] is None:
+            # Shared client, configured once at startup
+            if not client.configured:
+                logger.error("api key not configured")
+                raise HTTPException(status_code=500, detail="API key not configured")
+            
+            prompt = _feedback_prompt(request.questions, correct_count, skill_level)
+            try:
+                evaluation["feedback"] = await _llm_feedback(client, prompt)
+                feedback_jobs.remember(signature, evaluation["feedback"])
+            except Exception as e:
+                # The score is already final; don't fail it over feedback text
+                kind = classify_error(e)
+                record_fallback("quiz", kind)
+                log_fields(logger, logging.WARNING, "llm feedback failed, using template", kind=kind)
+                evaluation["feedback"] = template_feedback(skill_level, missed)
+        
+        log_fields(
+            logger, logging.INFO, "quiz evaluated",
+            mode=mode, skillLevel=skill_level,
+            score=correct_count, totalQuestions=scored["totalQuestions"],
+        )
         
         return evaluation
         
-    except json.JSONDecodeError as e:
-        print(f"JSON Parse Error: {e}", flush=True)
-        print(f"Response text: {response_text}", flush=True)
-        # Return default evaluation
-        return {
-            "score": 2,
-            "skillLevel": "basic",
-            "feedback": "We had trouble evaluating your responses. You've been assigned a basic level to start. You can unlock more features by mastering algorithms!",
-            "questionScores": [0] * len(request.questions)
-        }
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"🚨 Evaluation error: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        logger.exception("quiz evaluation failed")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/evaluate-quiz/feedback/{job_id}")
+async def get_quiz_feedback(job_id: str) -> Dict:
+    """
+    Poll an LLM feedback job started with mode=fast&enrich=true.
+    """
+    job = feedback_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown feedback job")
+    return {"jobId": job_id, "status": job["status"], "feedback": job["feedback"]}
+
+
+@router.post("/evaluate-quiz/batch")
+async def evaluate_quiz_batch(
+    request: QuizBatchRequest,
+    http_request: Request,
+    mode: Literal["full", "fast"] = Query("full"),
+    concurrency: int = Query(int(os.getenv("BATCH_LLM_CONCURRENCY", 4)), ge=1, le=32),
+    client: ModelClient = Depends(get_model_client),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Evaluate a whole class of quizzes in one call, streamed back as NDJSON.
+    
+    Every quiz is scored up front. Quizzes that share a feedback signature
+    (score + missed categories) share a single Gemini call, and at most
+    `concurrency` calls run at once. Each line is one evaluation with its
+    `index` in the request, emitted as soon as its feedback is ready; the
+    last line is a summary.
+    
+    The batch is admitted once, before streaming starts, with the prompt
+    tokens of every call it will make.
+    """
+    groups: Dict[str, List[int]] = {}
+    scored_quizzes = []
+    for index, quiz in enumerate(request.quizzes):
+        scored = score_quiz(quiz.questions)
+        signature = feedback_signature(
+            scored["score"], scored["totalQuestions"], scored["missedCategories"]
+        )
+        scored_quizzes.append(scored)
+        groups.setdefault(signature, []).append(index)
+    
+    def lines_for(indices: List[int], feedback: str) -> str:
+        out = []
+        for index in indices:
+            scored = scored_quizzes[index]
+            out.append(json.dumps({
+                "index": index,
+                "score": scored["score"],
+                "totalQuestions": scored["totalQuestions"],
+                "skillLevel": scored["skillLevel"],
+                "feedback": feedback,
+                "questionScores": scored["questionScores"],
+            }) + "\n")
+        return "".join(out)
+    
+    # Feedback known up front (cached, or templates); the rest needs the LLM
+    ready: List[Any] = []
+    prompts: Dict[str, str] = {}
+    for signature, indices in groups.items():
+        feedback = feedback_jobs.cached(signature)
+        scored = scored_quizzes[indices[0]]
+        if feedback is None and (mode == "fast" or not client.configured):
+            feedback = template_feedback(scored["skillLevel"], scored["missedCategories"])
+        if feedback is not None:
+            ready.append((indices, feedback))
+        else:
+            first = request.quizzes[indices[0]]
+            prompts[signature] = _feedback_prompt(first.questions, scored["score"], scored["skillLevel"])
+    # Before the stream starts, so a refusal is still a 429
+    await admission.admit(
+        "quiz_batch",
+        admission.client_key(http_request),
+        sum(estimate_tokens(prompt) for prompt in prompts.values()),
+    )
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def group_feedback(signature: str, indices: List[int]) -> Any:
+        scored = scored_quizzes[indices[0]]
+        prompt = prompts[signature]
+        async with semaphore:
+            try:
+                feedback = await _llm_feedback(client, prompt)
+                feedback_jobs.remember(signature, feedback)
+            except Exception as e:
+                logger.warning("batch feedback failed, using template", exc_info=e)
+                record_fallback("quiz_batch", "llm_error")
+                feedback = template_feedback(scored["skillLevel"], scored["missedCategories"])
+        return indices, feedback
+    
+    async def stream():
+        for indices, feedback in ready:
+            yield lines_for(indices, feedback)
+        pending = [group_feedback(signature, groups[signature]) for signature in prompts]
+        
+        for done in asyncio.as_completed(pending):
+            indices, feedback = await done
+            yield lines_for(indices, feedback)
+        
+        log_fields(
+            logger, logging.INFO, "quiz batch evaluated",
+            quizzes=len(scored_quizzes), signatures=len(groups), llmCalls=len(pending),
+        )
+        yield json.dumps({"summary": {
+            "quizzes": len(scored_quizzes),
+            "signatures": len(groups),
+            "llmCalls": len(pending),
+        }}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
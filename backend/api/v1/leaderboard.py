@@ -0,0 +1,39 @@
+"""
+Leaderboard API endpoints backed by the in-memory rank index
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from core.leaderboard import Leaderboard, get_leaderboard
+
+router = APIRouter()
+
+
+@router.get("/leaderboard")
+async def top_learners(
+    limit: int = Query(10, ge=1, le=1000),
+    leaderboard: Leaderboard = Depends(get_leaderboard),
+):
+    """
+    The highest-XP learners with their ranks (ties share a rank).
+    """
+    return {"leaderboard": leaderboard.top(limit), "users": len(leaderboard.index)}
+
+
+@router.get("/leaderboard/users/{user_id}")
+async def learner_rank(user_id: str, leaderboard: Leaderboard = Depends(get_leaderboard)):
+    """
+    One learner's XP and rank.
+    """
+    entry = leaderboard.rank(user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Learner not on the leaderboard")
+    return entry
+
+
+@router.get("/leaderboard/stats")
+async def leaderboard_stats(leaderboard: Leaderboard = Depends(get_leaderboard)):
+    """
+    Index size and sync counters.
+    """
+    return leaderboard.stats()
@@ -0,0 +1,69 @@
+"""
+Sort trace API endpoint for visualizer playback
+"""
+
+import os
+from typing import Annotated, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+
+from core.admission import AdmissionController, get_admission
+from core.metrics import stage_timer
+from core.sort_engine import DEFAULT_ARRAY, SORTING_ALGORITHMS
+from core.trace import TraceBuilder, TraceTooLong, get_trace_builder
+
+router = APIRouter()
+
+MAX_LENGTH = int(os.getenv("TRACE_MAX_LENGTH", 20000))
+KEYFRAME_EVERY = int(os.getenv("TRACE_KEYFRAME_EVERY", 256))
+
+
+# Traces are stored as 64-bit integers
+Int64 = Annotated[int, Field(ge=-(2 ** 63), lt=2 ** 63)]
+
+
+class TraceRequest(BaseModel):
+    algorithm: str
+    array: List[Int64] = DEFAULT_ARRAY
+    keyframeEvery: Optional[int] = None
+
+
+@router.post("/trace")
+async def sort_trace(
+    request: TraceRequest,
+    http_request: Request,
+    traces: TraceBuilder = Depends(get_trace_builder),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Every step of an algorithm on an array, delta-encoded (see core/trace.py).
+
+    Traces are cached per (algorithm, array, keyframe spacing), so replaying
+    or scrubbing the same lesson is served from memory; so are refusals.
+    """
+    if request.algorithm not in SORTING_ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"Unknown algorithm: {request.algorithm}")
+    if len(request.array) > MAX_LENGTH:
+        raise HTTPException(status_code=413, detail=f"Array longer than {MAX_LENGTH} elements")
+    keyframe_every = request.keyframeEvery or KEYFRAME_EVERY
+    if keyframe_every < 1:
+        raise HTTPException(status_code=400, detail="keyframeEvery must be positive")
+
+    # Per-learner rate limit only; traces don't spend LLM tokens
+    await admission.admit("trace", admission.client_key(http_request), 0)
+    try:
+        with stage_timer("trace", "build"):
+            body = await traces.get(request.algorithm, request.array, keyframe_every)
+    except TraceTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/trace/cache")
+async def trace_cache_stats(traces: TraceBuilder = Depends(get_trace_builder)):
+    """
+    Size and hit/miss counters of the trace cache, plus pool and refusal counters.
+    """
+    return traces.stats()
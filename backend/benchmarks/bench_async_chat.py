@@ -0,0 +1,142 @@
+"""
+Load benchmark for /api/v1/chat against a stubbed local model.
+
+Fires a burst of concurrent chat requests while polling /health and
+compares the old blocking call path with generate_response_async.
+
+Usage (from backend/):
+    python benchmarks/bench_async_chat.py --requests 20 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep per-request log lines out of the report
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+
+from main import app
+from api.v1 import chat
+from core.llm_client import ModelClient
+from core.tutor import SocraticTutor
+
+
+STUB_RESPONSE = json.dumps({
+    "socraticQuestion": "Which two numbers does Bubble Sort compare first?",
+    "analysisOfUserAnswer": "continuing",
+    "learnerMasteryUpdate": {"bubbleSort": 0.1},
+    "visualizerStateUpdate": {"focusIndices": [0, 1], "state": "comparing"},
+    "xpAwarded": 0,
+})
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    """Blocking stand-in for genai.GenerativeModel with a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        if not stream:
+            time.sleep(self.latency)
+            return StubResponse(STUB_RESPONSE)
+        return self._stream()
+
+    def _stream(self):
+        # Spread the latency over ~20 chunks like a real token stream
+        size = max(1, len(STUB_RESPONSE) // 20)
+        for i in range(0, len(STUB_RESPONSE), size):
+            time.sleep(self.latency / 20)
+            yield StubResponse(STUB_RESPONSE[i:i + size])
+
+
+CHAT_PAYLOAD = {
+    "chatHistory": [{"role": "user", "content": "hi"}],
+    "algorithm": "bubbleSort",
+    "learnerMastery": {"bubbleSort": 0.0},
+    "currentArray": [70, 30, 90, 10, 50, 80, 20, 60, 100, 40],
+}
+
+
+async def run_burst(num_requests: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        health_latencies = []
+        done = asyncio.Event()
+
+        async def probe_health():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        async def one_chat():
+            start = time.perf_counter()
+            response = await client.post("/api/v1/chat", json=CHAT_PAYLOAD)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        prober = asyncio.create_task(probe_health())
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one_chat() for _ in range(num_requests)))
+        wall = time.perf_counter() - start
+        done.set()
+        await prober
+
+    latencies.sort()
+    return {
+        "requests": num_requests,
+        "wall_seconds": round(wall, 3),
+        "chat_p50": round(latencies[len(latencies) // 2], 3),
+        "chat_max": round(latencies[-1], 3),
+        "health_probes": len(health_latencies),
+        "health_max": round(max(health_latencies), 3) if health_latencies else None,
+    }
+
+
+async def main(num_requests: int, latency: float, concurrency: int):
+    client = ModelClient(max_concurrency=concurrency, model=StubModel(latency))
+    tutor = SocraticTutor(client=client)
+    app.dependency_overrides[chat.get_tutor] = lambda: tutor
+
+    async def blocking_path(**kwargs):
+        # What process_chat did before: a sync LLM call inside the handler
+        return tutor.generate_response(**kwargs)
+
+    async_path = tutor.generate_response_async
+
+    tutor.generate_response_async = blocking_path
+    blocking = await run_burst(num_requests)
+    tutor.generate_response_async = async_path
+    non_blocking = await run_burst(num_requests)
+
+    report = {
+        "stub_latency": latency,
+        "concurrency": concurrency,
+        "blocking": blocking,
+        "async": non_blocking,
+        "speedup": round(blocking["wall_seconds"] / non_blocking["wall_seconds"], 2),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.latency, args.concurrency))
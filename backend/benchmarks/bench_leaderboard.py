@@ -0,0 +1,140 @@
+"""
+Benchmark the leaderboard rank index at scale.
+
+Loads N learners with a long-tailed XP distribution into a scratch copy of
+the Prisma Leaderboard table, then times:
+- the initial load (first sync) and an incremental sync
+- xpAwarded updates, "my rank" lookups and top-K queries on the index
+- for comparison, what every read used to cost: sorting all totals
+
+Each result is checked against a full sort before timing starts.
+
+Usage (from backend/):
+    python benchmarks/bench_leaderboard.py [--users 1000000] [--ops 100000] [--seed 1]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.leaderboard import Leaderboard, LeaderboardTable
+
+SCHEMA = (
+    'CREATE TABLE "Leaderboard" ('
+    " id TEXT PRIMARY KEY, userId TEXT NOT NULL UNIQUE, displayName TEXT NOT NULL,"
+    " photoURL TEXT, totalXP INTEGER NOT NULL DEFAULT 0, level INTEGER NOT NULL DEFAULT 1,"
+    " rank INTEGER, updatedAt DATETIME NOT NULL)"
+)
+
+
+def make_table(path: str, users: int, rng: random.Random) -> None:
+    # Most learners have a few turns' worth of XP, a few have thousands
+    created = int(time.time() * 1000) - 60_000
+    rows = (
+        (f"id{i}", f"user{i}", f"Learner {i}", None, 5 * int(rng.paretovariate(1.5) * 4), created)
+        for i in range(users)
+    )
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.execute('CREATE INDEX "Leaderboard_totalXP_idx" ON "Leaderboard" (totalXP DESC)')
+    conn.executemany(
+        'INSERT INTO "Leaderboard" (id, userId, displayName, photoURL, totalXP, updatedAt)'
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, calls):
+    samples = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "calls": len(samples),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+        "p99_us": round(samples[int(len(samples) * 0.99) - 1] * 1e6, 2),
+    }
+
+
+def check(leaderboard: Leaderboard, rng: random.Random) -> None:
+    # Totals above LEADERBOARD_MAX_XP tie by design
+    slot = leaderboard.index._slot
+    totals = sorted((slot(xp) for xp in leaderboard.index._xp.values()), reverse=True)
+    top = leaderboard.top(100)
+    assert [slot(row["totalXP"]) for row in top] == totals[:100], "top-K order"
+    for row in top:
+        assert row["rank"] == totals.index(slot(row["totalXP"])) + 1, "top-K rank"
+    users = list(leaderboard.index._xp)
+    for user_id in rng.sample(users, 200):
+        xp = slot(leaderboard.index.get(user_id))
+        expected = 1 + sum(1 for other in totals if other > xp)
+        assert leaderboard.rank(user_id)["rank"] == expected, "rank"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--ops", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    report = {"users": args.users}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "leaderboard.db")
+        start = time.perf_counter()
+        make_table(path, args.users, rng)
+        report["table_build_s"] = round(time.perf_counter() - start, 2)
+
+        leaderboard = Leaderboard(LeaderboardTable(path))
+        start = time.perf_counter()
+        leaderboard.sync()
+        report["initial_load_s"] = round(time.perf_counter() - start, 2)
+        check(leaderboard, rng)
+
+        users = [f"user{rng.randrange(args.users)}" for _ in range(args.ops)]
+        report["award"] = timed(leaderboard.award, [(u, 5) for u in users])
+        report["rank"] = timed(leaderboard.rank, [(u,) for u in users])
+        queries = max(1, args.ops // 100)
+        report["top_10"] = timed(leaderboard.top, [(10,)] * queries)
+        report["top_100"] = timed(leaderboard.top, [(100,)] * queries)
+        check(leaderboard, rng)
+
+        # Another process (the Next.js route) moved some learners
+        conn = sqlite3.connect(path)
+        now = int(time.time() * 1000) + 1
+        moved = [(rng.randrange(5000), now, f"user{rng.randrange(args.users)}") for _ in range(10_000)]
+        conn.executemany('UPDATE "Leaderboard" SET totalXP = ?, updatedAt = ? WHERE userId = ?', moved)
+        conn.commit()
+        conn.close()
+        start = time.perf_counter()
+        pulled = leaderboard.sync()
+        report["incremental_sync"] = {
+            "rows_pulled": pulled,
+            "ranks_written": leaderboard.ranks_written,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        check(leaderboard, rng)
+
+        totals = list(leaderboard.index._xp.items())
+        start = time.perf_counter()
+        sorted(totals, key=lambda item: item[1], reverse=True)[:10]
+        report["full_sort_top_10_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
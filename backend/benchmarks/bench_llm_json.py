@@ -0,0 +1,144 @@
+"""
+Fuzz and benchmark the LLM JSON parser.
+
+Replays the recorded model outputs in data/llm_outputs.json through the old
+find/rfind + fence-stripping parser and through parse_llm_json, then fuzzes
+the new parser with truncations, wrappers and random corruptions of those
+outputs. The fuzz pass fails loudly if the parser raises anything other than
+LLMJSONError or returns a value that doesn't validate.
+
+Usage (from backend/):
+    python benchmarks/bench_llm_json.py [--fuzz 20000] [--seed 1]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.llm_json import LLMJSONError, parse_llm_json
+from core.llm_schemas import QuizFeedbackOutput, TutorOutput
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "llm_outputs.json")
+SCHEMAS = {"chat": TutorOutput, "quiz": QuizFeedbackOutput}
+WRAPPERS = [
+    "```json\n{}\n```",
+    "```\n{}\n```",
+    "Here you go:\n{}",
+    "{}\nHope that helps! {{not json}}",
+    "Sure {{thing}}! {}",
+]
+NOISE = ['"', "\\", "{", "}", "[", "]", ",", ":", "\n", "é", "🎉"]
+
+
+def legacy_parse(text: str) -> dict:
+    """The tutor's parser before the shared module (for comparison)."""
+    json_start = text.find('{')
+    json_end = text.rfind('}')
+    if json_start != -1 and json_end != -1:
+        text = text[json_start:json_end + 1]
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return json.loads(text.strip())
+
+
+def time_per_call(fn, items, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            try:
+                fn(item)
+            except ValueError:
+                pass
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+
+def replay(corpus):
+    rows = {}
+    for case in corpus:
+        model = SCHEMAS[case["schema"]]
+        try:
+            legacy = "ok" if isinstance(legacy_parse(case["output"]), dict) else "not an object"
+        except ValueError:
+            legacy = "failed"
+        try:
+            _, extracted = parse_llm_json(case["output"], model, "bench")
+            new = "partial" if extracted.partial else ("repaired" if extracted.repaired else "clean")
+        except LLMJSONError:
+            new = "failed"
+        rows[case["name"]] = {"legacy": legacy, "new": new}
+    return rows
+
+
+def mutate(rng: random.Random, text: str) -> str:
+    choice = rng.randrange(4)
+    if choice == 0:
+        return text[: rng.randrange(len(text) + 1)]
+    if choice == 1:
+        return rng.choice(WRAPPERS).format(text)
+    if choice == 2:
+        i = rng.randrange(len(text) + 1)
+        return text[:i] + rng.choice(NOISE) + text[i:]
+    i = rng.randrange(len(text) + 1)
+    j = min(len(text), i + rng.randrange(1, 8))
+    return text[:i] + text[j:]
+
+
+def fuzz(corpus, iterations: int, seed: int):
+    rng = random.Random(seed)
+    outcomes = {"parsed": 0, "rejected": 0}
+    for _ in range(iterations):
+        case = rng.choice(corpus)
+        text = case["output"]
+        for _ in range(rng.randrange(1, 4)):
+            text = mutate(rng, text)
+        model = SCHEMAS[case["schema"]]
+        try:
+            parsed, _ = parse_llm_json(text, model, "bench")
+        except LLMJSONError:
+            outcomes["rejected"] += 1
+            continue
+        except Exception as e:
+            raise AssertionError(f"parser raised {type(e).__name__} for {text!r}") from e
+        # Whatever comes back must satisfy the schema
+        model.model_validate(parsed.model_dump())
+        outcomes["parsed"] += 1
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fuzz", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = json.load(f)
+    chat_outputs = [c["output"] for c in corpus if c["schema"] == "chat"]
+
+    rows = replay(corpus)
+    report = {
+        "cases": rows,
+        "legacy_ok": sum(r["legacy"] == "ok" for r in rows.values()),
+        "new_ok": sum(r["new"] != "failed" for r in rows.values()),
+        "total": len(rows),
+        "legacy_us": round(time_per_call(legacy_parse, chat_outputs, args.repeat), 1),
+        "new_us": round(time_per_call(
+            lambda t: parse_llm_json(t, TutorOutput, "bench"), chat_outputs, args.repeat
+        ), 1),
+        "fuzz": fuzz(corpus, args.fuzz, args.seed),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
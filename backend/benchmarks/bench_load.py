@@ -0,0 +1,448 @@
+"""
+End-to-end load benchmark for the chat and quiz endpoints.
+
+Runs scripted multi-turn lessons (one per algorithm, mixing trivial answers
+the local classifier handles with open-ended questions for the model) and
+quiz submissions against the backend with the stub LLM provider, at each
+concurrency level in turn. For every level it reports throughput, p50/p95/p99
+latency per endpoint, event-loop lag and server memory, and writes the whole
+run to benchmarks/results/ as JSON so runs can be compared across commits.
+
+The app runs in-process (httpx ASGITransport) by default; --spawn starts
+`uvicorn main:app` as a subprocess and --url targets a server that is already
+running (start it with LLM_PROVIDER=stub for comparable numbers).
+
+Usage (from backend/):
+    python benchmarks/bench_load.py --concurrency 1,8,32 --lessons 32
+    python benchmarks/bench_load.py --spawn --latency lognormal:0.8,0.3
+    python benchmarks/bench_load.py --compare benchmarks/results/<baseline>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(BACKEND, "benchmarks", "results")
+sys.path.insert(0, BACKEND)
+
+import httpx
+
+from core.sort_engine import DEFAULT_ARRAY, SORTING_ALGORITHMS, next_move
+
+# {pair} is the pair the engine compares next, i.e. the right answer
+LESSON_SCRIPT = [
+    "Hi! Can you teach me {name}?",
+    "{pair}",
+    "yes",
+    "Why does it compare those two and not others?",
+    "{pair}",
+    "no",
+    "idk",
+    "{pair}",
+    "yes",
+    "ok",
+    "What is the time complexity of {name}, and why?",
+    "How would you make it faster on an almost sorted array?",
+]
+QUIZ_CATEGORIES = ["bubbleSort", "mergeSort", "quickSort", "heapSort", "complexity"]
+STUB_ENV = {"LLM_PROVIDER": "stub", "LOG_LEVEL": "WARNING"}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of `values` (q in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    ms = [s * 1000 for s in samples]
+    return {
+        "count": len(ms),
+        "p50Ms": _round(percentile(ms, 50)),
+        "p95Ms": _round(percentile(ms, 95)),
+        "p99Ms": _round(percentile(ms, 99)),
+        "maxMs": _round(max(ms) if ms else None),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
+
+
+def _display(algorithm: str) -> str:
+    return algorithm.replace("Sort", " Sort").title()
+
+
+def learner_message(template: str, algorithm: str, array: List[int]) -> str:
+    move = next_move(algorithm, array)
+    if move["state"] != "sorted" and move["comparisons"]:
+        i, j = move["comparisons"][0]
+        pair = f"{array[i]} and {array[j]}"
+    else:
+        pair = "none, it's sorted"
+    return template.format(name=_display(algorithm), pair=pair)
+
+
+def quiz_payload(rng: random.Random) -> Dict[str, Any]:
+    questions = []
+    for n in range(5):
+        correct = rng.random() < 0.6
+        questions.append({
+            "question": f"Question {n + 1}",
+            "answer": "O(n log n)" if correct else "O(n)",
+            "correctAnswer": "O(n log n)",
+            "isCorrect": correct,
+            "category": rng.choice(QUIZ_CATEGORIES),
+        })
+    return {"questions": questions}
+
+
+class Recorder:
+    """Latencies and errors per endpoint for one concurrency level."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def post(self, client: httpx.AsyncClient, endpoint: str, url: str, **kwargs) -> Optional[Dict]:
+        start = time.perf_counter()
+        try:
+            response = await client.post(url, **kwargs)
+            response.raise_for_status()
+            body = response.json()
+        except (httpx.HTTPError, ValueError):
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        return body
+
+
+async def run_lesson(client: httpx.AsyncClient, recorder: Recorder, algorithm: str, learner: str) -> None:
+    """One learner working through LESSON_SCRIPT with the stateless chat API."""
+    headers = {"X-User-ID": learner}
+    history: List[Dict[str, str]] = []
+    mastery = {algorithm: 0.0}
+    array = list(DEFAULT_ARRAY)
+    for template in LESSON_SCRIPT:
+        message = learner_message(template, algorithm, array)
+        history.append({"role": "user", "content": message})
+        body = await recorder.post(client, "chat", "/api/v1/chat", json={
+            "chatHistory": history,
+            "algorithm": algorithm,
+            "learnerMastery": mastery,
+            "currentArray": array,
+        }, headers=headers)
+        if body is None:
+            history.pop()
+            continue
+        history.append({"role": "ai", "content": body["socraticQuestion"]})
+        mastery.update(body["learnerMasteryUpdate"])
+        array = list(body["visualizerStateUpdate"].get("data") or array)
+
+
+async def run_quiz(client: httpx.AsyncClient, recorder: Recorder, rng: random.Random, mode: str, learner: str) -> None:
+    await recorder.post(
+        client, "evaluate-quiz", "/api/v1/evaluate-quiz",
+        params={"mode": mode}, json=quiz_payload(rng), headers={"X-User-ID": learner},
+    )
+
+
+async def probe_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.02) -> None:
+    """Fine-grained lag probe for in-process runs, where client and app share the loop."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+async def scrape_lag(client: httpx.AsyncClient) -> Dict[str, float]:
+    """Bucket counts of the server's event-loop lag histogram from /metrics."""
+    response = await client.get("/metrics")
+    buckets = {}
+    for line in response.text.splitlines():
+        if line.startswith("sortcrates_event_loop_lag_seconds_bucket"):
+            le = line.split('le="', 1)[1].split('"', 1)[0]
+            buckets[le] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("sortcrates_event_loop_lag_seconds_sum"):
+            buckets["sum"] = float(line.rsplit(" ", 1)[1])
+    return buckets
+
+
+def lag_from_buckets(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, Any]:
+    """Mean and bucketed p99 of the lag samples taken between two scrapes."""
+    delta = {k: after.get(k, 0.0) - before.get(k, 0.0) for k in after}
+    count = delta.pop("+Inf", 0.0)
+    total = delta.pop("sum", 0.0)
+    if not count:
+        return {"source": "server", "samples": 0, "meanMs": None, "p99Ms": None}
+    p99 = None
+    for le, n in sorted(delta.items(), key=lambda kv: float(kv[0])):
+        if n >= 0.99 * count:
+            p99 = float(le) * 1000
+            break
+    return {
+        "source": "server",
+        "samples": int(count),
+        "meanMs": _round(total / count * 1000),
+        # Histogram upper bound, so this is "at most"
+        "p99Ms": _round(p99),
+    }
+
+
+def rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Resident set size of a process from /proc (None where unavailable)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    concurrency: int,
+    lessons: int,
+    quizzes: int,
+    quiz_mode: str,
+    seed: int,
+    server_pid: Optional[int],
+    in_process: bool,
+) -> Dict[str, Any]:
+    recorder = Recorder()
+    rng = random.Random(seed)
+    algorithms = list(SORTING_ALGORITHMS)
+    jobs = [("lesson", algorithms[i % len(algorithms)], f"learner-{i}") for i in range(lessons)]
+    jobs += [("quiz", None, f"quiz-{i}") for i in range(quizzes)]
+    rng.shuffle(jobs)
+    queue: "asyncio.Queue" = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while not queue.empty():
+            kind, algorithm, learner = queue.get_nowait()
+            if kind == "lesson":
+                await run_lesson(client, recorder, algorithm, learner)
+            else:
+                await run_quiz(client, recorder, rng, quiz_mode, learner)
+
+    lag_before = await scrape_lag(client)
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_lag(lag_samples, stop)) if in_process else None
+    rss_before = rss_mb(server_pid)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    if probe is not None:
+        await probe
+    lag = lag_from_buckets(lag_before, await scrape_lag(client))
+    if in_process:
+        lag = {
+            "source": "probe",
+            "samples": len(lag_samples),
+            "meanMs": _round(sum(lag_samples) / len(lag_samples) * 1000 if lag_samples else None),
+            "p99Ms": _round(percentile([s * 1000 for s in lag_samples], 99)),
+        }
+
+    total = sum(len(v) for v in recorder.latencies.values())
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": recorder.errors,
+        "seconds": round(elapsed, 3),
+        "throughputRps": round(total / elapsed, 2) if elapsed else None,
+        "endpoints": {name: summarize(samples) for name, samples in recorder.latencies.items()},
+        "eventLoopLag": lag,
+        "memory": {"rssBeforeMb": rss_before, "rssAfterMb": rss_mb(server_pid)},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def spawn_server(port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND,
+        env={**os.environ, **env},
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not become healthy")
+        await asyncio.sleep(0.2)
+
+
+async def run(args: argparse.Namespace, levels: List[int]) -> Dict[str, Any]:
+    server = None
+    pid = None
+    timeout = httpx.Timeout(60.0)
+    if args.url or args.spawn:
+        base_url = args.url or f"http://127.0.0.1:{args.port}"
+        if args.spawn:
+            server = spawn_server(args.port, {**STUB_ENV, **stub_settings(args)})
+            pid = server.pid
+        else:
+            pid = args.pid
+        limits = httpx.Limits(max_connections=max(levels) * 2)
+        client = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits)
+        app_context = None
+    else:
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout)
+        app_context = app.router.lifespan_context(app)
+
+    report_levels = []
+    try:
+        if app_context is not None:
+            await app_context.__aenter__()
+        await wait_ready(client)
+        for concurrency in levels:
+            level = await run_level(
+                client, concurrency, args.lessons, args.quizzes, args.quiz_mode, args.seed, pid,
+                in_process=app_context is not None,
+            )
+            report_levels.append(level)
+            print(
+                f"c={concurrency:<4} {level['throughputRps']:>8} req/s  "
+                + "  ".join(f"{k} p95={v['p95Ms']}ms" for k, v in level["endpoints"].items()),
+                file=sys.stderr,
+            )
+    finally:
+        await client.aclose()
+        if app_context is not None:
+            await app_context.__aexit__(None, None, None)
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "target": "url" if args.url else ("uvicorn" if args.spawn else "in-process"),
+        "settings": {
+            "lessons": args.lessons,
+            "turnsPerLesson": len(LESSON_SCRIPT),
+            "quizzes": args.quizzes,
+            "quizMode": args.quiz_mode,
+            "seed": args.seed,
+            **stub_settings(args),
+        },
+        # Peak RSS of this process; includes the app for in-process runs
+        "benchPeakRssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "levels": report_levels,
+    }
+
+
+def stub_settings(args: argparse.Namespace) -> Dict[str, str]:
+    return {
+        "LLM_STUB_LATENCY": args.latency,
+        "LLM_STUB_ERROR_RATE": str(args.error_rate),
+        "LLM_STUB_SEED": str(args.seed),
+        # Scripted learners answer far faster than people; measure the
+        # server, not the per-user limits, unless asked to
+        "ADMISSION_ENABLED": "true" if args.admission else "false",
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions beyond `tolerance` (a fraction) in throughput or p95/p99 latency."""
+    problems = []
+    old_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in report["levels"]:
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        c = level["concurrency"]
+        if old["throughputRps"] and level["throughputRps"] < old["throughputRps"] * (1 - tolerance):
+            problems.append(f"c={c} throughput {old['throughputRps']} -> {level['throughputRps']} req/s")
+        for endpoint, stats in level["endpoints"].items():
+            old_stats = old["endpoints"].get(endpoint)
+            if not old_stats:
+                continue
+            for key in ("p95Ms", "p99Ms"):
+                if old_stats[key] and stats[key] > old_stats[key] * (1 + tolerance):
+                    problems.append(f"c={c} {endpoint} {key} {old_stats[key]} -> {stats[key]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    parser.add_argument("--lessons", type=int, default=24, help="scripted lessons per level")
+    parser.add_argument("--quizzes", type=int, default=12, help="quiz submissions per level")
+    parser.add_argument("--quiz-mode", choices=("full", "fast"), default="full")
+    parser.add_argument("--latency", default="lognormal:0.3,0.3", help="stub latency (see core/providers.py)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--admission", action="store_true", help="keep admission control on")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--pid", type=int, help="pid of the --url server, for memory readings")
+    parser.add_argument("--spawn", action="store_true", help="start uvicorn on --port for the run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", help="result file (default benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="baseline result file; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed regression fraction")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    if not (args.url or args.spawn):
+        # Must be set before the app (and its model client) is imported
+        os.environ.update(STUB_ENV)
+        os.environ.update(stub_settings(args))
+
+    report = asyncio.run(run(args, levels))
+
+    out = args.out or os.path.join(
+        RESULTS, f"{report['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"saved {out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
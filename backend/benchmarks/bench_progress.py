@@ -0,0 +1,120 @@
+"""
+Benchmark write-behind persistence of learner progress.
+
+Replays the same stream of tutor turns (xpAwarded plus a mastery update)
+against a scratch copy of the Prisma Profile/Leaderboard tables twice:
+- one transaction per turn, what the Next.js route does today
+- through ProgressWriter, flushing every --flush-turns turns
+
+and checks both end with the same XP totals.
+
+Usage (from backend/):
+    python benchmarks/bench_progress.py [--users 2000] [--turns 20000] [--flush-turns 500]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.progress import DeltaLog, ProfileTable, ProgressDelta, ProgressWriter
+
+SCHEMA = """
+CREATE TABLE "User" (id TEXT PRIMARY KEY, displayName TEXT, photoURL TEXT);
+CREATE TABLE "Profile" (
+    id TEXT PRIMARY KEY, userId TEXT NOT NULL UNIQUE, xp INTEGER NOT NULL DEFAULT 0,
+    level INTEGER NOT NULL DEFAULT 1, mastery TEXT NOT NULL DEFAULT '{}',
+    lastActive DATETIME NOT NULL DEFAULT 0, updatedAt DATETIME NOT NULL DEFAULT 0);
+CREATE TABLE "Leaderboard" (
+    id TEXT PRIMARY KEY, userId TEXT NOT NULL UNIQUE, displayName TEXT NOT NULL,
+    photoURL TEXT, totalXP INTEGER NOT NULL DEFAULT 0, level INTEGER NOT NULL DEFAULT 1,
+    rank INTEGER, updatedAt DATETIME NOT NULL);
+"""
+
+CONCEPTS = ["comparison", "swap", "pass", "stability", "complexity", "pivot", "merge"]
+
+
+def make_db(path: str, users: int) -> None:
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany('INSERT INTO "User" VALUES (?, ?, NULL)', [(f"user{i}", f"Learner {i}") for i in range(users)])
+    conn.executemany('INSERT INTO "Profile" (id, userId) VALUES (?, ?)', [(f"p{i}", f"user{i}") for i in range(users)])
+    conn.commit()
+    conn.close()
+
+
+def totals(path: str):
+    conn = sqlite3.connect(path)
+    rows = dict(conn.execute('SELECT userId, xp FROM "Profile"'))
+    conn.close()
+    return rows
+
+
+def per_turn(path: str, turns) -> float:
+    table = ProfileTable(path)
+    start = time.perf_counter()
+    for user_id, xp, mastery in turns:
+        delta = ProgressDelta()
+        delta.add(xp, mastery, int(time.time() * 1000))
+        table.apply({user_id: delta}, lambda record: None)
+    return time.perf_counter() - start
+
+
+def write_behind(path: str, log_dir: str, turns, flush_turns: int):
+    writer = ProgressWriter(ProfileTable(path), DeltaLog(log_dir), flush_turns=flush_turns)
+    start = time.perf_counter()
+    for user_id, xp, mastery in turns:
+        writer.record(user_id, xp, mastery)
+        if writer.stats()["pendingTurns"] >= flush_turns:
+            writer.flush()
+    writer.close()
+    return time.perf_counter() - start, writer.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20_000)
+    parser.add_argument("--flush-turns", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    # A few hundred learners active at once, each with a handful of turns
+    active = [f"user{i}" for i in rng.sample(range(args.users), min(args.users, 300))]
+    turns = [
+        (rng.choice(active), rng.choice((0, 5, 10, 15)), {rng.choice(CONCEPTS): round(rng.random(), 2)})
+        for _ in range(args.turns)
+    ]
+    report = {"users": args.users, "turns": args.turns, "flushTurns": args.flush_turns}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct, batched = os.path.join(tmp, "direct.db"), os.path.join(tmp, "batched.db")
+        make_db(direct, args.users)
+        make_db(batched, args.users)
+
+        seconds = per_turn(direct, turns)
+        report["per_turn"] = {
+            "seconds": round(seconds, 3),
+            "turns_per_s": round(args.turns / seconds),
+            "transactions_per_turn": 1.0,
+        }
+        seconds, stats = write_behind(batched, os.path.join(tmp, "log"), turns, args.flush_turns)
+        report["write_behind"] = {
+            "seconds": round(seconds, 3),
+            "turns_per_s": round(args.turns / seconds),
+            "transactions_per_turn": stats["transactionsPerTurn"],
+            "rows_written": stats["rowsWritten"],
+        }
+        assert totals(direct) == totals(batched), "XP totals differ"
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Micro-benchmark for the server-side sorting step engine.
+
+Times next_move() at every distinct array state of each algorithm's
+lesson path, i.e. the work the tutor does once per chat turn, and checks
+that every move's array is a permutation of the array it starts from (no
+half-finished shift or merge, which would lose a value).
+
+Usage (from backend/):
+    python benchmarks/bench_sort_engine.py
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.sort_engine import DEFAULT_ARRAY, SORTING_ALGORITHMS, iter_steps, next_move
+
+
+def main():
+    report = {}
+    values = sorted(DEFAULT_ARRAY)
+    for algorithm in SORTING_ALGORITHMS:
+        # States a lesson can be in: the engine's halfway writes are skipped
+        states = []
+        for step in iter_steps(algorithm, DEFAULT_ARRAY):
+            if sorted(step["data"]) == values and (not states or step["data"] != states[-1]):
+                states.append(step["data"])
+
+        start = time.perf_counter()
+        moves = [next_move(algorithm, state) for state in states]
+        elapsed = time.perf_counter() - start
+
+        report[algorithm] = {
+            "states": len(states),
+            "mean_us": round(elapsed / len(states) * 1e6, 1),
+        }
+        for state, move in zip(states, moves):
+            assert sorted(move["data"]) == sorted(state), f"{algorithm} loses values from {state}"
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark cold-start import time of the backend, with a budget.
+
+Imports the app in fresh interpreters under `python -X importtime` and
+reports, as the median over --runs:
+- the total time to `import main`
+- the part spent in this repo's own modules (main, api.*, core.*), the
+  number that changes when the code here does
+- the slowest modules by cumulative time
+
+and checks that no provider SDK (or other heavy optional package) is
+imported by the app itself: those load when the LLM client is built.
+
+Exits 1 when a budget is exceeded or a forbidden module shows up, so it can
+gate CI. Totals depend on the machine; set the budgets from a run on the
+target hardware.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms 1500] [--own-budget-ms 150]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded lazily by core.providers, or not a dependency at all any more
+FORBIDDEN = ("google.generativeai", "grpc", "groq", "langchain", "langchain_groq", "langchain_core")
+OWN = ("main", "api", "core")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) for every line of -X importtime output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def import_once(target: str) -> List[Tuple[str, int, int]]:
+    env = dict(os.environ, LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=BACKEND,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {target} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def is_own(name: str) -> bool:
+    return name.split(".", 1)[0] in OWN
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--own-budget-ms", type=float, default=150.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    totals, own, forbidden = [], [], set()
+    cumulative: Dict[str, List[int]] = {}
+    for _ in range(args.runs):
+        modules = import_once(args.target)
+        totals.append(next(c for name, _, c in modules if name == args.target))
+        own.append(sum(s for name, s, _ in modules if is_own(name)))
+        for name, _, c in modules:
+            cumulative.setdefault(name, []).append(c)
+            forbidden.update(f for f in FORBIDDEN if name == f or name.startswith(f + "."))
+
+    slowest = sorted(
+        ((name, statistics.median(samples)) for name, samples in cumulative.items() if name != args.target),
+        key=lambda item: item[1],
+        reverse=True,
+    )[: args.top]
+    report = {
+        "target": args.target,
+        "runs": args.runs,
+        "import_ms": round(statistics.median(totals) / 1000, 1),
+        "own_modules_ms": round(statistics.median(own) / 1000, 1),
+        "budget_ms": args.budget_ms,
+        "own_budget_ms": args.own_budget_ms,
+        "slowest_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "forbidden_imports": sorted(forbidden),
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if report["import_ms"] > args.budget_ms:
+        failures.append(f"import took {report['import_ms']} ms, budget {args.budget_ms} ms")
+    if report["own_modules_ms"] > args.own_budget_ms:
+        failures.append(f"own modules took {report['own_modules_ms']} ms, budget {args.own_budget_ms} ms")
+    if forbidden:
+        failures.append(f"imported at startup: {', '.join(sorted(forbidden))}")
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
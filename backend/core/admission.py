@@ -0,0 +1,322 @@
+"""
+Admission control for the LLM-backed endpoints
+
+Sits in front of /api/v1/chat and /api/v1/evaluate-quiz so one heavy user
+can't drain the shared provider quota, and overload is refused up front
+with a 429 instead of surfacing later as provider 429s. All state is
+in-process:
+- a token bucket per client (session user or X-User-ID header, else the
+  client IP) limits how often one learner can call. X-User-ID is only
+  believed from ADMISSION_TRUSTED_PROXIES (the Next.js server, which sends
+  the Prisma user id); from anyone else it could be changed per request
+- a global bucket of estimated prompt tokens per minute keeps the process
+  inside the provider quota
+- requests the budget can't cover yet wait in a bounded queue that is
+  served round-robin across clients; when it is full, or the wait would
+  exceed ADMISSION_MAX_WAIT, the request is shed with Retry-After
+- a chat turn is charged its estimate up front, before anyone knows
+  whether it needs the LLM; turns answered locally, from cache or by a
+  shared call give it back (refund)
+
+The token budget is split evenly across WEB_CONCURRENCY workers; client
+buckets are per worker.
+
+Settings:
+    ADMISSION_ENABLED            apply the limits (true)
+    ADMISSION_USER_RATE          requests per minute per client (30)
+    ADMISSION_USER_BURST         requests a client may make back to back (10)
+    ADMISSION_TOKENS_PER_MINUTE  estimated prompt tokens per minute for the deployment (250000)
+    ADMISSION_QUEUE_SIZE         requests allowed to wait for token budget (64)
+    ADMISSION_MAX_WAIT           longest wait in seconds before shedding (5)
+    ADMISSION_MAX_CLIENTS        client buckets kept, least recently seen dropped (10000)
+    ADMISSION_TRUSTED_PROXIES    addresses/CIDRs whose X-User-ID is trusted (127.0.0.1,::1)
+"""
+
+import asyncio
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Sequence
+
+from .metrics import counter, gauge, histogram
+
+ADMISSIONS = counter(
+    "sortcrates_admission_total",
+    "Admission decisions by route and outcome",
+    ("route", "outcome"),
+)
+ADMISSION_WAITING = gauge("sortcrates_admission_waiting", "Requests queued for token budget")
+ADMISSION_WAIT_SECONDS = histogram(
+    "sortcrates_admission_wait_seconds",
+    "Time admitted requests spent queued for token budget",
+    ("route",),
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused; main.py turns it into a 429."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` per second."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def available(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def try_take(self, amount: float, now: float) -> float:
+        """
+        Take `amount` tokens if they are there.
+
+        Returns:
+            0.0 when taken, otherwise seconds until they would be
+        """
+        if self.available(now) >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def give(self, amount: float, now: float) -> None:
+        """Return tokens taken earlier, up to capacity."""
+        self.tokens = min(self.capacity, self.available(now) + amount)
+
+
+class _Waiter:
+    __slots__ = ("client", "cost", "future", "queued_at")
+
+    def __init__(self, client: str, cost: float, future: "asyncio.Future", queued_at: float):
+        self.client = client
+        self.cost = cost
+        self.future = future
+        self.queued_at = queued_at
+
+
+class AdmissionController:
+    """
+    Per-client rate limits plus a fairly queued global token budget.
+
+    Waiters are kept in one FIFO per client and released round-robin, one
+    per client per round, as the budget refills.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 30,
+        user_burst: int = 10,
+        tokens_per_minute: float = 250_000,
+        queue_size: int = 64,
+        max_wait: float = 5.0,
+        max_clients: int = 10_000,
+        enabled: bool = True,
+        trusted_proxies: Sequence[str] = ("127.0.0.1", "::1"),
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.enabled = enabled
+        self.trusted_proxies = [ipaddress.ip_network(p, strict=False) for p in trusted_proxies]
+        self.user_rate = user_rate / 60
+        self.user_burst = user_burst
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.max_clients = max_clients
+        self._clock = clock
+        self._budget = TokenBucket(tokens_per_minute / 60, tokens_per_minute, clock())
+        self._clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._waiting = 0
+        self._queued_tokens = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.outcomes: Dict[str, int] = {}
+        ADMISSION_WAITING.set_function(lambda: self._waiting)
+
+    def trusted(self, request: Any) -> bool:
+        """Whether the request comes from a proxy allowed to name the user."""
+        try:
+            address = ipaddress.ip_address(request.client.host)
+        except (AttributeError, ValueError):
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def user_id(self, request: Any) -> Optional[str]:
+        """The X-User-ID header, if a trusted proxy sent it."""
+        header = request.headers.get("x-user-id")
+        return header if header and self.trusted(request) else None
+
+    def client_key(self, request: Any, user_id: Optional[str] = None) -> str:
+        """Who to rate-limit: an explicit user id, a trusted X-User-ID, or the client IP."""
+        user_id = user_id or self.user_id(request)
+        if user_id:
+            return f"user:{user_id}"
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    def _count(self, route: str, outcome: str) -> None:
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        ADMISSIONS.inc(route=route, outcome=outcome)
+
+    def _client_bucket(self, client: str, now: float) -> TokenBucket:
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = self._clients[client] = TokenBucket(self.user_rate, self.user_burst, now)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        return bucket
+
+    async def admit(self, route: str, client: str, cost: float) -> None:
+        """
+        Wait until the request may call the LLM.
+
+        Args:
+            route: Metrics label ("chat", "quiz")
+            client: Key from client_key()
+            cost: Estimated prompt tokens; 0 for requests that won't call the LLM
+
+        Raises:
+            AdmissionRejected: Rate-limited, or shed because the budget queue
+                is full or too slow
+        """
+        if not self.enabled:
+            return
+        now = self._clock()
+        wait = self._client_bucket(client, now).try_take(1, now)
+        if wait:
+            self._count(route, "rate_limited")
+            raise AdmissionRejected("rate_limited", wait)
+
+        cost = min(cost, self._budget.capacity)
+        if cost <= 0 or (not self._waiting and not self._budget.try_take(cost, now)):
+            self._count(route, "admitted")
+            return
+
+        if self._waiting >= self.queue_size:
+            self._count(route, "queue_full")
+            raise AdmissionRejected("queue_full", self._expected_wait(cost, now))
+        expected = self._expected_wait(cost, now)
+        if expected > self.max_wait:
+            self._count(route, "over_budget")
+            raise AdmissionRejected("over_budget", expected)
+
+        waiter = _Waiter(client, cost, asyncio.get_running_loop().create_future(), now)
+        self._queues.setdefault(client, deque()).append(waiter)
+        self._waiting += 1
+        self._queued_tokens += cost
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # Client went away while queued
+            self._remove(waiter)
+            raise
+        ADMISSION_WAIT_SECONDS.observe(self._clock() - waiter.queued_at, route=route)
+        self._count(route, "queued")
+
+    def refund(self, route: str, cost: float) -> None:
+        """
+        Give back the budget an admitted request was charged but didn't use.
+
+        Args:
+            route: Metrics label, as passed to admit()
+            cost: The cost passed to admit()
+        """
+        if not self.enabled or cost <= 0:
+            return
+        self._budget.give(min(cost, self._budget.capacity), self._clock())
+        self._count(route, "refunded")
+        if self._waiting:
+            self._dispatch()
+
+    def _expected_wait(self, cost: float, now: float) -> float:
+        # Everyone queued is served before this request
+        missing = self._queued_tokens + cost - self._budget.available(now)
+        return max(0.0, missing / self._budget.rate)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.client)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._waiting -= 1
+            self._queued_tokens -= waiter.cost
+            if not queue:
+                del self._queues[waiter.client]
+
+    def _dispatch(self) -> None:
+        """Release waiters round-robin while the budget allows; re-arm a timer otherwise."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = self._clock()
+        while self._queues:
+            client, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            wait = self._budget.try_take(waiter.cost, now)
+            if wait:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            queue.popleft()
+            self._waiting -= 1
+            self._queued_tokens -= waiter.cost
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        budget = self._budget.available(self._clock())
+        return {
+            "enabled": self.enabled,
+            "waiting": self._waiting,
+            "queuedTokens": round(self._queued_tokens),
+            "budgetTokens": round(budget),
+            "tokensPerMinute": round(self._budget.capacity),
+            "clients": len(self._clients),
+            "outcomes": dict(self.outcomes),
+        }
+
+
+def admission_from_env() -> AdmissionController:
+    """Build the controller from ADMISSION_* settings."""
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY") or 1))
+    return AdmissionController(
+        user_rate=float(os.getenv("ADMISSION_USER_RATE", 30)),
+        user_burst=int(os.getenv("ADMISSION_USER_BURST", 10)),
+        tokens_per_minute=float(os.getenv("ADMISSION_TOKENS_PER_MINUTE", 250_000)) / workers,
+        queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", 64)),
+        max_wait=float(os.getenv("ADMISSION_MAX_WAIT", 5)),
+        max_clients=int(os.getenv("ADMISSION_MAX_CLIENTS", 10_000)),
+        enabled=os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes"),
+        trusted_proxies=[
+            p.strip() for p in os.getenv("ADMISSION_TRUSTED_PROXIES", "127.0.0.1,::1").split(",")
+            if p.strip()
+        ],
+    )
+
+
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    """Return the process-wide admission controller, creating it on first use."""
+    global _admission
+    if _admission is None:
+        _admission = admission_from_env()
+    return _admission
@@ -0,0 +1,244 @@
+"""
+Local classifier for trivial learner turns
+
+Many turns are a bare "yes"/"no" to a swap question, small talk ("ok",
+"lol", "idk") or two numbers naming a pair. The sort engine already knows
+the right answer to all of these, so they are graded and answered here from
+templates; only open-ended turns go to the LLM.
+
+Settings:
+    LOCAL_CLASSIFIER_ENABLED    answer trivial turns locally (true)
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import counter
+from .sort_engine import next_move, reconcile_visualizer_update
+
+CHAT_TURNS = counter(
+    "sortcrates_chat_turns_total",
+    "Chat turns by route and who answered them (an intent = local, or llm)",
+    ("route", "handler"),
+)
+
+YES = {
+    "yes", "y", "yeah", "yea", "yep", "yup", "sure", "swap", "swap them", "yes swap",
+    "yes they should", "they should", "of course", "definitely", "true",
+}
+NO = {
+    "no", "n", "nope", "nah", "no swap", "dont swap", "don't swap", "dont", "don't",
+    "no they shouldnt", "no they shouldn't", "they shouldnt", "they shouldn't", "false",
+}
+DONT_KNOW = {"idk", "i dont know", "i don't know", "dunno", "not sure", "no idea", "?"}
+CHATTER = {"ok", "okay", "k", "kk", "lol", "lmao", "haha", "hmm", "cool", "nice", "thanks", "thank you"}
+
+_PAIR_ANSWER = re.compile(r"^\[?\s*(-?\d+)\s*(?:,|and|&|vs\.?|\s)\s*(-?\d+)\s*\]?$")
+_NUMBER = re.compile(r"-?\d+")
+_SWAP_QUESTION = re.compile(r"\bswap", re.IGNORECASE)
+_PAIR_QUESTION = re.compile(
+    r"\b(which|what)\b.*\b(compare|compared|pair|numbers|elements|values)\b", re.IGNORECASE
+)
+
+Pair = Tuple[int, int]
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop trailing punctuation/emoji, collapse whitespace."""
+    text = " ".join(text.lower().split())
+    return re.sub(r"[^\w\s',&\[\]?-]+", "", text).strip(" .!")
+
+
+def _display(algorithm: str) -> str:
+    return algorithm.replace("Sort", " Sort").title()
+
+
+def _last(chat_history: List[Dict[str, str]], roles: Tuple[str, ...]) -> Optional[str]:
+    for msg in reversed(chat_history):
+        if msg["role"] in roles:
+            return msg["content"]
+    return None
+
+
+def _pair_in_question(question: str, move: Dict[str, Any], current_array: List[int]) -> Optional[Pair]:
+    """The engine pair whose two values the question names, if exactly one matches."""
+    values = {int(n) for n in _NUMBER.findall(question)} & set(current_array)
+    if len(values) != 2:
+        return None
+    candidates = [tuple(p) for p in move["comparisons"]]
+    if len(move["focusIndices"]) == 2:
+        candidates.append(tuple(move["focusIndices"]))
+    matches = {p for p in candidates if {current_array[p[0]], current_array[p[1]]} == values}
+    return matches.pop() if len(matches) == 1 else None
+
+
+def _following_pair(move: Dict[str, Any], pair: Pair) -> Optional[Pair]:
+    """The pair the engine examines after `pair` when `pair` causes no change."""
+    comparisons = [tuple(p) for p in move["comparisons"]]
+    if pair in comparisons and comparisons.index(pair) + 1 < len(comparisons):
+        return comparisons[comparisons.index(pair) + 1]
+    if len(move["focusIndices"]) == 2:
+        return tuple(move["focusIndices"])
+    return None
+
+
+def _question_for(algorithm: str, pair: Optional[Pair], array: List[int], prefix: str) -> str:
+    name = _display(algorithm)
+    if pair is None:
+        return f"{prefix} The array is sorted! Why is {name} guaranteed to finish with every element in place?"
+    a, b = array[pair[0]], array[pair[1]]
+    return f"{prefix} Next, {name} looks at {a} and {b}. Should they swap?"
+
+
+class AnswerClassifier:
+    """
+    Rule-based intents for a learner message, answered from the engine's move.
+
+    classify() returns a complete chat response for trivial turns, or None
+    when the turn needs the LLM.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def _response(
+        self,
+        algorithm: str,
+        mastery: float,
+        analysis: str,
+        question: str,
+        visualizer: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        if analysis == "correct":
+            mastery = min(1.0, round(mastery + 0.02, 2))
+        return {
+            "socraticQuestion": question,
+            "analysisOfUserAnswer": analysis,
+            "learnerMasteryUpdate": {algorithm: mastery},
+            "visualizerStateUpdate": visualizer,
+            "xpAwarded": 5 if analysis == "correct" else 0,
+        }
+
+    def _comparing(self, pair: Optional[Pair], move, current_array) -> Dict[str, Any]:
+        proposed = {"state": "comparing", "focusIndices": list(pair) if pair else []}
+        return reconcile_visualizer_update(proposed, move, current_array)
+
+    def classify(
+        self,
+        algorithm: str,
+        chat_history: List[Dict[str, str]],
+        mastery: float,
+        move: Optional[Dict[str, Any]] = None,
+        current_array: Optional[List[int]] = None,
+    ) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Returns:
+            Tuple of (intent, response dict), or None to use the LLM
+        """
+        if not self.enabled:
+            return None
+        message = _last(chat_history, ("user",))
+        if message is None:
+            return None
+        text = normalize(message)
+        question = _last(chat_history, ("ai", "assistant")) or ""
+
+        if text in DONT_KNOW or text in CHATTER:
+            return self._chatter(algorithm, text, question, mastery, move, current_array)
+        if move is None or not current_array or move["state"] == "sorted":
+            return None
+
+        if (text in YES or text in NO) and _SWAP_QUESTION.search(question):
+            pair = _pair_in_question(question, move, current_array)
+            if pair is None:
+                return None
+            return self._swap_answer(algorithm, text in YES, pair, mastery, move, current_array)
+
+        answer = _PAIR_ANSWER.match(text)
+        if answer and _PAIR_QUESTION.search(question) and move["comparisons"]:
+            named = {int(answer.group(1)), int(answer.group(2))}
+            expected = tuple(move["comparisons"][0])
+            values = [current_array[i] for i in expected]
+            if named == set(values):
+                return "pair", self._response(
+                    algorithm, mastery, "correct",
+                    f"Correct! {_display(algorithm)} compares {values[0]} and {values[1]}. Should they swap?",
+                    self._comparing(expected, move, current_array),
+                )
+            return "pair", self._response(
+                algorithm, mastery, "incorrect",
+                "Not quite. Look at the highlighted pair: which two values are being compared, and why those?",
+                self._comparing(expected, move, current_array),
+            )
+        return None
+
+    def _swap_answer(
+        self,
+        algorithm: str,
+        said_yes: bool,
+        pair: Pair,
+        mastery: float,
+        move: Dict[str, Any],
+        current_array: List[int],
+    ) -> Tuple[str, Dict[str, Any]]:
+        swaps = list(pair) == list(move["focusIndices"])
+        a, b = current_array[pair[0]], current_array[pair[1]]
+        intent = "confirm_swap" if said_yes else "deny_swap"
+        if said_yes != swaps:
+            if swaps:
+                question = f"Look again: {a} and {b} are out of order. What does {_display(algorithm)} do when that happens?"
+            else:
+                question = f"Look again: {a} and {b} are already in order. Does {_display(algorithm)} need to swap them?"
+            return intent, self._response(
+                algorithm, mastery, "incorrect", question,
+                self._comparing(pair, move, current_array),
+            )
+        if swaps:
+            # The server applies the swap; ask about the engine's next pair
+            after = move["data"]
+            following = next_move(algorithm, after)
+            upcoming = following["comparisons"][0] if following["state"] != "sorted" else None
+            question = _question_for(algorithm, tuple(upcoming) if upcoming else None, after, f"Correct! {a} and {b} swap.")
+            visualizer = reconcile_visualizer_update({"state": "swapping"}, move, current_array)
+        else:
+            upcoming = _following_pair(move, pair)
+            question = _question_for(algorithm, upcoming, current_array, f"Correct! {a} and {b} stay where they are.")
+            visualizer = self._comparing(upcoming, move, current_array)
+        return intent, self._response(algorithm, mastery, "correct", question, visualizer)
+
+    def _chatter(
+        self,
+        algorithm: str,
+        text: str,
+        question: str,
+        mastery: float,
+        move: Optional[Dict[str, Any]],
+        current_array: Optional[List[int]],
+    ) -> Tuple[str, Dict[str, Any]]:
+        name = _display(algorithm)
+        pair = None
+        if move is not None and current_array and move["state"] != "sorted" and move["comparisons"]:
+            pair = tuple(move["comparisons"][0])
+        if text in DONT_KNOW:
+            if pair is not None:
+                a, b = current_array[pair[0]], current_array[pair[1]]
+                reply = f"No problem! Hint: {name} compares {a} and {b} next. Which one is larger?"
+            else:
+                reply = f"No problem! Let's start small: what does {name} do with two neighbouring values that are out of order?"
+            intent = "dont_know"
+        else:
+            reply = f"Let's get back to {name}! {question}" if question else f"Let's get back to {name}! What do you already know about it?"
+            intent = "chatter"
+        visualizer = (
+            self._comparing(pair, move, current_array)
+            if pair is not None
+            else {"focusIndices": [], "state": "idle"}
+        )
+        return intent, self._response(algorithm, mastery, "continuing", reply, visualizer)
+
+
+def answer_classifier_from_env() -> AnswerClassifier:
+    """Build the classifier from LOCAL_CLASSIFIER_ENABLED."""
+    enabled = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+    return AnswerClassifier(enabled=enabled)
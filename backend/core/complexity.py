@@ -0,0 +1,529 @@
+"""
+Empirical complexity lab
+
+Lets learners in Stage 5 (Mastery) see growth rates instead of being told
+them: each algorithm is run over several input sizes and distributions, its
+comparisons and swaps are counted, and a constant is fitted for n, n log n
+and n^2 to pick the model that explains the counts best.
+
+Counting runs in plain loops (one local integer increment per operation,
+no per-step generator or copy) that follow the engine in sort_engine.py
+operation for operation, so counts match what the visualizer shows: a
+"swap" is every step it draws as swapping, i.e. an exchange or, for
+insertion and merge sort, an element write.
+
+Runs go to a process pool so they use every core without holding the GIL
+the event loop needs. Chat traffic stays responsive because
+- pool processes run at lower priority (COMPLEXITY_NICE)
+- work is bounded up front: sizes, an operation budget per run (a 1M
+  element bubble sort is refused, not started), and the number of runs
+  queued across requests
+- arrays are built inside the worker from a seed, never pickled, and the
+  pool is replaced after COMPLEXITY_POOL_RUNS runs so memory from large
+  runs goes back to the OS
+
+Results are deterministic per configuration and cached.
+
+Settings:
+    COMPLEXITY_WORKERS           pool processes (cores / WEB_CONCURRENCY)
+    COMPLEXITY_MAX_SIZE          largest input size (1000000)
+    COMPLEXITY_MAX_OPS           estimated operations allowed per run (50000000)
+    COMPLEXITY_MAX_RUNS          runs per request (200)
+    COMPLEXITY_QUEUE_SIZE        runs queued across requests before shedding (400)
+    COMPLEXITY_POOL_RUNS         runs before the pool processes are replaced (200)
+    COMPLEXITY_NICE              niceness added to pool processes (10)
+    COMPLEXITY_CACHE_ENTRIES     cached configurations (256)
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .admission import AdmissionRejected
+from .metrics import counter, histogram
+from .response_cache import MemoryBackend
+from .single_flight import SingleFlight
+
+COMPLEXITY_RUNS = counter(
+    "sortcrates_complexity_runs_total", "Complexity lab runs by algorithm", ("algorithm",)
+)
+COMPLEXITY_RUN_SECONDS = histogram(
+    "sortcrates_complexity_run_seconds",
+    "Wall time of one complexity lab run in a pool process",
+    ("algorithm",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+DISTRIBUTIONS = ("random", "sorted", "reversed", "fewUnique")
+FEW_UNIQUE_VALUES = 10
+
+Counts = Tuple[int, int]
+
+
+def _bubble_counts(a: List[int]) -> Counts:
+    comparisons = swaps = 0
+    n = len(a)
+    for i in range(n - 1):
+        for j in range(n - i - 1):
+            comparisons += 1
+            if a[j] > a[j + 1]:
+                a[j], a[j + 1] = a[j + 1], a[j]
+                swaps += 1
+    return comparisons, swaps
+
+
+def _selection_counts(a: List[int]) -> Counts:
+    comparisons = swaps = 0
+    n = len(a)
+    for i in range(n - 1):
+        min_idx = i
+        for j in range(i + 1, n):
+            comparisons += 1
+            if a[j] < a[min_idx]:
+                min_idx = j
+        if min_idx != i:
+            a[i], a[min_idx] = a[min_idx], a[i]
+            swaps += 1
+    return comparisons, swaps
+
+
+def _insertion_counts(a: List[int]) -> Counts:
+    comparisons = swaps = 0
+    for i in range(1, len(a)):
+        key = a[i]
+        j = i - 1
+        while j >= 0:
+            comparisons += 1
+            if a[j] <= key:
+                break
+            a[j + 1] = a[j]
+            swaps += 1
+            j -= 1
+        a[j + 1] = key
+    return comparisons, swaps
+
+
+def _merge_counts(a: List[int]) -> Counts:
+    comparisons = swaps = 0
+
+    def merge(left: int, mid: int, right: int) -> None:
+        nonlocal comparisons, swaps
+        left_arr = a[left:mid + 1]
+        right_arr = a[mid + 1:right + 1]
+        n_left, n_right = len(left_arr), len(right_arr)
+        i = j = 0
+        k = left
+        while i < n_left and j < n_right:
+            comparisons += 1
+            if left_arr[i] <= right_arr[j]:
+                a[k] = left_arr[i]
+                i += 1
+            else:
+                a[k] = right_arr[j]
+                j += 1
+            k += 1
+        a[k:right + 1] = left_arr[i:] if i < n_left else right_arr[j:]
+        # The engine draws every element written back as a swap
+        swaps += right - left + 1
+
+    def helper(left: int, right: int) -> None:
+        if left < right:
+            mid = (left + right) // 2
+            helper(left, mid)
+            helper(mid + 1, right)
+            merge(left, mid, right)
+
+    helper(0, len(a) - 1)
+    return comparisons, swaps
+
+
+def _quick_counts(a: List[int]) -> Counts:
+    comparisons = swaps = 0
+    stack = [(0, len(a) - 1)]
+    while stack:
+        low, high = stack.pop()
+        if low >= high:
+            continue
+        pivot = a[high]
+        i = low - 1
+        for j in range(low, high):
+            comparisons += 1
+            if a[j] < pivot:
+                i += 1
+                if i != j:
+                    a[i], a[j] = a[j], a[i]
+                    swaps += 1
+        a[i + 1], a[high] = a[high], a[i + 1]
+        swaps += 1
+        stack.append((i + 2, high))
+        stack.append((low, i))
+    return comparisons, swaps
+
+
+def _heap_counts(a: List[int]) -> Counts:
+    comparisons = swaps = 0
+
+    def heapify(n: int, i: int) -> None:
+        nonlocal comparisons, swaps
+        while True:
+            largest = i
+            left = 2 * i + 1
+            right = left + 1
+            if left < n:
+                comparisons += 1
+                if a[left] > a[largest]:
+                    largest = left
+            if right < n:
+                comparisons += 1
+                if a[right] > a[largest]:
+                    largest = right
+            if largest == i:
+                return
+            a[i], a[largest] = a[largest], a[i]
+            swaps += 1
+            i = largest
+
+    n = len(a)
+    for i in range(n // 2 - 1, -1, -1):
+        heapify(n, i)
+    for i in range(n - 1, 0, -1):
+        a[0], a[i] = a[i], a[0]
+        swaps += 1
+        heapify(i, 0)
+    return comparisons, swaps
+
+
+COUNTERS: Dict[str, Callable[[List[int]], Counts]] = {
+    "bubbleSort": _bubble_counts,
+    "selectionSort": _selection_counts,
+    "insertionSort": _insertion_counts,
+    "mergeSort": _merge_counts,
+    "quickSort": _quick_counts,
+    "heapSort": _heap_counts,
+}
+
+
+def make_input(distribution: str, n: int, seed: str) -> List[int]:
+    """The input for one run; the same for every algorithm given the same seed."""
+    if distribution == "sorted":
+        return list(range(n))
+    if distribution == "reversed":
+        return list(range(n, 0, -1))
+    rng = random.Random(seed)
+    values = range(FEW_UNIQUE_VALUES) if distribution == "fewUnique" else range(n)
+    return rng.choices(values, k=n)
+
+
+def estimated_ops(algorithm: str, distribution: str, n: int) -> int:
+    """Rough worst case for one run, used to refuse runs before they start."""
+    quadratic = (
+        algorithm in ("bubbleSort", "selectionSort")
+        or (algorithm == "insertionSort" and distribution != "sorted")
+        # Last-element pivot: sorted/reversed input and runs of equal keys
+        # give maximally unbalanced partitions
+        or (algorithm == "quickSort" and distribution != "random")
+    )
+    if quadratic:
+        return n * n // 2
+    return 2 * n * max(1, math.ceil(math.log2(max(n, 2))))
+
+
+def _run(algorithm: str, distribution: str, n: int, seed: str) -> Dict[str, Any]:
+    """Pool entry point: build the input, sort it, return the counts."""
+    data = make_input(distribution, n, seed)
+    start = time.perf_counter()
+    comparisons, swaps = COUNTERS[algorithm](data)
+    return {
+        "comparisons": comparisons,
+        "swaps": swaps,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _lower_priority(nice: int) -> None:
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+
+MODELS: Dict[str, Callable[[int], float]] = {
+    "n": lambda n: n,
+    "n log n": lambda n: n * math.log2(n) if n > 1 else 1.0,
+    "n^2": lambda n: n * n,
+}
+
+
+def fit_growth(points: List[Tuple[int, float]]) -> Dict[str, Any]:
+    """
+    Fit y = c * f(n) for each model and pick the best.
+
+    The constant is the mean of y / f(n); the model whose ratios vary least
+    (relative spread, max - min over mean) wins. Counts that are zero at
+    every size (swaps on sorted input) fit no model.
+
+    Returns:
+        Dictionary with "model" (None if undetermined), "constant" and
+        "spread"
+    """
+    points = [(n, y) for n, y in points if n > 0]
+    if not points or all(y == 0 for _, y in points):
+        return {"model": None, "constant": 0.0, "spread": 0.0}
+    best: Optional[Dict[str, Any]] = None
+    for name, f in MODELS.items():
+        ratios = [y / f(n) for n, y in points]
+        mean = sum(ratios) / len(ratios)
+        spread = (max(ratios) - min(ratios)) / mean if mean else math.inf
+        if best is None or spread < best["spread"]:
+            best = {"model": name, "constant": round(mean, 4), "spread": round(spread, 4)}
+    if len({n for n, _ in points}) < 2:
+        # One size can't tell the models apart
+        best["model"] = None
+    return best
+
+
+def config_key(config: Dict[str, Any]) -> str:
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ComplexityLab:
+    """
+    Runs, caches and fits complexity experiments on a bounded process pool.
+
+    The pool is started on first use, so importing this in a preloading
+    parent (serve.py) doesn't fork it into every web worker.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_size: int = 1_000_000,
+        max_ops: int = 50_000_000,
+        max_runs: int = 200,
+        queue_size: int = 400,
+        pool_runs: int = 200,
+        nice: int = 10,
+        cache_entries: int = 256,
+    ):
+        self.workers = workers
+        self.max_size = max_size
+        self.max_ops = max_ops
+        self.max_runs = max_runs
+        self.queue_size = queue_size
+        self.pool_runs = pool_runs
+        self.nice = nice
+        self.cache = MemoryBackend(cache_entries)
+        self.flights = SingleFlight("complexity")
+        self.hits = 0
+        self.misses = 0
+        self.runs = 0
+        self._queued = 0
+        self._run_seconds = 1.0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_runs = 0
+
+    def _pool(self, runs: int) -> ProcessPoolExecutor:
+        if self._executor is not None and self._executor_runs >= self.pool_runs:
+            # Not max_tasks_per_child: it can deadlock the executor on 3.11.
+            # The old pool finishes what it was given, then its processes exit
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._executor is None:
+            # spawn: the web process has threads (logging, to_thread), which
+            # don't survive fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+                initargs=(self.nice,),
+            )
+            self._executor_runs = 0
+        self._executor_runs += runs
+        return self._executor
+
+    def validate(
+        self,
+        algorithms: List[str],
+        sizes: List[int],
+        distributions: List[str],
+        trials: int,
+    ) -> None:
+        """
+        Refuse configurations that are unknown or too expensive.
+
+        Raises:
+            KeyError: Unknown algorithm or distribution
+            ValueError: Too large; the message says which limit
+        """
+        for algorithm in algorithms:
+            if algorithm not in COUNTERS:
+                raise KeyError(f"Unknown algorithm: {algorithm}")
+        for distribution in distributions:
+            if distribution not in DISTRIBUTIONS:
+                raise KeyError(f"Unknown distribution: {distribution}")
+        if any(n < 1 or n > self.max_size for n in sizes):
+            raise ValueError(f"Sizes must be between 1 and {self.max_size}")
+        runs = len(algorithms) * len(sizes) * len(distributions) * trials
+        if runs > self.max_runs:
+            raise ValueError(f"{runs} runs requested, at most {self.max_runs} allowed")
+        largest = max(sizes, default=0)
+        for algorithm in algorithms:
+            for distribution in distributions:
+                if estimated_ops(algorithm, distribution, largest) > self.max_ops:
+                    raise ValueError(
+                        f"{algorithm} on {largest} {distribution} elements is too slow to run here"
+                    )
+
+    async def run(
+        self,
+        algorithms: List[str],
+        sizes: List[int],
+        distributions: List[str],
+        trials: int = 1,
+        seed: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Growth curves and fitted models for every (algorithm, distribution).
+
+        Call validate() first.
+
+        Raises:
+            AdmissionRejected: Too many runs already queued
+        """
+        config = {
+            "algorithms": algorithms,
+            "sizes": sorted(set(sizes)),
+            "distributions": distributions,
+            "trials": trials,
+            "seed": seed,
+        }
+        key = config_key(config)
+        # Callers get their own copy, so changing it can't alter the cached result
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return copy.deepcopy(cached)
+        self.misses += 1
+        result, _ = await self.flights.do(key, lambda: self._compute(config))
+        self.cache.set(key, result, ttl=float("inf"))
+        return copy.deepcopy(result)
+
+    async def _compute(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        jobs = [
+            (algorithm, distribution, n, f"{config['seed']}:{distribution}:{n}:{trial}")
+            for algorithm in config["algorithms"]
+            for distribution in config["distributions"]
+            for n in config["sizes"]
+            for trial in range(config["trials"])
+        ]
+        if self._queued + len(jobs) > self.queue_size:
+            raise AdmissionRejected(
+                "lab_busy", self._run_seconds * self._queued / max(1, self.workers)
+            )
+        # Longest first, so one big run doesn't start last and run alone
+        jobs.sort(key=lambda job: estimated_ops(job[0], job[1], job[2]), reverse=True)
+        loop = asyncio.get_running_loop()
+        pool = self._pool(len(jobs))
+        started = time.perf_counter()
+        self._queued += len(jobs)
+        try:
+            futures = [loop.run_in_executor(pool, _run, *job) for job in jobs]
+            outcomes = await asyncio.gather(*futures)
+        finally:
+            self._queued -= len(jobs)
+
+        totals: Dict[Tuple[str, str, int], Dict[str, float]] = {}
+        for (algorithm, distribution, n, _), outcome in zip(jobs, outcomes):
+            COMPLEXITY_RUNS.inc(algorithm=algorithm)
+            COMPLEXITY_RUN_SECONDS.observe(outcome["seconds"], algorithm=algorithm)
+            self._run_seconds = 0.8 * self._run_seconds + 0.2 * outcome["seconds"]
+            total = totals.setdefault((algorithm, distribution, n), dict.fromkeys(outcome, 0.0))
+            for name, value in outcome.items():
+                total[name] += value
+        self.runs += len(jobs)
+
+        trials = config["trials"]
+        results = []
+        for algorithm in config["algorithms"]:
+            for distribution in config["distributions"]:
+                points = []
+                for n in config["sizes"]:
+                    total = totals[(algorithm, distribution, n)]
+                    points.append({
+                        "n": n,
+                        "comparisons": total["comparisons"] / trials,
+                        "swaps": total["swaps"] / trials,
+                        "seconds": round(total["seconds"] / trials, 6),
+                    })
+                results.append({
+                    "algorithm": algorithm,
+                    "distribution": distribution,
+                    "points": points,
+                    "fit": {
+                        metric: fit_growth([(p["n"], p[metric]) for p in points])
+                        for metric in ("comparisons", "swaps")
+                    },
+                })
+        return {
+            "config": config,
+            "results": results,
+            "wallSeconds": round(time.perf_counter() - started, 3),
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "queuedRuns": self._queued,
+            "runs": self.runs,
+            "cacheEntries": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.flights.followers,
+        }
+
+
+def _default_workers() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+    # Every web worker gets its own pool; together they fill the machine
+    return max(1, cores // max(1, int(os.getenv("WEB_CONCURRENCY") or 1)))
+
+
+def complexity_lab_from_env() -> ComplexityLab:
+    """Build the lab from COMPLEXITY_* settings."""
+    return ComplexityLab(
+        workers=int(os.getenv("COMPLEXITY_WORKERS") or _default_workers()),
+        max_size=int(os.getenv("COMPLEXITY_MAX_SIZE", 1_000_000)),
+        max_ops=int(os.getenv("COMPLEXITY_MAX_OPS", 50_000_000)),
+        max_runs=int(os.getenv("COMPLEXITY_MAX_RUNS", 200)),
+        queue_size=int(os.getenv("COMPLEXITY_QUEUE_SIZE", 400)),
+        pool_runs=int(os.getenv("COMPLEXITY_POOL_RUNS", 200)),
+        nice=int(os.getenv("COMPLEXITY_NICE", 10)),
+        cache_entries=int(os.getenv("COMPLEXITY_CACHE_ENTRIES", 256)),
+    )
+
+
+_lab: Optional[ComplexityLab] = None
+
+
+def get_complexity_lab() -> ComplexityLab:
+    """Return the process-wide lab, creating it on first use."""
+    global _lab
+    if _lab is None:
+        _lab = complexity_lab_from_env()
+    return _lab
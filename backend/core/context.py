@@ -0,0 +1,226 @@
+"""
+Rolling conversation context for the tutor prompt
+
+Instead of a hard window of the last few messages, each turn's prompt gets
+- a compact lesson summary (stage, pairs examined, swaps done, misconceptions,
+  questions already asked), updated incrementally from each tutor response
+- the last few messages verbatim
+both fitted into a fixed token budget, so the prompt stays the same size no
+matter how long the lesson runs. Stateless turns (no session) have no
+summary worth the tokens, since plain messages don't say which pairs were
+examined or what was answered correctly; their recent messages get the
+whole budget instead.
+
+Settings:
+    CONTEXT_TOKEN_BUDGET      tokens for summary + recent chat (350)
+    CONTEXT_RECENT_MESSAGES   messages kept verbatim (4)
+"""
+
+import hashlib
+import json
+import os
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .prompts import NO_LESSON_SUMMARY, NO_SESSION_SUMMARY, estimate_tokens
+
+# Mirrors the "Conversation Progression Guide" stages in the system prompt
+STAGES = {
+    1: "Intro",
+    2: "Mechanics",
+    3: "Implementation",
+    4: "Optimization",
+    5: "Mastery",
+}
+
+MAX_PAIRS = 8
+MAX_MISCONCEPTIONS = 3
+MAX_ASKED = 6
+SNIPPET_CHARS = 80
+
+
+def _snippet(text: str, limit: int = SNIPPET_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+class LessonSummary:
+    """
+    Structured, constant-size record of a lesson's progress.
+
+    observe() folds in one turn in O(1); render() writes it as a few prompt
+    lines, dropping the least important details first to fit a budget;
+    digest() identifies it for the response cache.
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.stage = 1
+        self.correct = 0
+        self.incorrect = 0
+        self.swaps = 0
+        self.pairs: Deque[Tuple[int, int]] = deque(maxlen=MAX_PAIRS)
+        self.misconceptions: Deque[str] = deque(maxlen=MAX_MISCONCEPTIONS)
+        self.asked: Deque[str] = deque(maxlen=MAX_ASKED)
+        self._last_question: Optional[str] = None
+        # False when rebuilt from plain messages: stage and scores are unknown
+        self.tracked = True
+
+    @classmethod
+    def from_history(cls, messages: List[Dict[str, str]]) -> "LessonSummary":
+        """
+        Rebuild what can be recovered from plain messages (turn count and the
+        questions asked) to seed a session from an existing history.
+        """
+        summary = cls()
+        summary.tracked = False
+        for msg in messages:
+            if msg["role"] == "user":
+                summary.turns += 1
+            elif msg["role"] in ("ai", "assistant"):
+                summary.asked.append(_snippet(msg["content"]))
+        return summary
+
+    def observe(self, user_message: str, response: Dict[str, Any]) -> None:
+        """Fold one learner message and the tutor's parsed response into the summary."""
+        self.turns += 1
+        analysis = response.get("analysisOfUserAnswer")
+        if analysis == "correct":
+            self.correct += 1
+        elif analysis == "incorrect":
+            self.incorrect += 1
+            if self._last_question:
+                self.misconceptions.append(
+                    f'"{_snippet(user_message, 40)}" to "{_snippet(self._last_question, 60)}"'
+                )
+
+        update = response.get("visualizerStateUpdate") or {}
+        state = update.get("state")
+        focus = update.get("focusIndices") or []
+        if len(focus) == 2:
+            pair = (int(focus[0]), int(focus[1]))
+            if pair not in self.pairs:
+                self.pairs.append(pair)
+        if state == "swapping":
+            self.swaps += 1
+        if state == "sorted":
+            self.stage = 5
+        elif state == "swapping" or self.swaps:
+            self.stage = max(self.stage, 3)
+        elif self.pairs:
+            self.stage = max(self.stage, 2)
+
+        question = response.get("socraticQuestion")
+        if question:
+            self._last_question = question
+            self.asked.append(_snippet(question))
+
+    def digest(self) -> str:
+        """Short hash of everything render() can show."""
+        state = [
+            self.tracked, self.turns, self.stage, self.correct, self.incorrect, self.swaps,
+            list(self.pairs), list(self.misconceptions), list(self.asked),
+        ]
+        canonical = json.dumps(state, separators=(",", ":"))
+        return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _lines(self, pairs: int, misconceptions: int, asked: int) -> List[str]:
+        if self.tracked:
+            lines = [
+                f"- Stage {self.stage} ({STAGES[self.stage]}) after {self.turns} turns; "
+                f"{self.correct} correct, {self.incorrect} incorrect"
+            ]
+        else:
+            lines = [f"- {self.turns} earlier turns"]
+        if self.swaps:
+            lines.append(f"- Swaps done: {self.swaps}")
+        if pairs and self.pairs:
+            shown = " ".join(f"[{i},{j}]" for i, j in list(self.pairs)[-pairs:])
+            lines.append(f"- Pairs examined: {shown}")
+        if misconceptions and self.misconceptions:
+            shown = "; ".join(list(self.misconceptions)[-misconceptions:])
+            lines.append(f"- Misconceptions: {shown}")
+        if asked and self.asked:
+            lines.append("- Already asked (don't repeat):")
+            lines.extend(f"  * {q}" for q in list(self.asked)[-asked:])
+        return lines
+
+    def render(self, budget_tokens: int) -> str:
+        """Summary lines within budget_tokens; oldest asked questions go first, then misconceptions, then pairs."""
+        if not self.turns and not self.asked:
+            return NO_LESSON_SUMMARY
+        pairs, misconceptions, asked = len(self.pairs), len(self.misconceptions), len(self.asked)
+        while True:
+            text = "\n".join(self._lines(pairs, misconceptions, asked))
+            if estimate_tokens(text) <= budget_tokens:
+                return text
+            if asked:
+                asked -= 1
+            elif misconceptions:
+                misconceptions -= 1
+            elif pairs:
+                pairs -= 1
+            else:
+                return text
+
+
+def format_messages(messages: List[Dict[str, str]], max_chars: int) -> List[str]:
+    lines = []
+    for msg in messages:
+        if msg["role"] == "user":
+            lines.append(f"USER: {_snippet(msg['content'], max_chars)}")
+        elif msg["role"] == "ai" or msg["role"] == "assistant":
+            lines.append(f"ASSISTANT: {_snippet(msg['content'], max_chars)}")
+    return lines
+
+
+class ContextBuilder:
+    """
+    Fits the lesson summary and the most recent messages into a token budget.
+
+    Recent messages get up to 60% of the budget (newest kept first, each
+    capped in length); the summary gets the rest. Without a summary the
+    messages get all of it.
+    """
+
+    def __init__(self, budget_tokens: int = 350, recent_messages: int = 4):
+        self.budget_tokens = budget_tokens
+        self.recent_messages = recent_messages
+
+    @classmethod
+    def from_env(cls) -> "ContextBuilder":
+        return cls(
+            budget_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", 350)),
+            recent_messages=int(os.getenv("CONTEXT_RECENT_MESSAGES", 4)),
+        )
+
+    def build(
+        self,
+        chat_history: List[Dict[str, str]],
+        summary: Optional[LessonSummary] = None,
+    ) -> Tuple[str, str]:
+        """
+        Args:
+            chat_history: Messages in order; only the tail is used verbatim
+            summary: The session's running summary, or None for a stateless
+                turn
+
+        Returns:
+            Tuple of (lesson summary text, recent chat text)
+        """
+        recent = chat_history[-self.recent_messages:] if self.recent_messages else []
+        if summary is None:
+            recent_budget = self.budget_tokens
+        else:
+            recent_budget = int(self.budget_tokens * 0.6)
+        max_chars = max(40, recent_budget * 4 // max(1, len(recent)))
+        lines = format_messages(recent, max_chars)
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > recent_budget:
+            lines.pop(0)
+        recent_text = "\n".join(lines)
+
+        if summary is None:
+            earlier = len(chat_history) > len(recent)
+            return (NO_SESSION_SUMMARY if earlier else NO_LESSON_SUMMARY), recent_text
+        summary_budget = self.budget_tokens - estimate_tokens(recent_text)
+        return summary.render(summary_budget), recent_text
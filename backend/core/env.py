@@ -0,0 +1,25 @@
+"""
+One-time loading of the backend's .env file
+
+Entry points (main.py, serve.py, scripts) call load_env() before reading
+settings; later calls are free. Variables already set in the environment
+win over the file, as with python-dotenv's default.
+"""
+
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env() -> None:
+    """Read .env into os.environ, once per process."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _loaded = True
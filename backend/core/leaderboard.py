@@ -0,0 +1,405 @@
+"""
+In-memory leaderboard rank index
+
+Ranks used to mean sorting the Leaderboard table by totalXP on every read,
+and keeping its `rank` column right would mean rewriting every row behind
+anyone who earned XP. Here ranks come from an order-statistic index instead:
+a Fenwick tree counting learners per XP value, plus the learners at each
+value in the order they reached it.
+
+- an XP change is two O(log M) tree updates (M = highest XP tracked)
+- "my rank" is 1 + learners with more XP, one O(log M) prefix sum
+- top K jumps from one occupied XP value to the next below it, O(log M)
+  each, so it costs O(log M) per distinct XP value in the top K
+- ties share a rank (1, 2, 2, 4), earliest to reach the XP listed first
+
+The Prisma Leaderboard table stays the source of truth for totals (the
+Next.js routes upsert it). The index is loaded from it at startup, applies
+xpAwarded from tutor turns as they happen, and every flush interval picks up
+rows other processes changed (by updatedAt) and writes `rank` back for the
+top rows and for learners whose XP changed. Other rows' `rank` may lag; read
+ranks from the API.
+
+Settings:
+    LEADERBOARD_DB_PATH         Prisma SQLite database (SESSION_DB_PATH; unset = memory only)
+    LEADERBOARD_FLUSH_INTERVAL  seconds between syncs with the table (30)
+    LEADERBOARD_RANKED_ROWS     top rows whose rank is always written (100)
+    LEADERBOARD_MAX_XP          XP values tracked exactly; higher ones tie (1048576)
+"""
+
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .log import get_logger
+from .metrics import gauge, histogram
+
+logger = get_logger("leaderboard")
+
+SYNC_OVERLAP_MS = 2000
+
+LEADERBOARD_USERS = gauge("sortcrates_leaderboard_users", "Learners in the rank index")
+LEADERBOARD_SYNC_SECONDS = histogram(
+    "sortcrates_leaderboard_sync_seconds",
+    "Time to sync the rank index with the Leaderboard table",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+
+def level_for(xp: int) -> int:
+    """Same formula as app/api/chat/send/route.ts."""
+    return math.floor(1 + math.log2(max(xp, 0) / 100 + 1))
+
+
+class RankIndex:
+    """
+    Order-statistic index of learners by XP (not thread-safe; see Leaderboard).
+
+    The tree grows by doubling as higher XP values appear, up to max_xp.
+    """
+
+    def __init__(self, max_xp: int = 1 << 20, capacity: int = 1024):
+        # Values 0 .. max_xp - 1 are ranked exactly; anything above ties
+        self.max_xp = max_xp
+        self._size = 1
+        while self._size < min(capacity, max_xp):
+            self._size *= 2
+        self._tree = [0] * (self._size + 1)
+        self._xp: Dict[str, int] = {}
+        # Learners per tracked value, in the order they reached it
+        self._buckets: Dict[int, Dict[str, None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._xp)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._xp
+
+    def _slot(self, xp: int) -> int:
+        return min(xp, self.max_xp - 1)
+
+    def _update(self, slot: int, delta: int) -> None:
+        i = slot + 1
+        tree, size = self._tree, self._size
+        while i <= size:
+            tree[i] += delta
+            i += i & -i
+
+    def _count_at_most(self, slot: int) -> int:
+        i = min(slot + 1, self._size)
+        tree = self._tree
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _select(self, k: int) -> int:
+        """The slot holding the k-th lowest learner (1-based)."""
+        tree = self._tree
+        pos = 0
+        step = self._size
+        while step:
+            nxt = pos + step
+            if nxt <= self._size and tree[nxt] < k:
+                pos = nxt
+                k -= tree[nxt]
+            step //= 2
+        return pos
+
+    def _grow(self, slot: int) -> None:
+        size = self._size
+        while size <= slot:
+            size *= 2
+        tree = [0] * (size + 1)
+        for value, users in self._buckets.items():
+            tree[value + 1] = len(users)
+        # Linear-time Fenwick build
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._size = size
+        self._tree = tree
+
+    def get(self, user_id: str) -> Optional[int]:
+        return self._xp.get(user_id)
+
+    def set(self, user_id: str, xp: int) -> bool:
+        """Set a learner's total; returns whether it changed."""
+        xp = max(0, int(xp))
+        old = self._xp.get(user_id)
+        if old == xp:
+            return False
+        if old is not None:
+            slot = self._slot(old)
+            bucket = self._buckets[slot]
+            del bucket[user_id]
+            if not bucket:
+                del self._buckets[slot]
+            self._update(slot, -1)
+        slot = self._slot(xp)
+        if slot >= self._size:
+            self._grow(slot)
+        self._buckets.setdefault(slot, {})[user_id] = None
+        self._update(slot, 1)
+        self._xp[user_id] = xp
+        return True
+
+    def add(self, user_id: str, delta: int) -> int:
+        """Apply an XP delta (totals never go below 0); returns the new total."""
+        self.set(user_id, self._xp.get(user_id, 0) + delta)
+        return self._xp[user_id]
+
+    def remove(self, user_id: str) -> None:
+        old = self._xp.pop(user_id, None)
+        if old is None:
+            return
+        slot = self._slot(old)
+        bucket = self._buckets[slot]
+        del bucket[user_id]
+        if not bucket:
+            del self._buckets[slot]
+        self._update(slot, -1)
+
+    def rank(self, user_id: str) -> Optional[int]:
+        xp = self._xp.get(user_id)
+        if xp is None:
+            return None
+        return 1 + len(self._xp) - self._count_at_most(self._slot(xp))
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        """The k highest learners as (user_id, xp, rank)."""
+        n = len(self._xp)
+        out: List[Tuple[str, int, int]] = []
+        position = 1
+        while position <= n and len(out) < k:
+            slot = self._select(n - position + 1)
+            bucket = self._buckets[slot]
+            for user_id in bucket:
+                out.append((user_id, self._xp[user_id], position))
+                if len(out) == k:
+                    break
+            position += len(bucket)
+        return out
+
+
+class LeaderboardTable:
+    """
+    Reads the Prisma Leaderboard table and writes its `rank` column.
+
+    updatedAt is left alone (Prisma sets it), so our own writes don't come
+    back as changes on the next sync. Syncs poll on updatedAt, so its index
+    (@@index([updatedAt]) in schema.prisma) is created here too when the
+    database predates it.
+    """
+
+    UPDATED_AT_INDEX = (
+        'CREATE INDEX IF NOT EXISTS "Leaderboard_updatedAt_idx" ON "Leaderboard"("updatedAt")'
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(self.UPDATED_AT_INDEX)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Tuple[str, Optional[str], int]]:
+        """One learner's (displayName, photoURL, totalXP), or None without a row."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT displayName, photoURL, totalXP FROM "Leaderboard" WHERE userId = ?',
+                (user_id,),
+            ).fetchone()
+
+    def changed_since(self, updated_at: int) -> List[Tuple[str, str, Optional[str], int, int]]:
+        """Rows (userId, displayName, photoURL, totalXP, updatedAt) updated after `updated_at`."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT userId, displayName, photoURL, totalXP, updatedAt FROM "Leaderboard" '
+                "WHERE updatedAt > ?",
+                (updated_at,),
+            ).fetchall()
+
+    def write_ranks(self, ranks: Iterable[Tuple[int, str]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    'UPDATE "Leaderboard" SET rank = ? WHERE userId = ?', ranks
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class Leaderboard:
+    """
+    Thread-safe rank index plus its sync with the Leaderboard table.
+
+    Profiles (display name, photo) are kept only for learners that came from
+    the table; ones only seen through xpAwarded show as "Anonymous" until
+    the next sync brings their row.
+    """
+
+    def __init__(
+        self,
+        table: Optional[LeaderboardTable] = None,
+        ranked_rows: int = 100,
+        max_xp: int = 1 << 20,
+    ):
+        self.table = table
+        self.ranked_rows = ranked_rows
+        self.index = RankIndex(max_xp)
+        self._profiles: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._dirty: Set[str] = set()
+        self._synced_at = -1
+        self._lock = threading.Lock()
+        self.awards = 0
+        self.syncs = 0
+        self.ranks_written = 0
+        LEADERBOARD_USERS.set_function(lambda: len(self.index))
+
+    def award(self, user_id: str, xp: int) -> None:
+        """
+        Apply one xpAwarded event.
+
+        A learner the index hasn't seen yet starts from their stored total,
+        which is read from the table (blocking; call it in a thread).
+        """
+        if not xp:
+            return
+        stored = None
+        if self.table is not None and self.index.get(user_id) is None:
+            try:
+                stored = self.table.get(user_id)
+            except sqlite3.Error as e:
+                logger.warning("could not read a leaderboard row", exc_info=e)
+        with self._lock:
+            if stored is not None and self.index.get(user_id) is None:
+                self._profiles[user_id] = (stored[0], stored[1])
+                self.index.set(user_id, stored[2])
+            self.index.add(user_id, xp)
+            self._dirty.add(user_id)
+            self.awards += 1
+
+    def rank(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            xp = self.index.get(user_id)
+            if xp is None:
+                return None
+            rank = self.index.rank(user_id)
+            users = len(self.index)
+        return {"userId": user_id, "totalXP": xp, "level": level_for(xp), "rank": rank, "users": users}
+
+    def top(self, k: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.index.top(k)
+            profiles = [self._profiles.get(user_id, ("Anonymous", None)) for user_id, _, _ in rows]
+        return [
+            {
+                "userId": user_id,
+                "displayName": name,
+                "photoURL": photo,
+                "totalXP": xp,
+                "level": level_for(xp),
+                "rank": rank,
+            }
+            for (user_id, xp, rank), (name, photo) in zip(rows, profiles)
+        ]
+
+    def sync(self) -> int:
+        """
+        Pull rows changed since the last sync, then write ranks back.
+
+        Blocking; run it in a thread. Returns the number of rows pulled.
+        """
+        if self.table is None:
+            return 0
+        start = time.perf_counter()
+        # Prisma stores DateTime as ms since the epoch. Rows committed late
+        # with an older updatedAt are caught by re-reading the last couple
+        # of seconds; re-reading a row is harmless
+        read_at = int(time.time() * 1000) - SYNC_OVERLAP_MS
+        try:
+            rows = self.table.changed_since(self._synced_at)
+        except sqlite3.Error as e:
+            logger.warning("could not read the leaderboard table", exc_info=e)
+            return 0
+        # The first sync is the initial load; only the top rows get ranks
+        initial = self.syncs == 0
+        with self._lock:
+            for user_id, name, photo, xp, updated_at in rows:
+                self._profiles[user_id] = (name, photo)
+                if self.index.set(user_id, xp) and not initial:
+                    self._dirty.add(user_id)
+                self._synced_at = max(self._synced_at, min(updated_at, read_at))
+            dirty, self._dirty = self._dirty, set()
+            ranks = {user_id: rank for user_id, _, rank in self.index.top(self.ranked_rows)}
+            for user_id in dirty:
+                rank = self.index.rank(user_id)
+                if rank is not None:
+                    ranks[user_id] = rank
+        try:
+            self.table.write_ranks([(rank, user_id) for user_id, rank in ranks.items()])
+        except sqlite3.Error as e:
+            with self._lock:
+                self._dirty |= dirty
+            logger.warning("could not write leaderboard ranks", exc_info=e)
+        else:
+            self.ranks_written += len(ranks)
+        self.syncs += 1
+        LEADERBOARD_SYNC_SECONDS.observe(time.perf_counter() - start)
+        return len(rows)
+
+    async def run_sync(self, interval: float) -> None:
+        """Sync every `interval` seconds until cancelled (started from the app lifespan)."""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.sync)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            users = len(self.index)
+            dirty = len(self._dirty)
+        return {
+            "users": users,
+            "persistent": self.table is not None,
+            "awards": self.awards,
+            "pendingRanks": dirty,
+            "syncs": self.syncs,
+            "ranksWritten": self.ranks_written,
+        }
+
+
+def leaderboard_from_env() -> Leaderboard:
+    """Build the leaderboard from LEADERBOARD_* settings."""
+    path = os.getenv("LEADERBOARD_DB_PATH") or os.getenv("SESSION_DB_PATH")
+    table = None
+    if path:
+        try:
+            table = LeaderboardTable(path)
+        except sqlite3.Error as e:
+            logger.warning("leaderboard persistence disabled", exc_info=e)
+    return Leaderboard(
+        table,
+        ranked_rows=int(os.getenv("LEADERBOARD_RANKED_ROWS", 100)),
+        max_xp=int(os.getenv("LEADERBOARD_MAX_XP", 1 << 20)),
+    )
+
+
+_leaderboard: Optional[Leaderboard] = None
+
+
+def get_leaderboard() -> Leaderboard:
+    """Return the process-wide leaderboard, creating it on first use."""
+    global _leaderboard
+    if _leaderboard is None:
+        _leaderboard = leaderboard_from_env()
+    return _leaderboard
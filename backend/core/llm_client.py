@@ -0,0 +1,422 @@
+"""
+Shared LLM client
+
+One configured client per process, shared by the tutor and the quiz router
+through FastAPI dependencies. The provider (Gemini, Groq or the offline stub,
+see core/providers.py) is built once, which avoids the configure/construct/
+connect churn of building a model per request.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional
+
+from .metrics import counter, gauge
+from .providers import create_provider, provider_class
+from .resilience import RETRIES, RETRYABLE_KINDS, CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+LLM_ERRORS = counter(
+    "sortcrates_llm_errors_total",
+    "Failed LLM calls by error kind",
+    ("kind",),
+)
+LLM_IN_FLIGHT = gauge("sortcrates_llm_in_flight", "LLM calls currently running")
+LLM_WAITING = gauge("sortcrates_llm_waiting", "Requests waiting for an LLM slot")
+LLM_TOKENS = counter(
+    "sortcrates_llm_tokens_total",
+    "Tokens reported by the provider, by provider and direction",
+    ("provider", "direction"),
+)
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Bucket a provider error: circuit_open, rate_limit, timeout, network,
+    unavailable or unknown.
+    """
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    error_str = str(error).lower()
+    if "quota" in error_str or "rate limit" in error_str or "429" in error_str:
+        return "rate_limit"
+    if "timeout" in error_str or "deadline" in error_str:
+        return "timeout"
+    if "network" in error_str or "connection" in error_str:
+        return "network"
+    if "503" in error_str or "unavailable" in error_str or "overloaded" in error_str:
+        return "unavailable"
+    return "unknown"
+
+
+class ModelClient:
+    """
+    Process-wide LLM client with bounded concurrency and latency stats.
+
+    At most max_concurrency calls are in flight; the rest wait without
+    blocking the event loop. Every call goes through the retry policy
+    (per-attempt deadline, jittered backoff for retryable errors) and the
+    circuit breaker. The provider comes from `provider` (or LLM_PROVIDER);
+    pass `model` to inject a stand-in (anything with generate_content)
+    instead.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        model: Any = None,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        provider: Optional[str] = None,
+    ):
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+        self.provider = (provider or os.getenv("LLM_PROVIDER", "gemini")).lower()
+        cls = provider_class(self.provider)
+        self.model_name = model_name or os.getenv("LLM_MODEL") or cls.default_model
+        self.api_key = api_key if api_key is not None else cls.key_from_env()
+        self.max_concurrency = max_concurrency
+        self._model = model
+        self.retry = retry or RetryPolicy.from_env()
+        self.breaker = breaker or CircuitBreaker.from_env()
+        self._init_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="llm"
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=1024)
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.waiting = 0
+        self.warmed_up_at: Optional[float] = None
+        LLM_IN_FLIGHT.set_function(lambda: self.in_flight)
+        LLM_WAITING.set_function(lambda: self.waiting)
+
+    @property
+    def configured(self) -> bool:
+        """True when there is something to call (an injected model, or a provider with its key)."""
+        return self._model is not None or provider_class(self.provider).is_configured(self.api_key)
+
+    @property
+    def model(self) -> Any:
+        """The underlying provider, configured on first use."""
+        if self._model is None:
+            with self._init_lock:
+                if self._model is None:
+                    self._model = create_provider(self.provider, self.model_name, self.api_key)
+        return self._model
+
+    @model.setter
+    def model(self, model: Any) -> None:
+        self._model = model
+
+    def warm_up(self) -> None:
+        """Configure the client once at startup instead of on the first request."""
+        _ = self.model
+        self.warmed_up_at = time.time()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self) -> float:
+        with self._stats_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def _finish(self, started: float, error: Optional[BaseException]) -> None:
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.calls += 1
+            if isinstance(error, Exception):
+                self.errors += 1
+            self._latencies.append(elapsed)
+        if isinstance(error, Exception):
+            LLM_ERRORS.inc(kind=classify_error(error))
+
+    def _request_kwargs(self, **kwargs: Any) -> Dict[str, Any]:
+        # Providers enforce the deadline on their own connection too
+        if self.retry.timeout and getattr(self._model, "supports_timeout", False):
+            kwargs["timeout"] = self.retry.timeout
+        return kwargs
+
+    def _record_usage(self, response: Any) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+        output_tokens = getattr(usage, "candidates_token_count", None) or 0
+        with self._stats_lock:
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+        LLM_TOKENS.inc(prompt_tokens, provider=self.provider, direction="input")
+        LLM_TOKENS.inc(output_tokens, provider=self.provider, direction="output")
+
+    def _call(self, prompt: str) -> Any:
+        """One blocking attempt, no retry."""
+        started = self._start()
+        error = None
+        try:
+            response = self.model.generate_content(prompt, **self._request_kwargs())
+            self._record_usage(response)
+            return response
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(started, error)
+
+    def _record_outcome(self, error: Optional[BaseException]) -> Optional[str]:
+        """Report an attempt to the breaker; returns the error kind, if any."""
+        if error is None:
+            self.breaker.record_success()
+            return None
+        kind = classify_error(error)
+        if kind in RETRYABLE_KINDS:
+            self.breaker.record_failure()
+        else:
+            # The provider answered; the request itself was bad
+            self.breaker.release()
+        return kind
+
+    def _should_retry(self, kind: str, attempt: int) -> bool:
+        if not self.retry.should_retry(kind, attempt):
+            return False
+        RETRIES.inc(kind=kind)
+        return True
+
+    def generate(self, prompt: str) -> Any:
+        """
+        Blocking call with retry and the breaker; prefer generate_async from
+        request handlers.
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = self._call(prompt)
+            except Exception as e:
+                kind = self._record_outcome(e)
+                if not self._should_retry(kind, attempt):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            self._record_outcome(None)
+            return response
+
+    async def _acquire(self) -> None:
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    async def _attempt_async(self, prompt: str) -> Any:
+        await self._acquire()
+        try:
+            generate_async = getattr(self.model, "generate_content_async", None)
+            if generate_async is not None:
+                started = self._start()
+                error = None
+                try:
+                    response = await asyncio.wait_for(
+                        generate_async(prompt, **self._request_kwargs()), self.retry.timeout
+                    )
+                    self._record_usage(response)
+                    return response
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    self._finish(started, error)
+            # A timed-out executor call keeps its thread until the provider's own
+            # request timeout fires, but the request stops waiting on it
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, self._call, prompt), self.retry.timeout
+            )
+        finally:
+            self._semaphore.release()
+
+    async def generate_async(self, prompt: str) -> Any:
+        """
+        Run one call without blocking the event loop.
+
+        Uses the model's native coroutine when it has one, otherwise runs the
+        blocking call on the bounded executor. Backoff sleeps don't hold a
+        concurrency slot.
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = await self._attempt_async(prompt)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                kind = self._record_outcome(e)
+                if not self._should_retry(kind, attempt):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            self._record_outcome(None)
+            return response
+
+    async def _stream_attempt(self, prompt: str) -> AsyncIterator[Any]:
+        await self._acquire()
+        started = self._start()
+        error = None
+        timeout = self.retry.timeout
+        try:
+            generate_async = getattr(self.model, "generate_content_async", None)
+            if generate_async is not None:
+                response = await asyncio.wait_for(
+                    generate_async(prompt, stream=True, **self._request_kwargs()), timeout
+                )
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        return
+                    yield chunk
+
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            done = object()
+
+            def produce():
+                try:
+                    for chunk in self.model.generate_content(
+                        prompt, stream=True, **self._request_kwargs()
+                    ):
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+            loop.run_in_executor(self._executor, produce)
+            while True:
+                # The deadline applies to each gap between chunks
+                item = await asyncio.wait_for(queue.get(), timeout)
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(started, error)
+            self._semaphore.release()
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[Any]:
+        """
+        Yield response chunks from a streaming call as they arrive.
+
+        Blocking models are iterated on the bounded executor and their chunks
+        handed back to the event loop through a queue. A failed attempt is
+        only retried if no chunk has been yielded yet.
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            yielded = False
+            last = None
+            try:
+                async for chunk in self._stream_attempt(prompt):
+                    yielded = True
+                    last = chunk
+                    yield chunk
+            except Exception as e:
+                kind = self._record_outcome(e)
+                if yielded or not self._should_retry(kind, attempt):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled or closed by the consumer
+                self.breaker.release()
+                raise
+            # Usage on the last chunk covers the whole response
+            self._record_usage(last)
+            self._record_outcome(None)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            calls, errors = self.calls, self.errors
+            in_flight, max_in_flight = self.in_flight, self.max_in_flight
+            prompt_tokens, output_tokens = self.prompt_tokens, self.output_tokens
+        input_price, output_price = getattr(self._model, "prices", (0.0, 0.0))
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "provider": self.provider,
+            "model": self.model_name,
+            "warmedUp": self.warmed_up_at is not None,
+            "maxConcurrency": self.max_concurrency,
+            "inFlight": in_flight,
+            "maxInFlight": max_in_flight,
+            "waiting": self.waiting,
+            "calls": calls,
+            "errors": errors,
+            "breaker": self.breaker.stats(),
+            "latencyMs": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            },
+            "tokens": {"input": prompt_tokens, "output": output_tokens},
+            "estimatedCostUsd": round(
+                (prompt_tokens * input_price + output_tokens * output_price) / 1e6, 6
+            ),
+        }
+
+
+_client: Optional[ModelClient] = None
+_client_lock = threading.Lock()
+
+
+def get_model_client() -> ModelClient:
+    """FastAPI dependency returning the process-wide client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelClient()
+    return _client
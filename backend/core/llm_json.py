@@ -0,0 +1,305 @@
+"""
+JSON helpers for LLM output
+
+- extract_json_object: finds the first JSON object in the raw text (skipping
+  fences and prose). Well-formed objects are decoded in place; otherwise one
+  scan that respects strings and escapes drops trailing commas and, if the
+  output was cut off, closes it at the last complete value
+- parse_llm_json: extraction plus Pydantic validation; fields that fail
+  validation fall back to their defaults instead of failing the whole reply
+- StreamingFieldExtractor: pulls one string field out while tokens stream in
+"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from .metrics import counter
+
+LLM_JSON = counter(
+    "sortcrates_llm_json_total",
+    "LLM JSON parses by schema and outcome (clean, repaired, partial, failed)",
+    ("schema", "outcome"),
+)
+
+# Give up after this many '{' that don't start a parseable object
+MAX_CANDIDATES = 8
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+_DECODER = json.JSONDecoder()
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+class LLMJSONError(json.JSONDecodeError):
+    """No usable JSON object in the model output (still a JSONDecodeError)."""
+
+
+class ExtractedJSON(NamedTuple):
+    value: Dict[str, Any]
+    # Trailing commas removed or the object was closed after a cut-off
+    repaired: bool
+    # Output was cut off; value only holds the fields that were complete
+    partial: bool
+
+
+def _scan_object(text: str, start: int) -> Tuple[str, bool, bool]:
+    """
+    Scan one object starting at text[start] == "{".
+
+    Returns:
+        Tuple of (object text, repaired, partial)
+    """
+    stack: List[str] = []
+    # Per open container: True while an object expects a key next
+    expect_key: List[bool] = []
+    skip: List[int] = []
+    in_string = False
+    escape = False
+    string_is_key = False
+    pending_comma = -1
+    # (end position, open containers, skipped commas) after the last complete value
+    safe: Tuple[int, Tuple[str, ...], int] = (start + 1, ("{",), 0)
+    i = start
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if not string_is_key:
+                    safe = (i + 1, tuple(stack), len(skip))
+            i += 1
+            continue
+        if ch in " \t\r\n":
+            i += 1
+            continue
+        if pending_comma >= 0 and ch not in "}]":
+            pending_comma = -1
+        if ch == '"':
+            in_string = True
+            string_is_key = bool(expect_key) and expect_key[-1]
+        elif ch in "{[":
+            stack.append(ch)
+            expect_key.append(ch == "{")
+            safe = (i + 1, tuple(stack), len(skip))
+        elif ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                raise LLMJSONError("Mismatched bracket", text, i)
+            if pending_comma >= 0:
+                skip.append(pending_comma)
+                pending_comma = -1
+            stack.pop()
+            expect_key.pop()
+            if not stack:
+                return _without(text, start, i + 1, skip), bool(skip), False
+            safe = (i + 1, tuple(stack), len(skip))
+        elif ch == ",":
+            pending_comma = i
+            if stack[-1] == "{":
+                expect_key[-1] = True
+            else:
+                safe = (i, tuple(stack), len(skip))
+        elif ch == ":":
+            expect_key[-1] = False
+        else:
+            # Bare literal (number, true, false, null): runs to the next delimiter
+            j = i
+            while j < n and text[j] not in ",}] \t\r\n":
+                j += 1
+            if j < n:
+                safe = (j, tuple(stack), len(skip))
+            i = j
+            continue
+        i += 1
+
+    # Cut off: close everything that was open after the last complete value
+    end, open_containers, skipped = safe
+    body = _without(text, start, end, skip[:skipped])
+    closing = "".join(_CLOSERS[c] for c in reversed(open_containers))
+    return body + closing, True, True
+
+
+def _without(text: str, start: int, end: int, skip: List[int]) -> str:
+    if not skip:
+        return text[start:end]
+    parts = []
+    prev = start
+    for pos in skip:
+        parts.append(text[prev:pos])
+        prev = pos + 1
+    parts.append(text[prev:end])
+    return "".join(parts)
+
+
+def extract_json_object(text: str) -> ExtractedJSON:
+    """
+    Find and parse the first JSON object in raw model output.
+
+    Markdown fences and prose around the object are skipped without building
+    intermediate strings; '{' characters in prose that don't start an object
+    are passed over.
+
+    Raises:
+        LLMJSONError: If no object can be recovered
+    """
+    start = text.find("{")
+    candidates = 0
+    while start != -1 and candidates < MAX_CANDIDATES:
+        candidates += 1
+        # Fast path: a well-formed object parses in C and trailing text is ignored
+        try:
+            value, _ = _DECODER.raw_decode(text, start)
+            if isinstance(value, dict):
+                return ExtractedJSON(value, False, False)
+        except ValueError:
+            pass
+        try:
+            body, repaired, partial = _scan_object(text, start)
+            value = json.loads(body)
+            if isinstance(value, dict):
+                return ExtractedJSON(value, repaired, partial)
+        except ValueError:
+            pass
+        start = text.find("{", start + 1)
+    raise LLMJSONError("No JSON object in model output", text, 0)
+
+
+def parse_llm_json(text: str, model: Type[Model], schema: str) -> Tuple[Model, ExtractedJSON]:
+    """
+    Extract the first JSON object and validate it against `model`.
+
+    Fields that fail validation are dropped so the model's defaults apply;
+    only output with none of the model's fields is rejected.
+
+    Args:
+        text: Raw model output
+        model: Pydantic model whose fields all have defaults
+        schema: Label for the parse metrics (e.g. "chat", "quiz")
+
+    Raises:
+        LLMJSONError: If no object can be recovered or it has none of the fields
+    """
+    try:
+        extracted = extract_json_object(text)
+    except LLMJSONError:
+        LLM_JSON.inc(schema=schema, outcome="failed")
+        raise
+
+    data = {k: v for k, v in extracted.value.items() if k in model.model_fields}
+    if not data:
+        LLM_JSON.inc(schema=schema, outcome="failed")
+        raise LLMJSONError(f"JSON object has no {model.__name__} fields", text, 0)
+    try:
+        parsed = model.model_validate(data)
+        dropped = False
+    except ValidationError as e:
+        for error in e.errors():
+            if error["loc"]:
+                data.pop(error["loc"][0], None)
+        parsed = model.model_validate(data)
+        dropped = True
+
+    if extracted.partial or dropped:
+        outcome = "partial"
+    elif extracted.repaired:
+        outcome = "repaired"
+    else:
+        outcome = "clean"
+    LLM_JSON.inc(schema=schema, outcome=outcome)
+    return parsed, extracted._replace(partial=extracted.partial or dropped)
+
+
+class StreamingFieldExtractor:
+    """
+    Pull one top-level string field out of a JSON object as it streams in.
+
+    Feed it raw model output chunk by chunk; feed() returns whatever new,
+    already-unescaped text of the target field arrived in that chunk. The
+    scanner tracks nesting and string state, so the same key inside a nested
+    object or inside another string value is ignored, and escape sequences
+    split across chunks are held back until complete.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape: Optional[str] = None
+        self._high_surrogate: Optional[str] = None
+        self._expect_key = False
+        self._is_key = False
+        self._streaming = False
+        self._chars: List[str] = []
+        self._last_key: Optional[str] = None
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        out: List[str] = []
+        for ch in chunk:
+            if self._in_string:
+                self._string_char(ch, out)
+                if self.done:
+                    break
+            elif ch == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._expect_key
+                self._streaming = (
+                    self._depth == 1 and not self._is_key and self._last_key == self.field
+                )
+                self._chars = []
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_key = ch == "{" and self._depth == 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1:
+                if ch == ",":
+                    self._expect_key = True
+                elif ch == ":":
+                    self._expect_key = False
+        return "".join(out)
+
+    def _emit(self, text: str, out: List[str]) -> None:
+        if self._streaming:
+            out.append(text)
+        elif self._is_key:
+            self._chars.append(text)
+
+    def _string_char(self, ch: str, out: List[str]) -> None:
+        if self._escape is not None:
+            self._escape += ch
+            if self._escape[1] == "u" and len(self._escape) < 6:
+                return
+            seq, self._escape = self._escape, None
+            if self._high_surrogate is not None:
+                seq, self._high_surrogate = self._high_surrogate + seq, None
+            elif seq[1] == "u" and 0xD800 <= int(seq[2:], 16) <= 0xDBFF:
+                # Wait for the low half of a surrogate pair
+                self._high_surrogate = seq
+                return
+            try:
+                self._emit(json.loads(f'"{seq}"'), out)
+            except ValueError:
+                self._emit(seq, out)
+            return
+        if ch == "\\":
+            self._escape = ch
+        elif ch == '"':
+            self._in_string = False
+            if self._is_key:
+                self._last_key = "".join(self._chars)
+            elif self._streaming:
+                self.done = True
+            self._streaming = False
+            self._is_key = False
+        else:
+            self._emit(ch, out)
@@ -0,0 +1,38 @@
+"""
+Pydantic models for what the LLM is asked to return
+
+Every field has a default so parse_llm_json can keep the valid parts of a
+reply and fill in the rest.
+"""
+
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+from .quiz_feedback import DEFAULT_FEEDBACK
+
+DEFAULT_QUESTION = "Great observation! Can you explain your reasoning further?"
+
+
+class TutorOutput(BaseModel):
+    socraticQuestion: str = Field(DEFAULT_QUESTION, min_length=1)
+    analysisOfUserAnswer: Literal["correct", "partial", "incorrect", "continuing"] = "continuing"
+    learnerMasteryUpdate: Dict[str, float] = {}
+    visualizerStateUpdate: Dict[str, Any] = {"focusIndices": [], "state": "idle"}
+    xpAwarded: int = 0
+
+    @field_validator("analysisOfUserAnswer", mode="before")
+    @classmethod
+    def _normalize_analysis(cls, value: Any) -> Any:
+        # Models sometimes echo the whole "correct | partial | ..." hint or capitalize
+        if isinstance(value, str):
+            return value.split("|")[0].strip().lower()
+        return value
+
+
+class QuizFeedbackOutput(BaseModel):
+    feedback: str = Field(DEFAULT_FEEDBACK, min_length=1)
+    # The model's own grading is ignored; scoring is deterministic
+    score: Optional[int] = None
+    skillLevel: Optional[str] = None
+    questionScores: Optional[List[int]] = None
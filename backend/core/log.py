@@ -0,0 +1,186 @@
+"""
+Structured logging for the backend
+
+- JSON (or plain text) records with a per-request id
+- per-field truncation so learner content never floods the logs
+- sampling for debug payloads (chat history, raw model output)
+- a queue handler: request handlers only enqueue records, a background
+  thread does the console I/O
+
+Settings:
+    LOG_LEVEL               INFO
+    LOG_FORMAT              "json" or "text" (json)
+    LOG_FIELD_MAX_CHARS     max characters per logged field (200)
+    LOG_DEBUG_SAMPLE_RATE   fraction of debug payloads that are kept (0.01)
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Any, Dict, Optional
+
+ROOT_LOGGER = "sortcrates"
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.01))
+
+
+def _truncate(value: Any, limit: int) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= limit else value[:limit] + f"...(+{len(value) - limit})"
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return _truncate(json.dumps(value, default=str), limit)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and fields."""
+
+    def __init__(self, field_limit: int = 200):
+        super().__init__()
+        self.field_limit = field_limit
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["requestId"] = request_id
+        for key, value in getattr(record, "fields", {}).items():
+            entry[key] = _truncate(value, self.field_limit)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable variant for local development."""
+
+    def __init__(self, field_limit: int = 200):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+        self.field_limit = field_limit
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            line += f" request_id={request_id}"
+        for key, value in getattr(record, "fields", {}).items():
+            line += f" {key}={_truncate(value, self.field_limit)}"
+        return line
+
+
+class _RequestIdFilter(logging.Filter):
+    # Runs on the calling thread, before the record is queued, so the
+    # contextvar still holds the right request id
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback now, but keep the structured
+        # fields for the formatter on the writer thread
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging() -> None:
+    """Route the backend's loggers through a queue to a background writer. Idempotent."""
+    global _listener, _debug_sample_rate
+    if _listener is not None:
+        return
+    _debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.01))
+
+    field_limit = int(os.getenv("LOG_FIELD_MAX_CHARS", 200))
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter: logging.Formatter = TextFormatter(field_limit)
+    else:
+        formatter = JsonFormatter(field_limit)
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, console)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def _restart_in_child() -> None:
+    """Give a forked worker (preloaded gunicorn) its own queue and writer thread."""
+    global _listener
+    if _listener is None:
+        return
+    # Threads don't survive fork, so the inherited listener would never drain
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in logging.getLogger(ROOT_LOGGER).handlers:
+        if isinstance(handler, _QueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the backend's root, e.g. get_logger("tutor")."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def log_fields(logger: logging.Logger, level: int, msg: str, **fields: Any) -> None:
+    """Log a message with structured fields (each truncated by the formatter)."""
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={"fields": fields})
+
+
+def debug_payload(logger: logging.Logger, msg: str, **fields: Any) -> None:
+    """
+    Log a debug payload for a sampled fraction of calls.
+
+    Cheap when DEBUG is off: returns before looking at the fields.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= _debug_sample_rate:
+        return
+    logger.debug(msg, extra={"fields": fields})
+
+
+def new_request_id() -> str:
+    return f"{int(time.time() * 1000):x}-{random.getrandbits(32):08x}"
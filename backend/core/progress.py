@@ -0,0 +1,599 @@
+"""
+Write-behind persistence of learner progress
+
+Every tutor turn carries xpAwarded and learnerMasteryUpdate. Writing each
+one straight to the Profile row costs a transaction per message, including
+a read-modify-write of the whole mastery JSON. Instead turns are:
+
+1. appended to a per-process delta log (one JSON line, no transaction)
+2. coalesced in memory per learner: XP deltas add up, mastery keys keep
+   their latest value
+3. written every PROGRESS_FLUSH_INTERVAL seconds, or once
+   PROGRESS_FLUSH_TURNS turns are pending, in one WAL-mode transaction that
+   updates Profile (xp, level, XP badges, mastery merged with json_patch,
+   lastActive) and Leaderboard (totalXP, level) for every learner in the
+   batch
+
+XP badges are awarded in that same UPDATE, so they can't trail the XP they
+depend on. For the "new badge" notification, record() projects the
+learner's total (stored XP, read once, plus what is pending) and returns
+the milestones the turn crosses; with several workers a learner's turns
+on another worker aren't in the projection, so a notification can come a
+turn late.
+
+Flushing rotates the log into a numbered segment first. Each batch inserts
+a row with a fresh id into ProgressBatch inside its transaction; just
+before COMMIT that id is appended to the segment as a commit record and
+fsynced, and the segment is deleted after COMMIT. On startup, segments
+left by a crashed process are checked against the database: if the
+batch's ProgressBatch row exists the transaction went through and the
+segment (and any older one, folded into the same batch) is dropped;
+otherwise its turns are replayed as deltas. Markers are pruned after
+PROGRESS_BATCH_RETENTION_DAYS. Each process owns its log files
+through a lock file, so with several workers only dead processes' logs are
+recovered (without fcntl, i.e. on Windows, every leftover log is treated
+as dead).
+
+When this is on, /chat answers carry X-Progress-Persisted: true and the
+Next.js route leaves XP and mastery to the backend.
+
+Settings:
+    PROGRESS_DB_PATH          Prisma SQLite database (unset = off; Next.js writes progress)
+    PROGRESS_LOG_DIR          delta logs (progress-log next to the database)
+    PROGRESS_FLUSH_INTERVAL   seconds between flushes (2)
+    PROGRESS_FLUSH_TURNS      pending turns that trigger an early flush (500)
+    PROGRESS_LOG_FSYNC        fsync the log on every turn, not just on flush (false)
+    PROGRESS_BATCH_RETENTION_DAYS  days commit markers are kept for recovery (7)
+"""
+
+import asyncio
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .leaderboard import level_for
+from .log import get_logger
+from .metrics import counter, histogram
+
+logger = get_logger("progress")
+
+PROGRESS_TURNS = counter("sortcrates_progress_turns_total", "Turns recorded for write-behind")
+PROGRESS_FLUSH_SECONDS = histogram(
+    "sortcrates_progress_flush_seconds",
+    "Time to write one batch of learner progress",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# Mirrors xpMilestones in app/api/chat/send/route.ts
+XP_BADGES = (
+    (100, "xp-100"), (200, "xp-200"), (400, "xp-400"), (600, "xp-600"),
+    (800, "xp-800"), (1000, "xp-1000"), (1500, "xp-1500"), (2000, "xp-2000"),
+)
+
+# Learners whose stored totals are kept for badge projection
+KNOWN_LEARNERS = 10_000
+
+
+def xp_badges(badges: Optional[str], xp: int) -> str:
+    """Profile.badges (JSON list) with every XP milestone up to `xp` added."""
+    try:
+        earned = json.loads(badges or "[]")
+        if not isinstance(earned, list):
+            earned = []
+    except ValueError:
+        earned = []
+    earned += [badge for threshold, badge in XP_BADGES if xp >= threshold and badge not in earned]
+    return json.dumps(earned)
+
+
+# A batch's commit record: {"batch": ProgressBatch id, "at": ms timestamp}
+CommitRecord = Dict[str, Any]
+
+# Same DDL `prisma db push` generates for the ProgressBatch model
+PROGRESS_BATCH_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS "ProgressBatch" ('
+    '"id" TEXT NOT NULL PRIMARY KEY, "committedAt" DATETIME NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS "ProgressBatch_committedAt_idx" '
+    'ON "ProgressBatch"("committedAt")',
+)
+
+
+class ProgressDelta:
+    """Coalesced progress for one learner since the last flush."""
+
+    __slots__ = ("xp", "mastery", "turns", "last_active")
+
+    def __init__(self):
+        self.xp = 0
+        self.mastery: Dict[str, float] = {}
+        self.turns = 0
+        self.last_active = 0
+
+    def add(self, xp: int, mastery: Dict[str, float], at: int) -> None:
+        self.xp += xp
+        self.mastery.update(mastery)
+        self.turns += 1
+        self.last_active = max(self.last_active, at)
+
+    def merge_older(self, older: "ProgressDelta") -> None:
+        """Fold in a batch that was taken before this one but not written."""
+        self.xp += older.xp
+        self.mastery = {**older.mastery, **self.mastery}
+        self.turns += older.turns
+        self.last_active = max(self.last_active, older.last_active)
+
+
+class DeltaLog:
+    """
+    Append-only JSON-lines log of one process's turns, rotated on flush.
+
+    Files: progress-<pid>.lock (held while the process lives),
+    progress-<pid>.log (active) and progress-<pid>.log.<n> (segments, oldest
+    first). Flushes are serialized, so a segment without a commit record
+    that is older than one with a commit record was folded into that
+    commit.
+    """
+
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.prefix = os.path.join(directory, f"progress-{os.getpid()}")
+        self._lock_file = open(self.prefix + ".lock", "a")
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._file: Optional[IO[str]] = None
+        self._sequence = 0
+
+    def _open(self) -> IO[str]:
+        if self._file is None:
+            self._file = open(self.prefix + ".log", "a", encoding="utf-8")
+        return self._file
+
+    def _next_segment(self) -> str:
+        while True:
+            self._sequence += 1
+            segment = f"{self.prefix}.log.{self._sequence}"
+            if not os.path.exists(segment):
+                return segment
+
+    def append(self, user_id: str, xp: int, mastery: Dict[str, float], at: int) -> None:
+        f = self._open()
+        f.write(json.dumps({"u": user_id, "x": xp, "m": mastery, "t": at}, separators=(",", ":")) + "\n")
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def rotate(self) -> str:
+        """Close the active log and rename it to the next segment (empty if there was none)."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        segment = self._next_segment()
+        try:
+            os.replace(self.prefix + ".log", segment)
+        except FileNotFoundError:
+            open(segment, "a").close()
+        return segment
+
+    def adopt(self, path: str) -> str:
+        """Move another (dead) process's segment under our own lock."""
+        segment = self._next_segment()
+        os.replace(path, segment)
+        return segment
+
+    @staticmethod
+    def mark_committing(segment: str, record: CommitRecord) -> None:
+        with open(segment, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"commit": record}, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def discard(segment: str) -> None:
+        try:
+            os.remove(segment)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _files(prefix: str) -> List[str]:
+        segments = sorted(
+            glob.glob(prefix + ".log.*"), key=lambda path: int(path.rsplit(".", 1)[1])
+        )
+        if os.path.exists(prefix + ".log"):
+            segments.append(prefix + ".log")
+        return segments
+
+    def orphans(self) -> Iterator[List[str]]:
+        """
+        Yield the log files of each process that is gone, oldest first,
+        while holding its lock; our own pid's leftovers come first. The
+        caller discards or adopts every file it is given.
+        """
+        own = self._files(self.prefix)
+        self._sequence = max((int(path.rsplit(".", 1)[1]) for path in own if path[-1].isdigit()), default=0)
+        if own:
+            yield own
+        for lock_path in sorted(glob.glob(os.path.join(self.directory, "progress-*.lock"))):
+            prefix = lock_path[: -len(".lock")]
+            if prefix == self.prefix:
+                continue
+            with open(lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        # Alive
+                        continue
+                files = self._files(prefix)
+                if files:
+                    yield files
+                if not self._files(prefix):
+                    self.discard(lock_path)
+
+    @staticmethod
+    def read(path: str) -> Tuple[List[Dict[str, Any]], Optional[CommitRecord]]:
+        """Turn records and the commit record (if any) of a log file."""
+        records, commit = [], None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+                if "commit" in entry:
+                    commit = entry["commit"]
+                else:
+                    records.append(entry)
+        return records, commit
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.discard(self.prefix + ".lock")
+        self._lock_file.close()
+
+
+class ProfileTable:
+    """
+    Batched writes to the Prisma Profile and Leaderboard tables.
+
+    Statements are fixed strings run through executemany/execute on one
+    connection, so sqlite3 prepares each once and reuses it.
+    """
+
+    UPDATE_PROFILE = (
+        'UPDATE "Profile" SET xp = xp + ?, level = level_for(xp + ?), '
+        "mastery = json_patch(CASE WHEN json_valid(mastery) THEN mastery ELSE '{}' END, ?), "
+        "badges = xp_badges(badges, xp + ?), lastActive = MAX(lastActive, ?), updatedAt = ? "
+        "WHERE userId = ? RETURNING userId, xp, badges"
+    )
+    SELECT_TOTALS = 'SELECT xp, badges FROM "Profile" WHERE userId = ?'
+    UPSERT_LEADERBOARD = (
+        'INSERT INTO "Leaderboard" (id, userId, displayName, photoURL, totalXP, level, updatedAt) '
+        "SELECT ?, id, COALESCE(displayName, 'Anonymous'), photoURL, ?, level_for(?), ? "
+        'FROM "User" WHERE id = ? '
+        "ON CONFLICT(userId) DO UPDATE SET totalXP = excluded.totalXP, "
+        "level = excluded.level, updatedAt = excluded.updatedAt"
+    )
+
+    INSERT_BATCH = 'INSERT INTO "ProgressBatch" (id, committedAt) VALUES (?, ?)'
+    PRUNE_BATCHES = 'DELETE FROM "ProgressBatch" WHERE committedAt < ?'
+
+    def __init__(self, path: str, retention_days: float = 7.0):
+        self.path = path
+        self.retention_ms = int(retention_days * 86_400_000)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in PROGRESS_BATCH_SCHEMA:
+            self._conn.execute(statement)
+        self._conn.create_function("level_for", 1, level_for, deterministic=True)
+        self._conn.create_function("xp_badges", 2, xp_badges, deterministic=True)
+        self._lock = threading.Lock()
+
+    def apply(self, batch: Dict[str, ProgressDelta], before_commit) -> Dict[str, Tuple[int, str]]:
+        """
+        Add a batch of deltas in one transaction; returns each written
+        learner's new (xp, badges JSON).
+
+        `before_commit(record)` runs inside the transaction with its commit
+        record (learners without a Profile row are skipped).
+        """
+        now = int(time.time() * 1000)
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                totals: Dict[str, Tuple[int, str]] = {}
+                for user_id, delta in batch.items():
+                    row = self._conn.execute(
+                        self.UPDATE_PROFILE,
+                        (
+                            delta.xp, delta.xp, json.dumps(delta.mastery), delta.xp,
+                            delta.last_active, now, user_id,
+                        ),
+                    ).fetchone()
+                    if row is not None:
+                        totals[row[0]] = (row[1], row[2])
+                self._conn.executemany(
+                    self.UPSERT_LEADERBOARD,
+                    [(str(uuid.uuid4()), xp, xp, now, user_id) for user_id, (xp, _) in totals.items()],
+                )
+                self._conn.execute(self.PRUNE_BATCHES, (now - self.retention_ms,))
+                self._conn.execute(self.INSERT_BATCH, (batch_id, now))
+                before_commit({"batch": batch_id, "at": now})
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return totals
+
+    def totals(self, user_id: str) -> Optional[Tuple[int, str]]:
+        """A learner's stored (xp, badges JSON), or None without a Profile row."""
+        with self._lock:
+            return self._conn.execute(self.SELECT_TOTALS, (user_id,)).fetchone()
+
+    def committed(self, record: CommitRecord) -> bool:
+        """Whether the batch behind a commit record made it to the database."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM "ProgressBatch" WHERE id = ?', (record["batch"],)
+            ).fetchone()
+        return row is not None
+
+
+class ProgressWriter:
+    """
+    Coalesces turns per learner and flushes them in batches.
+
+    record() appends to the log (and reads a learner's stored totals the
+    first time it sees them) and flush() writes a batch; both block, so
+    callers on the event loop run them in a thread. Flushes never overlap.
+    """
+
+    def __init__(
+        self,
+        table: ProfileTable,
+        log: DeltaLog,
+        flush_interval: float = 2.0,
+        flush_turns: int = 500,
+    ):
+        self.table = table
+        self.log = log
+        self.flush_interval = flush_interval
+        self.flush_turns = flush_turns
+        self._pending: Dict[str, ProgressDelta] = {}
+        self._pending_turns = 0
+        # Segments whose turns are in _pending but not written yet (a failed
+        # flush, or logs recovered at startup)
+        self._unwritten: List[str] = []
+        # The batch a flush is writing right now, for badge projection
+        self._inflight: Dict[str, ProgressDelta] = {}
+        # userId -> [stored xp, badges stored or already announced]
+        self._known: "OrderedDict[str, Optional[List[Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.turns = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.recovered = 0
+
+    def record(self, user_id: str, xp: int, mastery: Dict[str, float]) -> List[str]:
+        """
+        Log one turn's progress and queue it for the next flush.
+
+        Returns the XP badges this turn earns (the flush stores them).
+        """
+        at = int(time.time() * 1000)
+        stored = None if user_id in self._known else self.table.totals(user_id)
+        with self._lock:
+            self.log.append(user_id, xp, mastery, at)
+            self._queue(user_id, xp, mastery, at)
+            self.turns += 1
+            full = self._pending_turns >= self.flush_turns
+            earned = self._earned(user_id, stored)
+        PROGRESS_TURNS.inc()
+        if full and self._wake is not None:
+            # record() runs in a worker thread (to_thread), and asyncio.Event
+            # may only be set from its loop's own thread
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return earned
+
+    def _earned(self, user_id: str, stored: Optional[Tuple[int, str]]) -> List[str]:
+        if user_id in self._known:
+            self._known.move_to_end(user_id)
+        else:
+            self._known[user_id] = None if stored is None else [stored[0], set(json.loads(xp_badges(stored[1], 0)))]
+            while len(self._known) > KNOWN_LEARNERS:
+                self._known.popitem(last=False)
+        known = self._known[user_id]
+        if known is None:
+            # No Profile row; the flush skips this learner too
+            return []
+        projected = known[0] + sum(
+            queued[user_id].xp for queued in (self._pending, self._inflight) if user_id in queued
+        )
+        earned = [badge for threshold, badge in XP_BADGES if projected >= threshold and badge not in known[1]]
+        known[1].update(earned)
+        return earned
+
+    def _queue(self, user_id: str, xp: int, mastery: Dict[str, float], at: int) -> None:
+        delta = self._pending.get(user_id)
+        if delta is None:
+            delta = self._pending[user_id] = ProgressDelta()
+        delta.add(xp, mastery, at)
+        self._pending_turns += 1
+
+    def flush(self) -> int:
+        """Write everything pending in one transaction; returns learners written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                turns, self._pending_turns = self._pending_turns, 0
+                self._inflight = batch
+                segment = self.log.rotate()
+            start = time.perf_counter()
+            try:
+                totals = self.table.apply(
+                    batch, lambda record: self.log.mark_committing(segment, record)
+                )
+            except (sqlite3.Error, OSError) as e:
+                # Keep the turns; they go out with the next flush
+                with self._lock:
+                    self._inflight = {}
+                    for user_id, older in batch.items():
+                        newer = self._pending.get(user_id)
+                        if newer is None:
+                            self._pending[user_id] = older
+                        else:
+                            newer.merge_older(older)
+                    self._pending_turns += turns
+                    self._unwritten.append(segment)
+                self.failures += 1
+                logger.warning("could not write learner progress", exc_info=e)
+                return 0
+            with self._lock:
+                self._inflight = {}
+                written, self._unwritten = self._unwritten + [segment], []
+                for user_id, (xp, badges) in totals.items():
+                    known = self._known.get(user_id)
+                    if known is not None:
+                        known[0] = xp
+                        known[1].update(json.loads(badges))
+            for path in written:
+                self.log.discard(path)
+            self.flushes += 1
+            self.rows_written += len(totals)
+            PROGRESS_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            return len(totals)
+
+    def recover(self) -> int:
+        """
+        Replay logs left by processes that died before flushing.
+
+        Segments up to the last batch that committed are dropped; turns
+        logged after it are queued and flushed. Blocking; call
+        before serving. Returns the number of turns replayed.
+        """
+        replayed = 0
+        try:
+            for files in self.log.orphans():
+                replayed += self._recover_files(files)
+        except (sqlite3.Error, OSError) as e:
+            # Whatever is left is tried again on the next start
+            logger.warning("could not recover learner progress", exc_info=e)
+        self.recovered += replayed
+        self.flush()
+        return replayed
+
+    def _recover_files(self, files: List[str]) -> int:
+        replayed = 0
+        entries = [(path, *DeltaLog.read(path)) for path in files]
+        last_commit = max(
+            (
+                i for i, (_, _, commit) in enumerate(entries)
+                if commit is not None and self.table.committed(commit)
+            ),
+            default=-1,
+        )
+        for i, (path, records, _) in enumerate(entries):
+            if i <= last_commit:
+                self.log.discard(path)
+            else:
+                with self._lock:
+                    for r in records:
+                        self._queue(r["u"], r["x"], r["m"], r["t"])
+                    self._unwritten.append(self.log.adopt(path))
+                replayed += len(records)
+        return replayed
+
+    async def run(self) -> None:
+        """Flush on the interval or when enough turns are pending, until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await asyncio.to_thread(self.flush)
+
+    def close(self) -> None:
+        """Final flush on shutdown; anything that still can't be written stays logged."""
+        self.flush()
+        if not self._pending and not self._unwritten:
+            self.log.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending_users = len(self._pending)
+            pending_turns = self._pending_turns
+        return {
+            "enabled": True,
+            "pendingLearners": pending_users,
+            "pendingTurns": pending_turns,
+            "turns": self.turns,
+            "flushes": self.flushes,
+            "rowsWritten": self.rows_written,
+            # Transactions per recorded turn
+            "transactionsPerTurn": round(self.flushes / self.turns, 4) if self.turns else 0.0,
+            "failures": self.failures,
+            "recoveredTurns": self.recovered,
+        }
+
+
+def progress_writer_from_env() -> Optional[ProgressWriter]:
+    """Build the writer from PROGRESS_* settings; None when PROGRESS_DB_PATH is unset."""
+    path = os.getenv("PROGRESS_DB_PATH")
+    if not path:
+        return None
+    directory = os.getenv("PROGRESS_LOG_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(path)), "progress-log"
+    )
+    try:
+        table = ProfileTable(path, float(os.getenv("PROGRESS_BATCH_RETENTION_DAYS", 7)))
+        log = DeltaLog(directory, os.getenv("PROGRESS_LOG_FSYNC", "false").lower() in ("1", "true", "yes"))
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("progress persistence disabled", exc_info=e)
+        return None
+    return ProgressWriter(
+        table,
+        log,
+        flush_interval=float(os.getenv("PROGRESS_FLUSH_INTERVAL", 2)),
+        flush_turns=int(os.getenv("PROGRESS_FLUSH_TURNS", 500)),
+    )
+
+
+_writer: Optional[ProgressWriter] = None
+_configured = False
+
+
+def get_progress_writer() -> Optional[ProgressWriter]:
+    """Return the process-wide writer (None when off), creating it on first use."""
+    global _writer, _configured
+    if not _configured:
+        _writer = progress_writer_from_env()
+        _configured = True
+    return _writer
@@ -1,13 +1,25 @@
 """
 Socratic Prompts for Sort-crates AI Tutor
+
+The prompt is split in two so providers can cache the expensive part:
+- a static prefix (instructions) that only depends on the algorithm and the
+  learner's mastery band, built once and memoized
+- a small per-turn suffix with the mastery value, lesson summary, array
+  state and recent chat
 """
 
+import hashlib
+from functools import lru_cache
+from typing import Dict, NamedTuple
+
+# Bump whenever the static instructions change so cached prefixes are dropped
+PROMPT_VERSION = "4"
+
 SOCRATIC_SYSTEM_PROMPT = """You are "Sort-crates," a Socratic tutor for sorting algorithms. Guide learners through questions.
 
-**Context:**
+**Lesson:**
 - Algorithm: {algorithm}
-- Mastery: {mastery}
-- Recent Chat: {chat_history}
+- Learner level: {learner_level}
 
 **Rules:**
 1. Ask ONE clear question per response
@@ -16,21 +28,10 @@ SOCRATIC_SYSTEM_PROMPT = """You are "Sort-crates," a Socratic tutor for sorting
 4. Accept short answers and move forward
 5. Award XP: correct=+10, wrong=-5, partial=+5
 
-**CRITICAL - READ THIS BEFORE EVERY RESPONSE:**
-
-STEP 1: Read the last AI message. What did I just ask?
-STEP 2: Read the user's answer. What did they say?
-STEP 3: If they answered my question, DON'T ask it again!
-
-**EXAMPLE OF WHAT NOT TO DO:**
-AI: "Should 90 and 70 be swapped?"
-User: "yes"
-AI: "Should 90 and 70 be swapped?" ← WRONG! They already said YES!
-
-**CORRECT RESPONSE:**
-AI: "Should 90 and 70 be swapped?"
-User: "yes"
-AI: "Correct! After swapping, the array is [70, 90, 30, ...]. What's the next pair?" ← RIGHT!
+**LESSON SO FAR:**
+Each turn includes a server-maintained summary of the whole lesson: the stage reached, pairs
+already examined, swaps done, misconceptions and questions already asked. Continue from that
+stage, revisit misconceptions, and never ask a question listed under "Already asked".
 
 **RULES:**
 1. User says "yes" to swap → PERFORM THE SWAP and move to next pair
@@ -47,8 +48,8 @@ AI: "Correct! After swapping, the array is [70, 90, 30, ...]. What's the next pa
 - For casual/off-topic responses (like "lol", "ok", "idk"): Award 0 XP and gently redirect to the topic
 
 **Conversation Progression Guide:**
-Based on chat history, determine the current stage and progress accordingly:
-- **Stage 1 (Intro)**: Basic "what is bubble sort?" → Move to specific comparisons
+Progress from the stage given in the lesson summary:
+- **Stage 1 (Intro)**: Basic "what is {algorithm}?" → Move to specific comparisons
 - **Stage 2 (Mechanics)**: How comparisons work → Move to swapping logic
 - **Stage 3 (Implementation)**: When to swap → Move to loop structure
 - **Stage 4 (Optimization)**: Basic algorithm → Move to efficiency and edge cases
@@ -68,10 +69,10 @@ AI: "Should 60 and 10 swap?"
 User: "yes"
 
 ❌ BAD: "What two numbers does Bubble Sort compare first?" (GOING BACKWARDS!)
-✅ GOOD: "Exactly! After swapping, the array is [10, 60, ...]. What's the next pair?"
+✅ GOOD: "Exactly! They swap. What's the next pair?"
 
 **Your Task:**
-1. Read last 3 messages - what was already asked and answered?
+1. Read the lesson summary and recent chat - what was already asked and answered?
 2. If user answered correctly, say "Correct!" and ask about the NEXT step
 3. NEVER ask the same question twice
 4. Award XP: +10 correct, -5 wrong, +5 partial
@@ -83,81 +84,183 @@ You MUST respond with ONLY a valid JSON object. No extra text before or after.
   "socraticQuestion": "Your next guiding question...",
   "analysisOfUserAnswer": "correct | partial | incorrect | continuing",
   "learnerMasteryUpdate": {{"{algorithm}": 0.XX}},
-  "visualizerStateUpdate": {{
-    "focusIndices": [0, 1],
-    "state": "idle",
-    "data": [40, 10, 90, 80, 70]
-  }},
+  "visualizerStateUpdate": {{"focusIndices": [0, 1], "state": "comparing"}},
   "xpAwarded": 5
 }}
 
 CRITICAL: Return ONLY the JSON object above. Do not add any explanatory text.
 
-**CRITICAL: USE THE EXACT CURRENT ARRAY!**
+**ARRAY STATE:**
+Each turn ends with an ARRAY STATE block computed by the server. It is always correct.
+The server performs every swap. Never compute, copy or return the array yourself:
+- Ask about the pairs listed in ARRAY STATE, using their actual values
+- Set visualizerStateUpdate.state to "swapping" ONLY when the learner has just confirmed the next swap; the server applies it
+- Otherwise use "comparing" with the indices of the pair you are asking about
 
-The array ALWAYS starts as: [70, 30, 90, 10, 50, 80, 20, 60, 100, 40]
+ALWAYS MOVE FORWARD.
+"""
 
-The CURRENT ARRAY is provided in the chat history. You MUST use this EXACT array.
+# Per-turn context. Kept after the static prefix so the prefix stays byte-stable
+SOCRATIC_TURN_PROMPT = """**Context:**
+- Mastery: {mastery}
+- Lesson so far:
+{lesson_summary}
+- Recent Chat:
+{chat_history}
 
-**HOW TO SWAP:**
+**ARRAY STATE:**
+{array_state}
 
-1. **READ** the CURRENT ARRAY from chat history (it says "CURRENT ARRAY: [...]")
-2. **COPY** that exact array element by element
-3. **SWAP** only the two specific elements
-4. **RETURN** the swapped array in visualizerStateUpdate.data
+Generate your Socratic response as a valid JSON object following the specified format. Do not include any markdown formatting or additional text."""
 
-**EXAMPLE:**
-```
-CURRENT ARRAY: [70, 30, 90, 10, 50, 80, 20, 60, 100, 40]
+NO_ARRAY_STATE = "No array is loaded yet - talk about the algorithm in general terms."
 
-User says: swap 70 and 30 (indices 0 and 1)
+NO_LESSON_SUMMARY = "- First turn of the lesson"
 
-Step 1: Copy array: [70, 30, 90, 10, 50, 80, 20, 60, 100, 40]
-Step 2: Swap index 0 (70) with index 1 (30)
-Step 3: Result: [30, 70, 90, 10, 50, 80, 20, 60, 100, 40]
-                 ↑   ↑  ← ONLY these two swapped!
+# Stateless turns past the first: only the recent chat is known
+NO_SESSION_SUMMARY = "- Lesson in progress; only the recent chat is known"
 
-Return in JSON:
-"visualizerStateUpdate": {{
-  "focusIndices": [0, 1],
-  "state": "swapping",
-  "data": [30, 70, 90, 10, 50, 80, 20, 60, 100, 40]
-}}
-```
+# Comparisons listed in ARRAY STATE (the next one plus the last few before
+# the move) and a ceiling on the whole block
+ARRAY_STATE_COMPARISONS = 4
+ARRAY_STATE_MAX_TOKENS = 200
 
-**NEVER:**
-- Make up a different array
-- Use an array from earlier in the conversation
-- Shuffle or randomize elements
-- Change elements that aren't being swapped
+# Mastery is bucketed so the static prefix has a handful of variants per
+# algorithm instead of one per mastery value
+MASTERY_BANDS = (
+    (0.34, "beginner", "New to this algorithm. Use simple words and one small step at a time."),
+    (0.67, "developing", "Knows the basics. Expect short correct answers and push on the why."),
+    (1.01, "proficient", "Comfortable with the mechanics. Move quickly toward complexity and trade-offs."),
+)
 
-**ALWAYS:**
-- Use the CURRENT ARRAY from the chat history
-- Only swap the two specific indices
-- Keep all other elements in their exact positions
 
-**JSON Format:**
-{{
-  "socraticQuestion": "Your next question...",
-  "analysisOfUserAnswer": "correct|partial|incorrect|continuing",
-  "learnerMasteryUpdate": {{"{algorithm}": 0.XX}},
-  "visualizerStateUpdate": {{"focusIndices": [0, 1], "state": "comparing"}},
-  "xpAwarded": 10
-}}
+class StaticPrefix(NamedTuple):
+    text: str
+    hash: str
+    version: str
+    tokens: int
 
-**FINAL CHECK BEFORE RESPONDING:**
-1. Did I just ask "Should X and Y swap?" → YES
-2. Did user say "yes"? → YES
-3. Then my response MUST be: Swap them, show new array, ask about NEXT pair
-4. My response MUST NOT be: Ask about swapping X and Y again
 
-NEVER REPEAT. ALWAYS MOVE FORWARD.
-"""
+class AssembledPrompt(NamedTuple):
+    prefix: StaticPrefix
+    suffix: str
+    text: str
+    token_report: Dict[str, object]
 
-def get_socratic_prompt(algorithm: str, mastery: float, chat_history: str) -> str:
-    """Generate the Socratic system prompt with context."""
-    return SOCRATIC_SYSTEM_PROMPT.format(
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English prompts)."""
+    return (len(text) + 3) // 4
+
+
+def mastery_band(mastery: float) -> str:
+    """Bucket a 0-1 mastery value into a band name."""
+    for upper, band, _ in MASTERY_BANDS:
+        if mastery < upper:
+            return band
+    return MASTERY_BANDS[-1][1]
+
+
+@lru_cache(maxsize=64)
+def get_static_prefix(algorithm: str, band: str) -> StaticPrefix:
+    """
+    Build the static instructions for an algorithm and mastery band.
+
+    Memoized, so every turn in the same (algorithm, band) gets the identical
+    string back. The hash identifies it for context caching.
+    """
+    guidance = next(text for _, name, text in MASTERY_BANDS if name == band)
+    text = SOCRATIC_SYSTEM_PROMPT.format(
         algorithm=algorithm,
+        learner_level=f"{band} - {guidance}",
+    )
+    digest = hashlib.sha256(f"{PROMPT_VERSION}\0{text}".encode("utf-8")).hexdigest()[:16]
+    return StaticPrefix(text, digest, PROMPT_VERSION, estimate_tokens(text))
+
+
+def warm_static_prefixes(algorithms) -> int:
+    """
+    Build every (algorithm, band) prefix up front so no request pays for it.
+
+    Returns:
+        Number of prefixes now memoized
+    """
+    for algorithm in algorithms:
+        for _, band, _ in MASTERY_BANDS:
+            get_static_prefix(algorithm, band)
+    return get_static_prefix.cache_info().currsize
+
+
+def format_array_state(move: dict, current_array: list) -> str:
+    """
+    Describe the step engine's next move in a few compact lines.
+
+    Only the pair to ask about next and the last few before the move are
+    listed (a sorted stretch can have hundreds), and the block is kept
+    under ARRAY_STATE_MAX_TOKENS.
+    """
+    lines = [f"- Current array: {current_array}"]
+    if move["state"] == "sorted":
+        lines.append("- The array is fully sorted. Move on to complexity and stability.")
+        return "\n".join(lines)
+    comparisons = move["comparisons"]
+    last = len(comparisons) - 1
+
+    def compare(n: int) -> str:
+        i, j = comparisons[n]
+        outcome = "leads to the next move" if n == last else "no change"
+        return f"- Compare indices [{i}, {j}] ({current_array[i]} vs {current_array[j]}): {outcome}"
+
+    shown = sorted({0, *range(max(1, last - ARRAY_STATE_COMPARISONS + 2), last + 1)}) if comparisons else []
+    for previous, n in zip([-1] + shown, shown):
+        if n - previous > 1:
+            lines.append(f"- ... {n - previous - 1} more comparisons, no change")
+        lines.append(compare(n))
+    next_line = f"- Next move: indices {move['focusIndices']} -> array becomes {move['data']}"
+    text = "\n".join(lines + [next_line])
+    if estimate_tokens(text) > ARRAY_STATE_MAX_TOKENS:
+        # Very long arrays: the next pair and the move are what the turn needs
+        text = "\n".join(
+            [lines[0]] + ([compare(0)] if comparisons else [])
+            + [f"- Next move: indices {move['focusIndices']}"]
+        )
+    return text
+
+
+def build_prompt(
+    algorithm: str,
+    mastery: float,
+    chat_history: str,
+    array_state: str = NO_ARRAY_STATE,
+    lesson_summary: str = NO_LESSON_SUMMARY,
+) -> AssembledPrompt:
+    """
+    Assemble the prompt for one chat turn.
+
+    Returns:
+        AssembledPrompt with the cached prefix, the per-turn suffix, the full
+        text to send and a token-count report for the turn
+    """
+    prefix = get_static_prefix(algorithm, mastery_band(mastery))
+    suffix = SOCRATIC_TURN_PROMPT.format(
         mastery=mastery,
-        chat_history=chat_history
+        lesson_summary=lesson_summary,
+        chat_history=chat_history,
+        array_state=array_state,
     )
+    suffix_tokens = estimate_tokens(suffix)
+    token_report = {
+        "promptVersion": prefix.version,
+        "prefixHash": prefix.hash,
+        "prefixTokens": prefix.tokens,
+        "turnTokens": suffix_tokens,
+        "totalTokens": prefix.tokens + suffix_tokens,
+    }
+    return AssembledPrompt(prefix, suffix, prefix.text + "\n\n" + suffix, token_report)
+
+
+def get_socratic_prompt(
+    algorithm: str, mastery: float, chat_history: str, array_state: str = NO_ARRAY_STATE
+) -> str:
+    """Generate the Socratic system prompt with context."""
+    return build_prompt(algorithm, mastery, chat_history, array_state).text
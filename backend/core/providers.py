@@ -0,0 +1,394 @@
+"""
+LLM providers behind one interface
+
+ModelClient talks to every provider the way it talks to Gemini: a
+generate_content(prompt, stream=False, timeout=None) call (plus an optional
+generate_content_async) returning objects with .text and .usage_metadata.
+
+- gemini: google-generativeai
+- groq: the groq SDK (chat completions)
+- stub: replays recorded responses with a configurable latency distribution,
+  for offline load tests and capacity planning
+
+Set LLM_RECORD_PATH to append every real response (text, latency, token
+counts) to a JSONL file the stub can replay.
+
+SDKs are imported when a provider is first built, never when this module
+is, so importing the app stays cheap; serve.py imports the configured one
+in the preloading parent (preload_provider_sdk) so workers share it.
+
+Settings:
+    LLM_PROVIDER                 gemini, groq or stub (gemini)
+    LLM_MODEL                    model name (provider default)
+    LLM_PRICE_INPUT_PER_MTOK     USD per million prompt tokens (provider default)
+    LLM_PRICE_OUTPUT_PER_MTOK    USD per million output tokens (provider default)
+    LLM_RECORD_PATH              JSONL file to record responses into (unset = off)
+    LLM_STUB_RESPONSES           recordings to replay (core/data/stub_responses.json)
+    LLM_STUB_LATENCY             "recorded", "fixed:S", "uniform:LO,HI",
+                                 "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA" (recorded)
+    LLM_STUB_ERROR_RATE          fraction of calls failing with a 503 (0)
+    LLM_STUB_SEED                seed for latency and error sampling (unset = random)
+"""
+
+import asyncio
+import importlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from .log import get_logger
+
+logger = get_logger("providers")
+
+DEFAULT_STUB_RESPONSES = os.path.join(os.path.dirname(__file__), "data", "stub_responses.json")
+
+
+class UsageMetadata(NamedTuple):
+    # Same attribute names as genai's usage_metadata
+    prompt_token_count: Optional[int]
+    candidates_token_count: Optional[int]
+    cached_content_token_count: Optional[int] = None
+
+
+class ProviderResponse(NamedTuple):
+    text: str
+    usage_metadata: Optional[UsageMetadata] = None
+
+
+def prompt_kind(prompt: str) -> str:
+    """Which backend prompt this is: "quiz" feedback or a "chat" turn."""
+    return "quiz" if "questionScores" in prompt else "chat"
+
+
+class Provider:
+    """Base class; subclasses implement generate_content."""
+
+    name = ""
+    default_model = ""
+    api_key_env: Optional[str] = None
+    # SDK imported on first construction (None: pure Python)
+    sdk_module: Optional[str] = None
+    # Published list prices in USD per million tokens (input, output)
+    default_prices = (0.0, 0.0)
+    supports_timeout = True
+
+    def __init__(self, model_name: Optional[str] = None, api_key: Optional[str] = None):
+        self.model_name = model_name or self.default_model
+        self.api_key = api_key if api_key is not None else self.key_from_env()
+        self.prices = (
+            float(os.getenv("LLM_PRICE_INPUT_PER_MTOK") or self.default_prices[0]),
+            float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK") or self.default_prices[1]),
+        )
+
+    @classmethod
+    def key_from_env(cls) -> Optional[str]:
+        return os.getenv(cls.api_key_env) if cls.api_key_env else None
+
+    @classmethod
+    def is_configured(cls, api_key: Optional[str]) -> bool:
+        return cls.api_key_env is None or bool(api_key)
+
+    def generate_content(self, prompt: str, stream: bool = False, timeout: Optional[float] = None):
+        raise NotImplementedError
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    default_model = "gemini-2.5-flash"
+    api_key_env = "GOOGLE_AI_API_KEY"
+    sdk_module = "google.generativeai"
+    default_prices = (0.30, 2.50)
+
+    def __init__(self, model_name: Optional[str] = None, api_key: Optional[str] = None):
+        super().__init__(model_name, api_key)
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.api_key)
+        self._model = genai.GenerativeModel(self.model_name)
+
+    @staticmethod
+    def _options(timeout: Optional[float]) -> Dict[str, Any]:
+        return {"request_options": {"timeout": timeout}} if timeout else {}
+
+    def generate_content(self, prompt: str, stream: bool = False, timeout: Optional[float] = None):
+        return self._model.generate_content(prompt, stream=stream, **self._options(timeout))
+
+    async def generate_content_async(
+        self, prompt: str, stream: bool = False, timeout: Optional[float] = None
+    ):
+        return await self._model.generate_content_async(
+            prompt, stream=stream, **self._options(timeout)
+        )
+
+
+class GroqProvider(Provider):
+    name = "groq"
+    default_model = "llama-3.3-70b-versatile"
+    api_key_env = "GROQ_API_KEY"
+    sdk_module = "groq"
+    default_prices = (0.59, 0.79)
+
+    def __init__(self, model_name: Optional[str] = None, api_key: Optional[str] = None):
+        super().__init__(model_name, api_key)
+        try:
+            from groq import Groq
+        except ImportError as e:
+            raise RuntimeError("LLM_PROVIDER=groq needs the groq package (pip install groq)") from e
+        self._client = Groq(api_key=self.api_key)
+
+    @staticmethod
+    def _usage(usage: Any) -> Optional[UsageMetadata]:
+        if usage is None:
+            return None
+        return UsageMetadata(usage.prompt_tokens, usage.completion_tokens)
+
+    def generate_content(self, prompt: str, stream: bool = False, timeout: Optional[float] = None):
+        completion = self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            stream=stream,
+            timeout=timeout,
+        )
+        if stream:
+            return self._stream(completion)
+        return ProviderResponse(
+            completion.choices[0].message.content or "", self._usage(completion.usage)
+        )
+
+    def _stream(self, chunks: Iterator[Any]) -> Iterator[ProviderResponse]:
+        for chunk in chunks:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            # Groq reports usage on the last chunk only
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = self._usage(getattr(x_groq, "usage", None))
+            if text or usage:
+                yield ProviderResponse(text or "", usage)
+
+
+def parse_latency(spec: str) -> Optional[Callable[[random.Random], float]]:
+    """
+    Turn a latency spec into a sampler; None means "use recorded latencies".
+
+    Raises:
+        ValueError: If the spec isn't one of the documented forms
+    """
+    name, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if name == "recorded" and not values:
+        return None
+    if name == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if name == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if name == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency spec: {spec!r}")
+
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class StubProvider(Provider):
+    """
+    Offline provider replaying recorded responses.
+
+    The response for a prompt is picked deterministically (by prompt hash)
+    among the recordings of the same kind; latency is drawn from the
+    configured distribution, or from the recordings' own latencies. Both the
+    blocking and the async calls are supported, so load tests exercise the
+    same code paths as a real provider.
+    """
+
+    name = "stub"
+    default_model = "stub"
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        api_key: Optional[str] = None,
+        responses_path: Optional[str] = None,
+        latency: Optional[str] = None,
+        error_rate: Optional[float] = None,
+        seed: Optional[int] = None,
+        chunks: int = 8,
+    ):
+        super().__init__(model_name, api_key)
+        path = responses_path or os.getenv("LLM_STUB_RESPONSES") or DEFAULT_STUB_RESPONSES
+        self.records = self._load(path)
+        self._by_kind: Dict[str, List[Dict[str, Any]]] = {}
+        for record in self.records:
+            self._by_kind.setdefault(record.get("kind", "chat"), []).append(record)
+        self._sampler = parse_latency(latency or os.getenv("LLM_STUB_LATENCY", "recorded"))
+        if error_rate is None:
+            error_rate = float(os.getenv("LLM_STUB_ERROR_RATE", 0))
+        self.error_rate = error_rate
+        if seed is None and os.getenv("LLM_STUB_SEED"):
+            seed = int(os.getenv("LLM_STUB_SEED"))
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.chunks = chunks
+
+    @staticmethod
+    def _load(path: str) -> List[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = json.load(f)
+        if not records:
+            raise ValueError(f"No stub responses in {path}")
+        return records
+
+    def _pick(self, prompt: str) -> Dict[str, Any]:
+        records = self._by_kind.get(prompt_kind(prompt)) or self.records
+        return records[zlib.crc32(prompt.encode("utf-8")) % len(records)]
+
+    def _plan(self, prompt: str, timeout: Optional[float]):
+        """Choose the response, its latency and whether this call fails."""
+        record = self._pick(prompt)
+        with self._rng_lock:
+            if self._sampler is not None:
+                latency = self._sampler(self._rng)
+            else:
+                pool = self._by_kind.get(record.get("kind", "chat")) or self.records
+                latency = float(self._rng.choice(pool).get("latency", 0.0))
+            fail = self._rng.random() < self.error_rate
+        error: Optional[Exception] = None
+        if timeout and latency > timeout:
+            latency, error = timeout, TimeoutError("stub: deadline exceeded")
+        elif fail:
+            error = RuntimeError("503 stub: service unavailable")
+        usage = UsageMetadata(_estimate_tokens(prompt), _estimate_tokens(record["text"]))
+        return record["text"], latency, error, usage
+
+    def _pieces(self, text: str) -> List[str]:
+        size = max(1, math.ceil(len(text) / self.chunks))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def generate_content(self, prompt: str, stream: bool = False, timeout: Optional[float] = None):
+        text, latency, error, usage = self._plan(prompt, timeout)
+        if not stream:
+            time.sleep(latency)
+            if error is not None:
+                raise error
+            return ProviderResponse(text, usage)
+        return self._stream(text, latency, error, usage)
+
+    def _stream(self, text, latency, error, usage) -> Iterator[ProviderResponse]:
+        pieces = self._pieces(text)
+        for n, piece in enumerate(pieces):
+            time.sleep(latency / len(pieces))
+            if error is not None:
+                raise error
+            yield ProviderResponse(piece, usage if n == len(pieces) - 1 else None)
+
+    async def generate_content_async(
+        self, prompt: str, stream: bool = False, timeout: Optional[float] = None
+    ):
+        text, latency, error, usage = self._plan(prompt, timeout)
+        if not stream:
+            await asyncio.sleep(latency)
+            if error is not None:
+                raise error
+            return ProviderResponse(text, usage)
+        return self._stream_async(text, latency, error, usage)
+
+    async def _stream_async(self, text, latency, error, usage) -> AsyncIterator[ProviderResponse]:
+        pieces = self._pieces(text)
+        for n, piece in enumerate(pieces):
+            await asyncio.sleep(latency / len(pieces))
+            if error is not None:
+                raise error
+            yield ProviderResponse(piece, usage if n == len(pieces) - 1 else None)
+
+
+class RecordingProvider:
+    """Wraps a provider and appends each successful non-streaming response to a JSONL file."""
+
+    def __init__(self, inner: Provider, path: str):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        if hasattr(inner, "generate_content_async"):
+            self.generate_content_async = self._generate_content_async
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    def _record(self, prompt: str, response: Any, latency: float) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        entry = {
+            "kind": prompt_kind(prompt),
+            "provider": self.inner.name,
+            "model": self.inner.model_name,
+            "text": response.text,
+            "latency": round(latency, 4),
+            "promptTokens": getattr(usage, "prompt_token_count", None),
+            "outputTokens": getattr(usage, "candidates_token_count", None),
+        }
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logger.warning("could not record llm response", exc_info=e)
+
+    def generate_content(self, prompt: str, stream: bool = False, timeout: Optional[float] = None):
+        start = time.perf_counter()
+        response = self.inner.generate_content(prompt, stream=stream, timeout=timeout)
+        if not stream:
+            self._record(prompt, response, time.perf_counter() - start)
+        return response
+
+    async def _generate_content_async(
+        self, prompt: str, stream: bool = False, timeout: Optional[float] = None
+    ):
+        start = time.perf_counter()
+        response = await self.inner.generate_content_async(prompt, stream=stream, timeout=timeout)
+        if not stream:
+            self._record(prompt, response, time.perf_counter() - start)
+        return response
+
+
+PROVIDERS = {cls.name: cls for cls in (GeminiProvider, GroqProvider, StubProvider)}
+
+
+def provider_class(name: str) -> type:
+    try:
+        return PROVIDERS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider {name!r}; expected one of {sorted(PROVIDERS)}")
+
+
+def create_provider(
+    name: str, model_name: Optional[str] = None, api_key: Optional[str] = None
+) -> Any:
+    """Build a provider by name, wrapped in a recorder when LLM_RECORD_PATH is set."""
+    provider = provider_class(name)(model_name, api_key)
+    record_path = os.getenv("LLM_RECORD_PATH")
+    if record_path and not isinstance(provider, StubProvider):
+        return RecordingProvider(provider, record_path)
+    return provider
+
+
+def preload_provider_sdk(name: str) -> Optional[str]:
+    """
+    Import a provider's SDK without configuring a client, e.g. before
+    forking workers. Returns the module imported, or None if there is none
+    (or it isn't installed; building the provider reports that).
+    """
+    module = provider_class(name).sdk_module
+    if module is None:
+        return None
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        return None
+    return module
@@ -0,0 +1,160 @@
+"""
+Deterministic quiz scoring and template feedback
+
+Scoring only depends on each question's isCorrect flag, so it never needs the
+LLM. Feedback comes from a local template bank keyed on skill level and the
+categories that were missed; LLM-written feedback is an optional follow-up
+run in the background and cached per (score, missed categories) signature.
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .log import get_logger
+
+logger = get_logger("quiz_feedback")
+
+DEFAULT_FEEDBACK = "Great effort! Keep practicing to improve your understanding."
+
+SKILL_FEEDBACK = {
+    "basic": "Nice start! You're building the foundations of sorting algorithms.",
+    "intermediate": "Solid work! You understand how the core sorting algorithms behave.",
+    "advanced": "Excellent result! You have a strong grasp of sorting algorithms.",
+}
+
+CATEGORY_TIPS = {
+    "basic": "Review how Bubble, Selection and Insertion Sort compare and swap elements step by step.",
+    "intermediate": "Revisit divide-and-conquer: how Merge Sort splits and merges, and what Quick Sort's pivot does.",
+    "advanced": "Focus on worst- vs average-case complexity, stability and when Heap Sort's guarantees matter.",
+}
+
+PERFECT_TIP = "Try explaining each algorithm's trade-offs to the tutor to lock in your mastery."
+
+
+def skill_level_for(correct_count: int) -> str:
+    """Map a correct-answer count to the onboarding skill level."""
+    if correct_count <= 3:
+        return "basic"
+    if correct_count <= 6:
+        return "intermediate"
+    return "advanced"
+
+
+def score_quiz(questions: Iterable[Any]) -> Dict[str, Any]:
+    """
+    Score a quiz from each question's isCorrect flag.
+
+    Returns:
+        Dictionary with score, totalQuestions, skillLevel, questionScores and
+        the sorted list of categories that had a wrong answer
+    """
+    question_scores = [1 if q.isCorrect else 0 for q in questions]
+    missed = sorted({q.category for q in questions if not q.isCorrect})
+    correct_count = sum(question_scores)
+    return {
+        "score": correct_count,
+        "totalQuestions": len(question_scores),
+        "skillLevel": skill_level_for(correct_count),
+        "questionScores": question_scores,
+        "missedCategories": missed,
+    }
+
+
+def template_feedback(skill_level: str, missed_categories: List[str]) -> str:
+    """Two or three sentences of feedback built from the local template bank."""
+    sentences = [SKILL_FEEDBACK.get(skill_level, DEFAULT_FEEDBACK)]
+    tips = [CATEGORY_TIPS[c] for c in missed_categories if c in CATEGORY_TIPS]
+    sentences.extend(tips[:2] if tips else [PERFECT_TIP])
+    return " ".join(sentences)
+
+
+def feedback_signature(score: int, total: int, missed_categories: List[str]) -> str:
+    """Key shared by every quiz that would get the same feedback."""
+    return f"{score}/{total}:{','.join(sorted(missed_categories))}"
+
+
+class FeedbackJobs:
+    """
+    Background LLM feedback jobs, deduplicated and cached by signature.
+
+    A signature that already has feedback completes immediately; one that is
+    still being generated returns the existing job instead of a new call.
+    """
+
+    def __init__(self, max_cached: int = 256, max_jobs: int = 4096):
+        self.max_cached = max_cached
+        self.max_jobs = max_jobs
+        self._feedback: "OrderedDict[str, str]" = OrderedDict()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, str] = {}
+        self._tasks: set = set()
+
+    def cached(self, signature: str) -> Optional[str]:
+        feedback = self._feedback.get(signature)
+        if feedback is not None:
+            self._feedback.move_to_end(signature)
+        return feedback
+
+    def remember(self, signature: str, feedback: str) -> None:
+        self._feedback[signature] = feedback
+        self._feedback.move_to_end(signature)
+        while len(self._feedback) > self.max_cached:
+            self._feedback.popitem(last=False)
+
+    def _new_job(self, signature: str, status: str, feedback: Optional[str]) -> str:
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {"status": status, "signature": signature, "feedback": feedback}
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return job_id
+
+    def submit(self, signature: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """Start (or join) LLM feedback generation for a signature; returns a job id."""
+        feedback = self.cached(signature)
+        if feedback is not None:
+            return self._new_job(signature, "done", feedback)
+        if signature in self._pending and self._pending[signature] in self._jobs:
+            return self._pending[signature]
+
+        job_id = self._new_job(signature, "pending", None)
+        self._pending[signature] = job_id
+
+        async def run():
+            job = self._jobs.get(job_id, {})
+            try:
+                feedback = await generate()
+                self.remember(signature, feedback)
+                job.update(status="done", feedback=feedback)
+            except Exception as e:
+                logger.warning("feedback job failed", exc_info=e, extra={"fields": {"jobId": job_id}})
+                job.update(status="failed")
+            finally:
+                self._pending.pop(signature, None)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Wait up to `timeout` seconds for running jobs on shutdown, then cancel
+        the rest.
+
+        Returns:
+            Number of jobs that had to be cancelled
+        """
+        if not self._tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+
+feedback_jobs = FeedbackJobs()
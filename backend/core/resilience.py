@@ -0,0 +1,174 @@
+"""
+Deadlines, retry and a circuit breaker for provider calls
+
+The LLM provider has bad minutes: hung connections, 429 bursts, 503s. Each
+call gets a deadline, retryable errors are retried with jittered exponential
+backoff, and after repeated failures the breaker opens so requests fail fast
+(and get the local fallback) instead of piling onto a degraded provider.
+
+Settings:
+    LLM_TIMEOUT             seconds per attempt (20)
+    LLM_MAX_RETRIES         extra attempts for retryable errors (2)
+    LLM_RETRY_BASE_DELAY    first backoff ceiling in seconds (0.5)
+    LLM_RETRY_MAX_DELAY     backoff ceiling in seconds (4)
+    LLM_BREAKER_FAILURES    consecutive failures that open the breaker (5)
+    LLM_BREAKER_RESET       seconds the breaker stays open before a probe (30)
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+from .metrics import counter, gauge
+
+RETRYABLE_KINDS = frozenset({"rate_limit", "timeout", "network", "unavailable"})
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = gauge(
+    "sortcrates_llm_circuit_state",
+    "LLM circuit breaker state (0 closed, 1 half-open, 2 open)",
+)
+BREAKER_TRANSITIONS = counter(
+    "sortcrates_llm_circuit_transitions_total",
+    "LLM circuit breaker state changes",
+    ("to",),
+)
+BREAKER_REJECTIONS = counter(
+    "sortcrates_llm_circuit_rejections_total",
+    "LLM calls refused while the breaker was open",
+)
+RETRIES = counter(
+    "sortcrates_llm_retries_total",
+    "LLM call retries by error kind",
+    ("kind",),
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the breaker is open."""
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff ("full jitter") for retryable error kinds.
+
+    Attempt n (0-based) waits a uniform random time in
+    [0, min(max_delay, base_delay * 2**n)].
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 4.0,
+        timeout: Optional[float] = 20.0,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        timeout = float(os.getenv("LLM_TIMEOUT", 20))
+        return cls(
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5)),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", 4)),
+            timeout=timeout if timeout > 0 else None,
+        )
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        return attempt < self.max_retries and kind in RETRYABLE_KINDS
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls go through; `failure_threshold` failures in a row open it.
+    open: calls are refused until `reset_timeout` has passed.
+    half_open: one probe call goes through; success closes the breaker,
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.set_function(lambda: _STATE_VALUES[self.state])
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", 30)),
+        )
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            BREAKER_TRANSITIONS.inc(to=state)
+
+    def before_call(self) -> None:
+        """
+        Reserve a call slot.
+
+        Raises:
+            CircuitOpenError: If the breaker is open (or half-open with a
+                probe already running)
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    BREAKER_REJECTIONS.inc()
+                    raise CircuitOpenError("LLM circuit breaker is open")
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    BREAKER_REJECTIONS.inc()
+                    raise CircuitOpenError("LLM circuit breaker is half-open")
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def release(self) -> None:
+        """Give back a probe slot from a call that ended without a verdict."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                "state": self.state,
+                "consecutiveFailures": self.failures,
+                "retryInSeconds": round(retry_in, 1) if retry_in is not None else None,
+            }
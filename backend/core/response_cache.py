@@ -0,0 +1,259 @@
+"""
+Response cache for repeated tutor turns
+
+Most learners start from the same array and give the same early answers, so
+identical (algorithm, mastery band, array, last exchange, lesson summary)
+states come up over and over. This cache sits in front of the LLM call and answers them locally.
+
+Two tiers:
+- MemoryBackend: in-process LRU with TTL
+- SQLiteBackend: optional disk tier so entries survive restarts
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace ("Yes!" == "yes")."""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def make_cache_key(
+    algorithm: str,
+    band: str,
+    current_array: Optional[List[int]],
+    chat_history: List[Dict[str, str]],
+    last_n: int,
+    version: str = "",
+    summary: str = "",
+) -> str:
+    """
+    Canonicalize a tutor state into a cache key.
+
+    Only the last `last_n` messages take part, normalized, so small wording
+    differences in the same exchange still hit. `summary` is the digest of
+    the session's lesson summary, which is in the prompt too.
+    """
+    recent = [
+        [msg["role"], normalize_message(msg["content"])]
+        for msg in chat_history[-last_n:]
+    ] if last_n > 0 else []
+    state = [version, algorithm, band, list(current_array or []), recent, summary]
+    canonical = json.dumps(state, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """Thread-safe LRU dict with per-entry expiry and a max entry count."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Disk tier backed by a local SQLite file.
+
+    Least recently used rows are deleted once the table grows past
+    max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed)"
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE response_cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires, accessed)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM response_cache WHERE key IN ("
+                    " SELECT key FROM response_cache ORDER BY accessed LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Two-tier LRU+TTL cache of parsed tutor responses.
+
+    Lookups try memory first, then the optional disk tier (promoting hits
+    back into memory). Values are copied on the way in and out so callers
+    can't mutate cached entries.
+    """
+
+    def __init__(
+        self,
+        memory: MemoryBackend,
+        disk: Optional[SQLiteBackend] = None,
+        ttl: float = 3600.0,
+        history_messages: int = 2,
+    ):
+        self.memory = memory
+        self.disk = disk
+        self.ttl = ttl
+        self.history_messages = history_messages
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def key_for(
+        self,
+        algorithm: str,
+        band: str,
+        current_array: Optional[List[int]],
+        chat_history: List[Dict[str, str]],
+        version: str = "",
+        summary: str = "",
+    ) -> str:
+        return make_cache_key(
+            algorithm, band, current_array, chat_history, self.history_messages, version, summary
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self.memory.set(key, value, self.ttl)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(json.dumps(value))
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        value = json.loads(json.dumps(value))
+        self.memory.set(key, value, self.ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, self.ttl)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "diskHits": self.disk_hits,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memoryEntries": len(self.memory),
+            "memoryEvictions": self.memory.evictions,
+            "diskEntries": len(self.disk) if self.disk is not None else 0,
+            "diskEvictions": self.disk.evictions if self.disk is not None else 0,
+        }
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """
+    Build the cache from RESPONSE_CACHE_* settings, or None when disabled.
+
+    RESPONSE_CACHE_ENABLED  "1"/"true" to turn the cache on (off by default)
+    RESPONSE_CACHE_SIZE     max in-memory entries (1024)
+    RESPONSE_CACHE_TTL      seconds an entry stays valid (3600)
+    RESPONSE_CACHE_HISTORY  messages of recent chat that form the key (2)
+    RESPONSE_CACHE_PATH     SQLite file for the disk tier (no disk tier if unset)
+    """
+    if os.getenv("RESPONSE_CACHE_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return None
+    memory = MemoryBackend(int(os.getenv("RESPONSE_CACHE_SIZE", 1024)))
+    path = os.getenv("RESPONSE_CACHE_PATH")
+    disk = SQLiteBackend(path) if path else None
+    return ResponseCache(
+        memory,
+        disk,
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", 3600)),
+        history_messages=int(os.getenv("RESPONSE_CACHE_HISTORY", 2)),
+    )
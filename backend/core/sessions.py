@@ -0,0 +1,258 @@
+"""
+Server-side chat sessions
+
+A session holds what the client used to resend every turn: the algorithm,
+learner mastery, a ring buffer of recent messages and the authoritative
+array state. Clients create a session once and then post only the new
+message. Sessions live in a bounded in-memory store with TTL eviction; with
+SESSION_DB_PATH set, messages of sessions that carry a userId are also
+written to the app's SQLite database (the Prisma ChatMessage table) and
+recent ones are loaded back when a session is created.
+
+Settings:
+    SESSION_MAX         max live sessions (10000)
+    SESSION_TTL         seconds of inactivity before a session expires (3600)
+    SESSION_HISTORY     messages kept per session (10)
+    SESSION_DB_PATH     path of the Prisma SQLite database (unset = memory only)
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from .context import LessonSummary
+from .log import get_logger
+from .metrics import gauge
+
+logger = get_logger("sessions")
+
+SESSIONS_LIVE = gauge("sortcrates_chat_sessions", "Live chat sessions")
+
+
+class ChatSession:
+    """One learner's conversation about one algorithm."""
+
+    def __init__(
+        self,
+        session_id: str,
+        algorithm: str,
+        learner_mastery: Dict[str, float],
+        current_array: Optional[List[int]] = None,
+        user_id: Optional[str] = None,
+        history_size: int = 10,
+    ):
+        self.id = session_id
+        self.algorithm = algorithm
+        self.learner_mastery = dict(learner_mastery)
+        self.current_array = list(current_array) if current_array else None
+        self.user_id = user_id
+        self.history: Deque[Dict[str, str]] = deque(maxlen=history_size)
+        # Covers the whole lesson, including turns that left the ring buffer
+        self.summary = LessonSummary()
+        self.turns = 0
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+        # Serializes turns so two tabs can't interleave one session's history
+        self.lock = asyncio.Lock()
+
+    def record_turn(self, user_message: str, response: Dict[str, Any]) -> List[Dict[str, str]]:
+        """
+        Apply a tutor response: append both messages, fold the turn into the
+        lesson summary, take the mastery update and the engine's array state.
+
+        Returns:
+            The two messages that were appended
+        """
+        messages = [
+            {"role": "user", "content": user_message},
+            {"role": "ai", "content": response["socraticQuestion"]},
+        ]
+        self.history.extend(messages)
+        self.summary.observe(user_message, response)
+        self.learner_mastery.update(response.get("learnerMasteryUpdate") or {})
+        data = (response.get("visualizerStateUpdate") or {}).get("data")
+        if data:
+            self.current_array = list(data)
+        self.turns += 1
+        return messages
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "sessionId": self.id,
+            "algorithm": self.algorithm,
+            "learnerMastery": dict(self.learner_mastery),
+            "currentArray": self.current_array,
+            "chatHistory": list(self.history),
+            "turns": self.turns,
+        }
+
+
+class ChatMessageStore:
+    """
+    Reads and writes the Prisma ChatMessage table.
+
+    Prisma owns the schema; this only inserts rows and reads the most recent
+    ones through the (userId, algorithm) index.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._lock = threading.Lock()
+
+    def recent(self, user_id: str, algorithm: str, limit: int) -> List[Dict[str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT role, content FROM "ChatMessage" WHERE userId = ? AND algorithm = ? '
+                "AND role != 'system' ORDER BY timestamp DESC LIMIT ?",
+                (user_id, algorithm, limit),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def append(self, user_id: str, algorithm: str, messages: List[Dict[str, str]]) -> None:
+        # Prisma stores SQLite DateTime as milliseconds since the epoch
+        now = int(time.time() * 1000)
+        rows = [
+            (str(uuid.uuid4()), user_id, algorithm, m["role"], m["content"], json.dumps({}), now + i)
+            for i, m in enumerate(messages)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO "ChatMessage" (id, userId, algorithm, role, content, metadata, timestamp) '
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+
+class SessionStore:
+    """
+    Bounded LRU of chat sessions with idle-time expiry.
+
+    Expired sessions are dropped lazily on access and when new sessions are
+    created; beyond max_sessions the least recently used one is evicted.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        ttl: float = 3600,
+        history_size: int = 10,
+        messages: Optional[ChatMessageStore] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_size = history_size
+        self.messages = messages
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        SESSIONS_LIVE.set_function(lambda: len(self._sessions))
+
+    def _expire(self, now: float) -> None:
+        # Oldest-first order means we can stop at the first live session
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_active <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def create(
+        self,
+        algorithm: str,
+        learner_mastery: Dict[str, float],
+        current_array: Optional[List[int]] = None,
+        user_id: Optional[str] = None,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+    ) -> ChatSession:
+        """
+        Start a session, seeded from `chat_history` or, for a known user with
+        persistence on, from their stored messages for this algorithm.
+        """
+        session = ChatSession(
+            uuid.uuid4().hex, algorithm, learner_mastery, current_array, user_id, self.history_size
+        )
+        if not chat_history and user_id and self.messages is not None:
+            try:
+                chat_history = self.messages.recent(user_id, algorithm, self.history_size)
+            except sqlite3.Error as e:
+                logger.warning("could not load chat history", exc_info=e)
+        if chat_history:
+            session.history.extend(chat_history)
+            session.summary = LessonSummary.from_history(chat_history)
+
+        with self._lock:
+            self._expire(time.monotonic())
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            self.created += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Return a live session and mark it active, or None."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if now - session.last_active > self.ttl:
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            session.last_active = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def persist(self, session: ChatSession, messages: List[Dict[str, str]]) -> None:
+        """Write a turn's messages to SQLite when the session belongs to a user."""
+        if self.messages is None or not session.user_id:
+            return
+        try:
+            self.messages.append(session.user_id, session.algorithm, messages)
+        except sqlite3.Error as e:
+            logger.warning("could not persist chat messages", exc_info=e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live = len(self._sessions)
+        return {
+            "live": live,
+            "maxSessions": self.max_sessions,
+            "ttlSeconds": self.ttl,
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "persistent": self.messages is not None,
+        }
+
+
+def session_store_from_env() -> SessionStore:
+    """Build the session store from SESSION_* environment settings."""
+    path = os.getenv("SESSION_DB_PATH")
+    messages = None
+    if path:
+        try:
+            messages = ChatMessageStore(path)
+        except sqlite3.Error as e:
+            logger.warning("session persistence disabled", exc_info=e)
+    return SessionStore(
+        max_sessions=int(os.getenv("SESSION_MAX", 10000)),
+        ttl=float(os.getenv("SESSION_TTL", 3600)),
+        history_size=int(os.getenv("SESSION_HISTORY", 10)),
+        messages=messages,
+    )
@@ -0,0 +1,101 @@
+"""
+Single-flight coalescing of identical LLM calls
+
+In a classroom dozens of learners open the same algorithm on the same
+starting array and send the same first message within seconds, so the tutor
+assembles byte-identical prompts. Concurrent calls with the same prompt
+share one upstream call: the first caller (the leader) runs it and everyone
+who arrives while it is in flight (followers) awaits the same result.
+Nothing is kept after the call finishes; that's the response cache's job.
+
+Settings:
+    SINGLE_FLIGHT_ENABLED   coalesce identical in-flight prompts (true)
+"""
+
+import asyncio
+import copy
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .metrics import counter
+
+SINGLE_FLIGHT = counter(
+    "sortcrates_single_flight_total",
+    "LLM calls by route and role (leader ran the call, follower shared it)",
+    ("route", "role"),
+)
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent async calls by key.
+
+    The shared call runs as its own task, so a leader whose request is
+    cancelled (client went away) doesn't take its followers down with it.
+    """
+
+    def __init__(self, route: str, enabled: bool = True):
+        self.route = route
+        self.enabled = enabled
+        self.leaders = 0
+        self.followers = 0
+        self._flights: Dict[str, "asyncio.Future"] = {}
+
+    def _forget(self, key: str, task: "asyncio.Future") -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    def pending(self, key: str) -> Optional["asyncio.Future"]:
+        """The in-flight call for `key`, if any (for callers that only want to join one)."""
+        if not self.enabled:
+            return None
+        return self._flights.get(key)
+
+    async def join(self, task: "asyncio.Future") -> Any:
+        """Await a call started by someone else; returns a private copy of its result."""
+        self.followers += 1
+        SINGLE_FLIGHT.inc(route=self.route, role="follower")
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `fn` unless a call with the same key is already in flight.
+
+        Returns:
+            Tuple of (result, shared). Followers get a deep copy of the
+            leader's result, or the leader's exception raised again.
+        """
+        if not self.enabled:
+            return await fn(), False
+        task = self._flights.get(key)
+        if task is not None:
+            return await self.join(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._flights[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        self.leaders += 1
+        SINGLE_FLIGHT.inc(route=self.route, role="leader")
+        return await asyncio.shield(task), False
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.followers
+        return {
+            "enabled": self.enabled,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "inFlight": len(self._flights),
+            # Share of LLM-bound turns that didn't need their own call
+            "coalescingRatio": round(self.followers / calls, 4) if calls else 0.0,
+        }
+
+
+def single_flight_from_env(route: str) -> SingleFlight:
+    """Build a SingleFlight for `route` from SINGLE_FLIGHT_ENABLED."""
+    enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+    return SingleFlight(route, enabled=enabled)
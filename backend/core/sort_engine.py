@@ -0,0 +1,292 @@
+"""
+Deterministic sorting step engine
+
+Python mirror of the generators in lib/sortingAlgorithms.ts. The tutor uses
+it to work out the real next comparison/swap and the resulting array, so the
+LLM only has to phrase the question.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Every lesson starts from this array (see app/practice)
+DEFAULT_ARRAY = [70, 30, 90, 10, 50, 80, 20, 60, 100, 40]
+
+# Longest array a lesson accepts (the visualizer shows at most 30 bars)
+MAX_LESSON_ARRAY = 30
+
+# Internal generators mutate `data` in place and yield (state, focusIndices)
+# after each visible step, exactly where the TypeScript versions yield a
+# snapshot. Callers copy `data` only when they need to keep a step.
+StepEvent = Tuple[str, Tuple[int, ...]]
+
+
+def _bubble_sort(data: List[int]) -> Iterator[StepEvent]:
+    n = len(data)
+    for i in range(n - 1):
+        for j in range(n - i - 1):
+            yield "comparing", (j, j + 1)
+            if data[j] > data[j + 1]:
+                yield "swapping", (j, j + 1)
+                data[j], data[j + 1] = data[j + 1], data[j]
+                yield "swapping", (j, j + 1)
+    yield "sorted", ()
+
+
+def _selection_sort(data: List[int]) -> Iterator[StepEvent]:
+    n = len(data)
+    for i in range(n - 1):
+        min_idx = i
+        for j in range(i + 1, n):
+            yield "comparing", (min_idx, j)
+            if data[j] < data[min_idx]:
+                min_idx = j
+        if min_idx != i:
+            yield "swapping", (i, min_idx)
+            data[i], data[min_idx] = data[min_idx], data[i]
+            yield "swapping", (i, min_idx)
+    yield "sorted", ()
+
+
+def _insertion_sort(data: List[int]) -> Iterator[StepEvent]:
+    n = len(data)
+    for i in range(1, n):
+        key = data[i]
+        j = i - 1
+        yield "comparing", (i,)
+        while j >= 0 and data[j] > key:
+            yield "comparing", (j, j + 1)
+            data[j + 1] = data[j]
+            yield "swapping", (j, j + 1)
+            j -= 1
+        data[j + 1] = key
+    yield "sorted", ()
+
+
+def _merge_sort(data: List[int]) -> Iterator[StepEvent]:
+    def merge(left: int, mid: int, right: int) -> Iterator[StepEvent]:
+        left_arr = data[left:mid + 1]
+        right_arr = data[mid + 1:right + 1]
+        i = j = 0
+        k = left
+        while i < len(left_arr) and j < len(right_arr):
+            yield "comparing", (left + i, mid + 1 + j)
+            if left_arr[i] <= right_arr[j]:
+                data[k] = left_arr[i]
+                i += 1
+            else:
+                data[k] = right_arr[j]
+                j += 1
+            yield "swapping", (k,)
+            k += 1
+        while i < len(left_arr):
+            data[k] = left_arr[i]
+            yield "swapping", (k,)
+            i += 1
+            k += 1
+        while j < len(right_arr):
+            data[k] = right_arr[j]
+            yield "swapping", (k,)
+            j += 1
+            k += 1
+
+    def helper(left: int, right: int) -> Iterator[StepEvent]:
+        if left < right:
+            mid = (left + right) // 2
+            yield from helper(left, mid)
+            yield from helper(mid + 1, right)
+            yield from merge(left, mid, right)
+
+    yield from helper(0, len(data) - 1)
+    yield "sorted", ()
+
+
+def _quick_sort(data: List[int]) -> Iterator[StepEvent]:
+    # Explicit stack instead of recursion so already-sorted input can't hit
+    # the recursion limit; popping the left range first keeps the TS order
+    stack = [(0, len(data) - 1)]
+    while stack:
+        low, high = stack.pop()
+        if low >= high:
+            continue
+        pivot = data[high]
+        i = low - 1
+        yield "comparing", (high,)
+        for j in range(low, high):
+            yield "comparing", (j, high)
+            if data[j] < pivot:
+                i += 1
+                if i != j:
+                    yield "swapping", (i, j)
+                    data[i], data[j] = data[j], data[i]
+                    yield "swapping", (i, j)
+        yield "swapping", (i + 1, high)
+        data[i + 1], data[high] = data[high], data[i + 1]
+        yield "swapping", (i + 1, high)
+        stack.append((i + 2, high))
+        stack.append((low, i))
+    yield "sorted", ()
+
+
+def _heap_sort(data: List[int]) -> Iterator[StepEvent]:
+    def heapify(n: int, i: int) -> Iterator[StepEvent]:
+        while True:
+            largest = i
+            left = 2 * i + 1
+            right = 2 * i + 2
+            if left < n:
+                yield "comparing", (largest, left)
+                if data[left] > data[largest]:
+                    largest = left
+            if right < n:
+                yield "comparing", (largest, right)
+                if data[right] > data[largest]:
+                    largest = right
+            if largest == i:
+                return
+            yield "swapping", (i, largest)
+            data[i], data[largest] = data[largest], data[i]
+            yield "swapping", (i, largest)
+            i = largest
+
+    n = len(data)
+    for i in range(n // 2 - 1, -1, -1):
+        yield from heapify(n, i)
+    for i in range(n - 1, 0, -1):
+        yield "swapping", (0, i)
+        data[0], data[i] = data[i], data[0]
+        yield "swapping", (0, i)
+        yield from heapify(i, 0)
+    yield "sorted", ()
+
+
+SORTING_ALGORITHMS: Dict[str, Callable[[List[int]], Iterator[StepEvent]]] = {
+    "bubbleSort": _bubble_sort,
+    "selectionSort": _selection_sort,
+    "insertionSort": _insertion_sort,
+    "mergeSort": _merge_sort,
+    "quickSort": _quick_sort,
+    "heapSort": _heap_sort,
+}
+
+
+def get_sorting_algorithm(algorithm: str) -> Callable[[List[int]], Iterator[StepEvent]]:
+    """Look up a step generator by name, defaulting to bubble sort like the frontend."""
+    return SORTING_ALGORITHMS.get(algorithm, _bubble_sort)
+
+
+def iter_steps(algorithm: str, arr: List[int]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield SortStep dicts ({data, focusIndices, state}) for an algorithm.
+
+    Produces the same sequence as the matching generator in
+    lib/sortingAlgorithms.ts.
+    """
+    data = list(arr)
+    for state, focus in get_sorting_algorithm(algorithm)(data):
+        yield {"data": list(data), "focusIndices": list(focus), "state": state}
+
+
+def _find_move(algorithm: str, start: List[int], current: List[int]) -> Optional[Dict[str, Any]]:
+    """Run the algorithm from `start` and describe the move out of `current`."""
+    data = list(start)
+    # Only pairs compared since the array last changed (recording starts at
+    # `current` and stops at the next change); `seen` keeps the
+    # de-duplication O(1) on long sorted stretches
+    comparisons: List[List[int]] = []
+    seen = set()
+    reached = data == current
+    # Set once the array has changed. Insertion and merge sort change it one
+    # write at a time, so the halfway states of a shift or a merge hold a
+    # value twice and miss another; the move runs on until the array is a
+    # permutation of `current` again
+    moved_focus: Optional[List[int]] = None
+    values = sorted(current)
+    for state, focus in get_sorting_algorithm(algorithm)(data):
+        if not reached:
+            reached = data == current
+            if not reached:
+                continue
+        if data != current:
+            if moved_focus is None:
+                moved_focus = list(focus)
+            if sorted(data) != values:
+                continue
+            if moved_focus != list(focus) or len(focus) != 2:
+                moved_focus = [i for i, (a, b) in enumerate(zip(data, current)) if a != b]
+            return {
+                "comparisons": comparisons,
+                "focusIndices": moved_focus,
+                "state": "swapping",
+                "data": list(data),
+            }
+        if state == "comparing" and len(focus) == 2 and focus not in seen:
+            seen.add(focus)
+            comparisons.append(list(focus))
+    if not reached:
+        return None
+    return {
+        "comparisons": comparisons,
+        "focusIndices": [],
+        "state": "sorted",
+        "data": list(current),
+    }
+
+
+def next_move(
+    algorithm: str,
+    current_array: List[int],
+    initial_array: Optional[List[int]] = None,
+) -> Dict[str, Any]:
+    """
+    Work out the next change the algorithm makes to `current_array`.
+
+    The algorithm is replayed from `initial_array` (the lesson's starting
+    array by default) until it reaches `current_array`; if the array was never
+    on that path the algorithm is started fresh from `current_array`.
+
+    Returns:
+        Dictionary with the pairs compared before the next change
+        ("comparisons"), the indices that change ("focusIndices"), the state
+        ("swapping", or "sorted" when nothing is left to do) and the array
+        after the change ("data")
+    """
+    current = list(current_array)
+    start = DEFAULT_ARRAY if initial_array is None else list(initial_array)
+    move = None
+    if sorted(start) == sorted(current):
+        move = _find_move(algorithm, start, current)
+    if move is None:
+        move = _find_move(algorithm, current, current)
+    return move
+
+
+def reconcile_visualizer_update(
+    proposed: Dict[str, Any],
+    move: Dict[str, Any],
+    current_array: List[int],
+) -> Dict[str, Any]:
+    """
+    Replace the LLM's visualizer update with the engine's ground truth.
+
+    The model only decides *whether* the lesson moves on (state "swapping")
+    or keeps examining a pair; the array itself always comes from the engine.
+    """
+    state = proposed.get("state", "idle")
+    if move["state"] == "sorted":
+        return {"focusIndices": [], "state": "sorted", "data": list(current_array)}
+    if state == "swapping":
+        return {
+            "focusIndices": move["focusIndices"],
+            "state": "swapping",
+            "data": move["data"],
+        }
+    focus = proposed.get("focusIndices") or []
+    if state == "idle":
+        return {
+            "focusIndices": focus if focus in move["comparisons"] else [],
+            "state": "idle",
+            "data": list(current_array),
+        }
+    if focus not in move["comparisons"]:
+        focus = move["comparisons"][0] if move["comparisons"] else move["focusIndices"]
+    return {"focusIndices": focus, "state": "comparing", "data": list(current_array)}
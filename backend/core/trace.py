@@ -0,0 +1,421 @@
+"""
+Precomputed sort traces for visualizer playback
+
+A trace is every step the engine would show for an algorithm and starting
+array, stored as the base array plus a flat stream of (op, i, j) triples in
+a typed array, with full snapshots (keyframes) every K steps so a player can
+seek without replaying from the start. Nothing is copied per step: the
+engine's generator runs on a list that logs its own writes, and each step
+appends a few integers.
+
+Ops (codes in OPS):
+    compare  i j   frame, state "comparing", focus [i, j] (j = -1: [i])
+    swapping i j   frame, state "swapping", focus [i, j] (j = -1: [i])
+    sorted  -1 -1  frame, state "sorted", no focus
+    swap     i j   mutation: exchange data[i] and data[j]
+    set      i v   mutation: data[i] = v
+Mutations always precede the frame they belong to. Playback applies them
+in order and emits the current array at every frame; keyframe n holds the
+array at frame `step` and `op`, the index of the next triple to apply.
+
+Builds run in a small process pool (TraceBuilder), like the complexity
+lab's, so a quick sort of 20k sorted elements doesn't hold the GIL the
+event loop needs for seconds. Work is bounded by the number of builds
+queued across requests, and a refused build (TraceTooLong) is remembered
+by its key, so asking again is answered without running it again.
+
+Settings:
+    TRACE_MAX_LENGTH      longest array accepted (20000)
+    TRACE_MAX_STEPS       frames before a trace is refused (3000000)
+    TRACE_KEYFRAME_EVERY  default frames between keyframes (256)
+    TRACE_CACHE_BYTES     encoded traces kept in memory, LRU (67108864)
+    TRACE_WORKERS         pool processes (1)
+    TRACE_QUEUE_SIZE      builds queued across requests before shedding (4)
+    TRACE_POOL_BUILDS     builds before the pool processes are replaced (100)
+    TRACE_NICE            niceness added to pool processes (10)
+    TRACE_REFUSALS        refused keys remembered, LRU (4096)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .admission import AdmissionRejected
+from .complexity import _lower_priority
+from .log import get_logger, log_fields
+from .metrics import counter, histogram
+from .single_flight import SingleFlight
+from .sort_engine import SORTING_ALGORITHMS
+
+TRACE_CACHE = counter(
+    "sortcrates_trace_cache_total", "Trace cache lookups by outcome", ("outcome",)
+)
+TRACE_BUILD_SECONDS = histogram(
+    "sortcrates_trace_build_seconds",
+    "Wall time of one trace build and encode in a pool process",
+    ("algorithm",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+logger = get_logger("trace")
+
+OPS = {"compare": 0, "swapping": 1, "sorted": 2, "swap": 3, "set": 4}
+_FRAME_OPS = {"comparing": OPS["compare"], "swapping": OPS["swapping"], "sorted": OPS["sorted"]}
+_FRAME_STATES = {code: state for state, code in _FRAME_OPS.items()}
+FORMAT_VERSION = 1
+
+
+# Comparisons these always make, whatever the input, so oversized requests
+# can be refused without running them
+_MIN_STEPS = {
+    "bubbleSort": lambda n: n * (n - 1) // 2,
+    "selectionSort": lambda n: n * (n - 1) // 2,
+}
+
+
+class TraceTooLong(ValueError):
+    """The algorithm needs more steps than TRACE_MAX_STEPS for this array."""
+
+
+class _RecordingList(list):
+    """List that logs the index of every item assignment."""
+
+    __slots__ = ("writes",)
+
+    def __setitem__(self, index, value):
+        self.writes.append(index)
+        list.__setitem__(self, index, value)
+
+
+class Trace:
+    """A delta-encoded step sequence (see the module docstring for the layout)."""
+
+    def __init__(
+        self,
+        algorithm: str,
+        base: List[int],
+        ops: "array",
+        steps: int,
+        keyframe_every: int,
+        keyframes: List[Tuple[int, int, "array"]],
+    ):
+        self.algorithm = algorithm
+        self.base = base
+        self.ops = ops
+        self.steps = steps
+        self.keyframe_every = keyframe_every
+        self.keyframes = keyframes
+
+    def frames(self) -> Iterator[Dict[str, Any]]:
+        """Replay as SortStep dicts, identical to sort_engine.iter_steps (for checks)."""
+        data = list(self.base)
+        ops = self.ops
+        for n in range(0, len(ops), 3):
+            op, i, j = ops[n], ops[n + 1], ops[n + 2]
+            if op == OPS["swap"]:
+                data[i], data[j] = data[j], data[i]
+            elif op == OPS["set"]:
+                data[i] = j
+            else:
+                focus = [] if i < 0 else ([i] if j < 0 else [i, j])
+                yield {"data": list(data), "focusIndices": focus, "state": _FRAME_STATES[op]}
+
+    def to_json(self) -> bytes:
+        return json.dumps({
+            "format": FORMAT_VERSION,
+            "algorithm": self.algorithm,
+            "length": len(self.base),
+            "steps": self.steps,
+            "opCodes": OPS,
+            "base": self.base,
+            "ops": self.ops.tolist(),
+            "keyframeEvery": self.keyframe_every,
+            "keyframes": [
+                {"step": step, "op": op, "data": data.tolist()}
+                for step, op, data in self.keyframes
+            ],
+        }, separators=(",", ":")).encode("utf-8")
+
+
+def build_trace(
+    algorithm: str,
+    base: List[int],
+    keyframe_every: int = 256,
+    max_steps: int = 3_000_000,
+) -> Trace:
+    """
+    Run the engine once and encode every step.
+
+    Keyframes are at least len(base) frames apart, so snapshots never
+    outweigh the deltas they let a player skip.
+
+    Raises:
+        KeyError: Unknown algorithm
+        TraceTooLong: More than max_steps frames
+    """
+    generator = SORTING_ALGORITHMS[algorithm]
+    if algorithm in _MIN_STEPS and _MIN_STEPS[algorithm](len(base)) > max_steps:
+        raise TraceTooLong(f"{algorithm} takes more than {max_steps} steps on this array")
+    every = max(1, keyframe_every, len(base))
+    data = _RecordingList(base)
+    data.writes = writes = []
+    # Values as of the previous frame, to tell swaps from plain writes
+    previous = list(base)
+    out: List[int] = []
+    emit = out.extend
+    keyframes: List[Tuple[int, int, "array"]] = []
+    swap, set_op = OPS["swap"], OPS["set"]
+    steps = 0
+
+    for state, focus in generator(data):
+        if writes:
+            if len(writes) == 2:
+                # `a[i], a[j] = a[j], a[i]` arrives as two writes
+                i, j = writes
+                if data[i] == previous[j] and data[j] == previous[i]:
+                    emit((swap, i, j))
+                    previous[i], previous[j] = previous[j], previous[i]
+                    writes.clear()
+            for index in writes:
+                value = data[index]
+                emit((set_op, index, value))
+                previous[index] = value
+            writes.clear()
+        code = _FRAME_OPS[state]
+        if len(focus) == 2:
+            emit((code, focus[0], focus[1]))
+        elif focus:
+            emit((code, focus[0], -1))
+        else:
+            emit((code, -1, -1))
+        steps += 1
+        if steps % every == 0:
+            keyframes.append((steps - 1, len(out) // 3, array("q", data)))
+        if steps > max_steps:
+            raise TraceTooLong(f"{algorithm} takes more than {max_steps} steps on this array")
+
+    ops = array("q", out)
+    return Trace(algorithm, list(base), ops, steps, every, keyframes)
+
+
+def trace_key(algorithm: str, base: List[int], keyframe_every: int) -> str:
+    digest = hashlib.blake2b(array("q", base).tobytes(), digest_size=16).hexdigest()
+    return f"{algorithm}:{keyframe_every}:{len(base)}:{digest}"
+
+
+class TraceCache:
+    """Thread-safe LRU of encoded traces, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                TRACE_CACHE.inc(outcome="miss")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        TRACE_CACHE.inc(outcome="hit")
+        return body
+
+    def set(self, key: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._entries[key] = body
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "bytes": self.bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def trace_cache_from_env() -> TraceCache:
+    """Build the trace cache from TRACE_CACHE_BYTES."""
+    return TraceCache(int(os.getenv("TRACE_CACHE_BYTES", 64 * 1024 * 1024)))
+
+
+def _build(algorithm: str, base: List[int], keyframe_every: int, max_steps: int) -> Tuple[bytes, int, float]:
+    """Pool entry point: (encoded trace, steps, seconds)."""
+    start = time.perf_counter()
+    trace = build_trace(algorithm, base, keyframe_every, max_steps)
+    body = trace.to_json()
+    return body, trace.steps, time.perf_counter() - start
+
+
+class TraceBuilder:
+    """
+    Builds, caches and refuses traces on a bounded process pool.
+
+    The pool is started on first use, so importing this in a preloading
+    parent (serve.py) doesn't fork it into every web worker.
+    """
+
+    def __init__(
+        self,
+        cache: TraceCache,
+        max_steps: int = 3_000_000,
+        workers: int = 1,
+        queue_size: int = 4,
+        pool_builds: int = 100,
+        nice: int = 10,
+        refusal_entries: int = 4096,
+    ):
+        self.cache = cache
+        self.max_steps = max_steps
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pool_builds = pool_builds
+        self.nice = nice
+        self.refusal_entries = refusal_entries
+        self.flights = SingleFlight("trace")
+        self.builds = 0
+        self.refused = 0
+        self._refusals: "OrderedDict[str, str]" = OrderedDict()
+        self._queued = 0
+        self._build_seconds = 1.0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_builds = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is not None and self._executor_builds >= self.pool_builds:
+            # Not max_tasks_per_child: it can deadlock the executor on 3.11
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+                initargs=(self.nice,),
+            )
+            self._executor_builds = 0
+        self._executor_builds += 1
+        return self._executor
+
+    def _refuse(self, key: str, message: str) -> None:
+        self._refusals[key] = message
+        self._refusals.move_to_end(key)
+        while len(self._refusals) > self.refusal_entries:
+            self._refusals.popitem(last=False)
+
+    async def get(self, algorithm: str, base: List[int], keyframe_every: int) -> bytes:
+        """
+        The encoded trace, from cache or built in the pool.
+
+        Raises:
+            KeyError: Unknown algorithm
+            TraceTooLong: More than max_steps frames, now or the last time
+                this key was asked for
+            AdmissionRejected: Too many builds already queued
+        """
+        key = trace_key(algorithm, base, keyframe_every)
+        body = self.cache.get(key)
+        if body is not None:
+            return body
+        refusal = self._refusals.get(key)
+        if refusal is not None:
+            self._refusals.move_to_end(key)
+            self.refused += 1
+            raise TraceTooLong(refusal)
+        body, _ = await self.flights.do(key, lambda: self._build(key, algorithm, base, keyframe_every))
+        return body
+
+    async def _build(self, key: str, algorithm: str, base: List[int], keyframe_every: int) -> bytes:
+        if self._queued >= self.queue_size:
+            raise AdmissionRejected(
+                "trace_busy", self._build_seconds * self._queued / max(1, self.workers)
+            )
+        loop = asyncio.get_running_loop()
+        self._queued += 1
+        try:
+            body, steps, seconds = await loop.run_in_executor(
+                self._pool(), _build, algorithm, base, keyframe_every, self.max_steps
+            )
+        except TraceTooLong as e:
+            self._refuse(key, str(e))
+            raise
+        finally:
+            self._queued -= 1
+        self.builds += 1
+        TRACE_BUILD_SECONDS.observe(seconds, algorithm=algorithm)
+        self._build_seconds = 0.8 * self._build_seconds + 0.2 * seconds
+        log_fields(
+            logger, logging.INFO, "trace built",
+            algorithm=algorithm, length=len(base), steps=steps, bytes=len(body),
+        )
+        self.cache.set(key, body)
+        return body
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.cache.stats(),
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "queuedBuilds": self._queued,
+            "builds": self.builds,
+            "refusals": len(self._refusals),
+            "refusedFromCache": self.refused,
+            "coalesced": self.flights.followers,
+        }
+
+
+def trace_builder_from_env() -> TraceBuilder:
+    """Build the trace builder (and its cache) from TRACE_* settings."""
+    return TraceBuilder(
+        trace_cache_from_env(),
+        max_steps=int(os.getenv("TRACE_MAX_STEPS", 3_000_000)),
+        workers=int(os.getenv("TRACE_WORKERS", 1)),
+        queue_size=int(os.getenv("TRACE_QUEUE_SIZE", 4)),
+        pool_builds=int(os.getenv("TRACE_POOL_BUILDS", 100)),
+        nice=int(os.getenv("TRACE_NICE", 10)),
+        refusal_entries=int(os.getenv("TRACE_REFUSALS", 4096)),
+    )
+
+
+_builder: Optional[TraceBuilder] = None
+
+
+def get_trace_builder() -> TraceBuilder:
+    """Return the process-wide trace builder, creating it on first use."""
+    global _builder
+    if _builder is None:
+        _builder = trace_builder_from_env()
+    return _builder
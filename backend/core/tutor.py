@@ -3,27 +3,296 @@ LangChain-powered Socratic Tutor
 """
 
 import json
-import os
-from typing import Dict, List, Any
-from dotenv import load_dotenv
-import google.generativeai as genai
-from .prompts import get_socratic_prompt
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple
+from .answer_classifier import CHAT_TURNS, AnswerClassifier, answer_classifier_from_env
+from .context import ContextBuilder, LessonSummary
+from .llm_client import ModelClient, classify_error, get_model_client
+from .log import debug_payload, get_logger, log_fields
+from .metrics import record_fallback, stage_timer, timed
+from .llm_json import StreamingFieldExtractor, parse_llm_json
+from .llm_schemas import TutorOutput
+from .prompts import (
+    AssembledPrompt,
+    NO_ARRAY_STATE,
+    PROMPT_VERSION,
+    build_prompt,
+    format_array_state,
+    get_static_prefix,
+    mastery_band,
+)
+from .response_cache import ResponseCache, response_cache_from_env
+from .single_flight import SingleFlight, prompt_key, single_flight_from_env
+from .sort_engine import next_move, reconcile_visualizer_update
 
-# Load environment variables
-load_dotenv()
+logger = get_logger("tutor")
+
+# Array state, template lines and the learner's message on top of the
+# static prefix and the context budget
+TURN_OVERHEAD_TOKENS = 150
 
 
 class SocraticTutor:
-    def __init__(self):
-        api_key = os.getenv("GOOGLE_AI_API_KEY")
-        print(f"GOOGLE_AI_API_KEY loaded: {bool(api_key)}", flush=True)
-        print(f"API key length: {len(api_key) if api_key else 0}", flush=True)
-        
-        # Use Gemini 1.5 Flash - Higher free tier quota (1500 RPD)
-        print("Initializing Google Gemini 1.5 Flash...", flush=True)
-        genai.configure(api_key=api_key)
-        self.llm = genai.GenerativeModel('gemini-2.5-flash')
-        print("Google Gemini 1.5 Flash initialized successfully", flush=True)
+    def __init__(
+        self,
+        client: Optional[ModelClient] = None,
+        cache: Optional[ResponseCache] = None,
+        classifier: Optional[AnswerClassifier] = None,
+        flights: Optional[SingleFlight] = None,
+    ):
+        # Shared, process-wide LLM client (also used by the quiz router)
+        self.client = client if client is not None else get_model_client()
+        log_fields(
+            logger, logging.INFO, "tutor initialized",
+            provider=self.client.provider, model=self.client.model_name,
+            configured=self.client.configured,
+        )
+        
+        # Opt-in cache of parsed responses (RESPONSE_CACHE_ENABLED)
+        self.cache = cache if cache is not None else response_cache_from_env()
+        
+        # Lesson summary + recent messages within a fixed token budget
+        self.context = ContextBuilder.from_env()
+        
+        # Trivial turns (yes/no, small talk, pair answers) skip the LLM
+        self.classifier = classifier if classifier is not None else answer_classifier_from_env()
+        
+        # Identical prompts in flight at the same time share one LLM call
+        self.flights = flights if flights is not None else single_flight_from_env("chat")
+    
+    def _cache_key(
+        self,
+        algorithm: str,
+        current_mastery: float,
+        current_array: Optional[List[int]],
+        chat_history: List[Dict[str, str]],
+        summary: Optional[LessonSummary] = None,
+    ) -> Optional[str]:
+        """Cache key for this turn, or None when caching is off."""
+        if self.cache is None:
+            return None
+        # Two sessions at the same exchange can be at different points of
+        # the lesson, and the summary in their prompts says so
+        return self.cache.key_for(
+            algorithm,
+            mastery_band(current_mastery),
+            current_array,
+            chat_history,
+            PROMPT_VERSION,
+            summary.digest() if summary is not None else "",
+        )
+    
+    def _cache_get(
+        self, cache_key: str, learner_mastery: Dict[str, float]
+    ) -> Optional[Dict[str, Any]]:
+        """A cached response with its mastery change applied to this learner's mastery."""
+        cached = self.cache.get(cache_key)
+        if cached is None or "learnerMasteryDelta" not in cached:
+            return None
+        delta = cached.pop("learnerMasteryDelta")
+        cached["learnerMasteryUpdate"] = {
+            name: round(min(1.0, max(0.0, learner_mastery.get(name, 0.0) + change)), 4)
+            for name, change in delta.items()
+        }
+        return cached
+    
+    def _cache_set(
+        self, cache_key: str, result: Dict[str, Any], learner_mastery: Dict[str, float]
+    ) -> None:
+        # The key only pins the mastery band, so store the change the turn
+        # made rather than the first learner's absolute mastery
+        cached = dict(result)
+        update = cached.pop("learnerMasteryUpdate", None) or {}
+        cached["learnerMasteryDelta"] = {
+            name: value - learner_mastery.get(name, 0.0) for name, value in update.items()
+        }
+        self.cache.set(cache_key, cached)
+    
+    def estimate_prompt_tokens(self, algorithm: str, learner_mastery: Dict[str, float]) -> int:
+        """Upper estimate of a turn's prompt size, for admission control."""
+        band = mastery_band(learner_mastery.get(algorithm, 0.0))
+        prefix = get_static_prefix(algorithm, band)
+        return prefix.tokens + self.context.budget_tokens + TURN_OVERHEAD_TOKENS
+    
+    @timed("chat", "next_move")
+    def _next_move(
+        self, algorithm: str, current_array: Optional[List[int]]
+    ) -> Optional[Dict[str, Any]]:
+        """The step engine's next move, or None when no array was sent."""
+        # Work out the real next step server-side instead of asking the LLM
+        return next_move(algorithm, current_array) if current_array else None
+    
+    @timed("chat", "prompt_assembly")
+    def _build_prompt(
+        self,
+        algorithm: str,
+        chat_history: List[Dict[str, str]],
+        current_mastery: float,
+        move: Optional[Dict[str, Any]],
+        current_array: Optional[List[int]] = None,
+        summary: Optional[LessonSummary] = None,
+    ) -> AssembledPrompt:
+        """
+        Assemble the prompt for a chat turn that goes to the LLM.
+        
+        Older turns of a session reach the prompt through its lesson summary,
+        newer ones verbatim; stateless turns send recent messages only.
+        """
+        # Constant-size context however long the lesson runs
+        lesson_summary, history_str = self.context.build(chat_history, summary)
+        
+        array_state = NO_ARRAY_STATE
+        if move is not None:
+            array_state = format_array_state(move, current_array)
+        
+        # Static prefix is memoized per (algorithm, mastery band); only the
+        # turn suffix is rebuilt here
+        return build_prompt(
+            algorithm, current_mastery, history_str, array_state, lesson_summary
+        )
+    
+    def _local_response(
+        self,
+        route: str,
+        algorithm: str,
+        chat_history: List[Dict[str, str]],
+        current_mastery: float,
+        move: Optional[Dict[str, Any]],
+        current_array: Optional[List[int]],
+    ) -> Optional[Dict[str, Any]]:
+        """Answer the turn locally when it's trivial; counts every turn by handler."""
+        with stage_timer(route, "local_classify"):
+            local = self.classifier.classify(
+                algorithm, chat_history, current_mastery, move, current_array
+            )
+        if local is None:
+            CHAT_TURNS.inc(route=route, handler="llm")
+            return None
+        intent, result = local
+        CHAT_TURNS.inc(route=route, handler=intent)
+        log_fields(
+            logger, logging.INFO, "turn answered locally",
+            intent=intent, analysis=result["analysisOfUserAnswer"],
+        )
+        return result
+    
+    def _report_tokens(self, prompt: AssembledPrompt, response: Any) -> Dict[str, Any]:
+        """
+        Log what a turn cost, preferring the provider's exact usage counts.
+        """
+        report = dict(prompt.token_report)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            report["promptTokens"] = getattr(usage, "prompt_token_count", None)
+            report["cachedTokens"] = getattr(usage, "cached_content_token_count", None)
+            report["outputTokens"] = getattr(usage, "candidates_token_count", None)
+        log_fields(logger, logging.INFO, "prompt tokens", **report)
+        return report
+    
+    @timed("chat", "json_parse")
+    def _parse_response(
+        self,
+        response_text: str,
+        algorithm: str,
+        current_mastery: float,
+        move: Optional[Dict[str, Any]] = None,
+        current_array: List[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Turn raw model output into the structured chat response.
+        
+        The visualizer array always comes from the step engine's `move`;
+        the model only chooses whether the lesson advances.
+        
+        Raises:
+            json.JSONDecodeError: If no usable JSON object can be extracted
+                (LLMJSONError)
+        """
+        debug_payload(logger, "raw llm response", response=response_text)
+        
+        # One scan: skips fences/prose, repairs trailing commas and cut-offs,
+        # and keeps whatever fields validate
+        parsed, extracted = parse_llm_json(response_text, TutorOutput, "chat")
+        if extracted.partial:
+            log_fields(logger, logging.WARNING, "partial llm response", repaired=extracted.repaired)
+        
+        # Award XP strictly: 5 for correct responses, otherwise 0
+        analysis = parsed.analysisOfUserAnswer
+        xp_awarded = 5 if analysis == "correct" else 0
+
+        # Get visualizer state update
+        visualizer_update = parsed.visualizerStateUpdate
+        
+        if move is not None:
+            visualizer_update = reconcile_visualizer_update(
+                visualizer_update, move, current_array
+            )
+
+        result = {
+            "socraticQuestion": parsed.socraticQuestion,
+            "analysisOfUserAnswer": analysis,
+            "learnerMasteryUpdate": parsed.learnerMasteryUpdate or {algorithm: current_mastery},
+            "visualizerStateUpdate": visualizer_update,
+            "xpAwarded": xp_awarded,
+        }
+        
+        debug_payload(logger, "tutor result", result=result)
+        return result
+    
+    def _fallback_response(self, algorithm: str, current_mastery: float) -> Dict[str, Any]:
+        """Response used when the model output could not be parsed."""
+        return {
+            "socraticQuestion": "That's an interesting point! Can you elaborate on your thinking?",
+            "analysisOfUserAnswer": "continuing",
+            "learnerMasteryUpdate": {algorithm: current_mastery},
+            "visualizerStateUpdate": {"focusIndices": [], "state": "idle"},
+            "xpAwarded": 0,
+        }
+    
+    def _error_response(
+        self,
+        algorithm: str,
+        current_mastery: float,
+        error: Exception,
+        move: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Log an LLM error and return a local response that keeps the lesson going.
+        
+        When the learner is working on an array, the question points at the
+        pair the sort engine would look at next, so the lesson can continue
+        while the provider is down.
+        """
+        kind = classify_error(error)
+        record_fallback("chat", kind)
+        
+        if kind == "circuit_open":
+            # Expected while the provider is degraded; no traceback needed
+            log_fields(logger, logging.WARNING, "llm circuit open, answering locally")
+        else:
+            logger.error(
+                "llm call failed",
+                exc_info=error,
+                extra={"fields": {"kind": kind, "errorType": type(error).__name__}},
+            )
+        
+        name = algorithm.replace('Sort', ' Sort')
+        focus = move.get("focusIndices", []) if move else []
+        if move and move.get("state") == "sorted":
+            question = f"I'm having a technical issue, but your array is sorted! How did {name} guarantee that every element ended up in place?"
+        elif len(focus) >= 2:
+            i, j = focus[0], focus[1]
+            question = f"I'm having a technical issue, but let's keep going: look at the elements at positions {i} and {j}. What should {name} do with them, and why?"
+        else:
+            question = f"I'm experiencing a technical issue. Let's continue with {name} - what would you like to explore about this algorithm?"
+        
+        return {
+            "socraticQuestion": question,
+            "analysisOfUserAnswer": "continuing",
+            "learnerMasteryUpdate": {algorithm: current_mastery},
+            "visualizerStateUpdate": {"focusIndices": list(focus), "state": "idle"},
+            "xpAwarded": 0,
+        }
     
     def generate_response(
         self,
@@ -31,157 +300,224 @@ class SocraticTutor:
         chat_history: List[Dict[str, str]],
         learner_mastery: Dict[str, float],
         current_array: List[int] = None,
+        summary: Optional[LessonSummary] = None,
     ) -> Dict[str, Any]:
         """
         Generate a Socratic response using LangChain and Gemini.
         
+        Blocks the calling thread for the whole LLM round-trip; request
+        handlers should use generate_response_async instead.
+        
         Args:
             algorithm: The current sorting algorithm (e.g., "bubbleSort")
             chat_history: List of recent messages [{"role": "user/ai", "content": "..."}]
             learner_mastery: Dictionary of mastery levels per algorithm
+            summary: Running lesson summary of a server-side session, if any
         
         Returns:
             Dictionary containing the AI's structured response
         """
-        print(f"\n=== GENERATE RESPONSE CALLED ===")
-        print(f"Algorithm: {algorithm}")
-        print(f"Chat history: {chat_history}")
-        print(f"Current array: {current_array}")
-        print(f"Use mock: {getattr(self, 'use_mock', False)}")
-        print(f"LLM exists: {self.llm is not None}")
-        
-        # Get current mastery for this algorithm
+        # Trivial turns are answered before any prompt is assembled
         current_mastery = learner_mastery.get(algorithm, 0.0)
+        move = self._next_move(algorithm, current_array)
+        local = self._local_response(
+            "chat", algorithm, chat_history, current_mastery, move, current_array
+        )
+        if local is not None:
+            return local
         
-        # Format chat history for prompt (reduced to 5 for speed)
-        history_str = "\n".join([
-            f"{msg['role'].upper()}: {msg['content']}"
-            for msg in chat_history[-5:]  # Last 5 messages only
-        ])
+        cache_key = self._cache_key(
+            algorithm, current_mastery, current_array, chat_history, summary
+        )
+        if cache_key is not None:
+            cached = self._cache_get(cache_key, learner_mastery)
+            if cached is not None:
+                return cached
         
-        # Add array data to context if provided
-        if current_array:
-            history_str += f"\n\nCURRENT ARRAY: {current_array}"
+        prompt = self._build_prompt(
+            algorithm, chat_history, current_mastery, move, current_array, summary
+        )
         
-        # Create system prompt
-        system_prompt = get_socratic_prompt(algorithm, current_mastery, history_str)
+        try:
+            # The client applies the deadline, retries and circuit breaker
+            with stage_timer("chat", "llm_call"):
+                response = self.client.generate(prompt.text)
+            self._report_tokens(prompt, response)
+            result = self._parse_response(
+                response.text.strip(), algorithm, current_mastery, move, current_array
+            )
+            if cache_key is not None:
+                self._cache_set(cache_key, result, learner_mastery)
+            return result
+            
+        except json.JSONDecodeError as e:
+            logger.warning("json parse error, using fallback", extra={"fields": {"error": str(e)}})
+            record_fallback("chat", "json_decode")
+            return self._fallback_response(algorithm, current_mastery)
         
-        # Build prompt with chat history
-        full_prompt = system_prompt + "\n\n"
+        except Exception as e:
+            return self._error_response(algorithm, current_mastery, e, move)
+    
+    async def generate_response_async(
+        self,
+        algorithm: str,
+        chat_history: List[Dict[str, str]],
+        learner_mastery: Dict[str, float],
+        current_array: List[int] = None,
+        summary: Optional[LessonSummary] = None,
+        refund: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Async variant of generate_response.
         
-        # Add chat history (only last 5)
-        for msg in chat_history[-5:]:
-            if msg["role"] == "user":
-                full_prompt += f"USER: {msg['content']}\n"
-            elif msg["role"] == "ai" or msg["role"] == "assistant":
-                full_prompt += f"ASSISTANT: {msg['content']}\n"
+        The shared client bounds how many LLM calls run at once; further
+        requests wait without holding up the event loop, so /health and other
+        learners keep being served while Gemini is thinking. Concurrent turns
+        with a byte-identical prompt share one call (see single_flight).
         
-        # Add instruction for JSON response
-        full_prompt += "\nGenerate your Socratic response as a valid JSON object following the specified format. Do not include any markdown formatting or additional text."
+        `refund` is called when the turn is answered without an LLM call of
+        its own (locally, from cache or by a shared call), so admission can
+        return the tokens it charged up front.
+        """
+        # Trivial turns are answered before any prompt is assembled
+        current_mastery = learner_mastery.get(algorithm, 0.0)
+        move = self._next_move(algorithm, current_array)
+        local = self._local_response(
+            "chat", algorithm, chat_history, current_mastery, move, current_array
+        )
+        if local is not None:
+            if refund is not None:
+                refund()
+            return local
         
-        try:
-            # Call Gemini API directly - NO TIMEOUTS OR FALLBACKS
-            print("🚀 Calling Gemini 2.5 Flash...", flush=True)
-            response = self.llm.generate_content(full_prompt)
-            response_text = response.text.strip()
-            print("✅ Gemini response received", flush=True)
-            
-            print(f"Raw LLM response: {response_text[:500]}...")  # Log first 500 chars
-            
-            # Try to extract JSON from the response
-            # Sometimes LLM adds extra text before/after JSON
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}')
-            
-            if json_start != -1 and json_end != -1:
-                response_text = response_text[json_start:json_end + 1]
-                
-            # Remove markdown code fences if present
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            
-            response_text = response_text.strip()
-            
-            print(f"Cleaned response: {response_text[:500]}...")  # Log cleaned version
-            
-            # Parse JSON response
-            parsed_response = json.loads(response_text)
-            print(f"Successfully parsed JSON response")
-            
-            # Validate and set defaults with deterministic XP awarding
-            analysis = parsed_response.get("analysisOfUserAnswer", "continuing")
-
-            # Award XP strictly: 5 for correct responses, otherwise 0
-            xp_awarded = 5 if analysis == "correct" else 0
-
-            # Get visualizer state update
-            visualizer_update = parsed_response.get(
-                "visualizerStateUpdate",
-                {"focusIndices": [], "state": "idle"}
+        cache_key = self._cache_key(
+            algorithm, current_mastery, current_array, chat_history, summary
+        )
+        if cache_key is not None:
+            cached = self._cache_get(cache_key, learner_mastery)
+            if cached is not None:
+                if refund is not None:
+                    refund()
+                return cached
+        
+        prompt = self._build_prompt(
+            algorithm, chat_history, current_mastery, move, current_array, summary
+        )
+        
+        async def call() -> Dict[str, Any]:
+            with stage_timer("chat", "llm_call"):
+                response = await self.client.generate_async(prompt.text)
+            self._report_tokens(prompt, response)
+            # The prompt pins algorithm, mastery and array state, so every
+            # caller sharing it would parse the same result
+            return self._parse_response(
+                response.text.strip(), algorithm, current_mastery, move, current_array
             )
-            
-            # Log the visualizer update for debugging
-            print(f"📊 Visualizer update from AI: {visualizer_update}", flush=True)
-            if "data" in visualizer_update:
-                print(f"✅ AI provided new array data: {visualizer_update['data']}", flush=True)
-            else:
-                print(f"⚠️ No array data in visualizer update", flush=True)
-
-            result = {
-                "socraticQuestion": parsed_response.get(
-                    "socraticQuestion",
-                    "Great observation! Can you explain your reasoning further?"
-                ),
-                "analysisOfUserAnswer": analysis,
-                "learnerMasteryUpdate": parsed_response.get(
-                    "learnerMasteryUpdate", {algorithm: current_mastery}
-                ),
-                "visualizerStateUpdate": visualizer_update,
-                "xpAwarded": xp_awarded,
-            }
-            
-            print(f"🎯 Final result being returned: {result}", flush=True)
+        
+        try:
+            result, shared = await self.flights.do(prompt_key(prompt.text), call)
+            if shared and refund is not None:
+                refund()
+            if cache_key is not None and not shared:
+                self._cache_set(cache_key, result, learner_mastery)
             return result
             
         except json.JSONDecodeError as e:
-            print(f"JSON Parse Error: {e}", flush=True)
-            print(f"Response text: {response_text}", flush=True)
-            # Fallback response
-            return {
-                "socraticQuestion": "That's an interesting point! Can you elaborate on your thinking?",
-                "analysisOfUserAnswer": "continuing",
-                "learnerMasteryUpdate": {algorithm: current_mastery},
-                "visualizerStateUpdate": {"focusIndices": [], "state": "idle"},
-                "xpAwarded": 0,
-            }
+            logger.warning("json parse error, using fallback", extra={"fields": {"error": str(e)}})
+            record_fallback("chat", "json_decode")
+            return self._fallback_response(algorithm, current_mastery)
         
         except Exception as e:
-            print(f"🚨 GEMINI API ERROR: {e}", flush=True)
-            print(f"Error type: {type(e)}", flush=True)
-            
-            # Check if it's a quota/rate limit error
-            error_str = str(e).lower()
-            if "quota" in error_str or "rate limit" in error_str or "429" in error_str:
-                print("💸 Rate limit hit - API quota exceeded", flush=True)
-            elif "timeout" in error_str:
-                print("⏰ API call timed out", flush=True)
-            elif "network" in error_str or "connection" in error_str:
-                print("🌐 Network connection issue", flush=True)
-            else:
-                print("❓ Unknown API error", flush=True)
-            
-            import traceback
-            traceback.print_exc()
+            return self._error_response(algorithm, current_mastery, e, move)
+    
+    async def stream_response_async(
+        self,
+        algorithm: str,
+        chat_history: List[Dict[str, str]],
+        learner_mastery: Dict[str, float],
+        current_array: List[int] = None,
+        summary: Optional[LessonSummary] = None,
+        refund: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of generate_response_async.
+        
+        Yields ("token", text) events with new socraticQuestion text as the
+        model produces it, then a single ("final", response dict) event with
+        the fully parsed response. The final question is authoritative: if the
+        output can't be parsed it carries the fallback question instead.
+        `refund` is called as in generate_response_async.
+        """
+        # Trivial turns are answered before any prompt is assembled
+        current_mastery = learner_mastery.get(algorithm, 0.0)
+        move = self._next_move(algorithm, current_array)
+        local = self._local_response(
+            "chat_stream", algorithm, chat_history, current_mastery, move, current_array
+        )
+        if local is not None:
+            if refund is not None:
+                refund()
+            yield "token", local["socraticQuestion"]
+            yield "final", local
+            return
+        
+        cache_key = self._cache_key(
+            algorithm, current_mastery, current_array, chat_history, summary
+        )
+        if cache_key is not None:
+            cached = self._cache_get(cache_key, learner_mastery)
+            if cached is not None:
+                if refund is not None:
+                    refund()
+                yield "token", cached["socraticQuestion"]
+                yield "final", cached
+                return
+        
+        prompt = self._build_prompt(
+            algorithm, chat_history, current_mastery, move, current_array, summary
+        )
+        
+        # Join an identical non-streaming call already in flight rather than
+        # starting a second one; its question arrives as a single token
+        pending = self.flights.pending(prompt_key(prompt.text))
+        if pending is not None:
+            if refund is not None:
+                refund()
+            try:
+                result = await self.flights.join(pending)
+            except json.JSONDecodeError:
+                record_fallback("chat", "json_decode")
+                result = self._fallback_response(algorithm, current_mastery)
+            except Exception as e:
+                result = self._error_response(algorithm, current_mastery, e, move)
+            yield "token", result["socraticQuestion"]
+            yield "final", result
+            return
+        
+        extractor = StreamingFieldExtractor("socraticQuestion")
+        parts: List[str] = []
+        last_chunk = None
+        try:
+            with stage_timer("chat", "llm_stream"):
+                async for chunk in self.client.stream_async(prompt.text):
+                    last_chunk = chunk
+                    parts.append(chunk.text)
+                    text = extractor.feed(chunk.text)
+                    if text:
+                        yield "token", text
+            self._report_tokens(prompt, last_chunk)
+            result = self._parse_response(
+                "".join(parts).strip(), algorithm, current_mastery, move, current_array
+            )
+            if cache_key is not None:
+                self._cache_set(cache_key, result, learner_mastery)
             
-            # Return a more specific error response
-            return {
-                "socraticQuestion": f"I'm experiencing a technical issue. Let's continue with {algorithm.replace('Sort', ' Sort')} - what would you like to explore about this algorithm?",
-                "analysisOfUserAnswer": "continuing",
-                "learnerMasteryUpdate": {algorithm: current_mastery},
-                "visualizerStateUpdate": {"focusIndices": [], "state": "idle"},
-                "xpAwarded": 0,
-            }
+        except json.JSONDecodeError as e:
+            logger.warning("json parse error, using fallback", extra={"fields": {"error": str(e)}})
+            record_fallback("chat", "json_decode")
+            result = self._fallback_response(algorithm, current_mastery)
+        
+        except Exception as e:
+            result = self._error_response(algorithm, current_mastery, e, move)
+        
+        yield "final", result
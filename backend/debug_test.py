@@ -1,5 +1,8 @@
+from core.env import load_env
 from core.tutor import SocraticTutor
 
+load_env()
+
 print("Creating tutor...")
 tutor = SocraticTutor()
 
@@ -2,23 +2,103 @@
 FastAPI Backend for Socratic Sort AI Tutor
 """
 
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 
+from core.env import load_env
+
 # Load environment variables
-load_dotenv()
+load_env()
+
+from core.log import configure_logging, get_logger, log_fields, new_request_id, request_id_var
+
+# Console output goes through a queue so handlers never block on stdout
+configure_logging()
 
 # Import routers
-from api.v1.chat import router as chat_router
+from api.v1.chat import get_sessions, get_tutor, router as chat_router
+from api.v1.complexity import router as complexity_router
 from api.v1.evaluate_quiz import router as quiz_router
+from api.v1.leaderboard import router as leaderboard_router
+from api.v1.trace import router as trace_router
+from core.admission import AdmissionRejected, get_admission
+from core.complexity import get_complexity_lab
+from core.trace import get_trace_builder
+from core.leaderboard import get_leaderboard
+from core.progress import get_progress_writer
+from core.llm_client import get_model_client
+from core.metrics import HTTP_SECONDS, REGISTRY, monitor_event_loop_lag
+from core.prompts import warm_static_prefixes
+from core.quiz_feedback import feedback_jobs
+from core.sort_engine import SORTING_ALGORITHMS
+
+logger = get_logger("server")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up before /health reports ready; drain background work on shutdown.
+    """
+    started = time.perf_counter()
+    app.state.ready = False
+    client = get_model_client()
+    client.warm_up()
+    get_tutor()
+    get_sessions()
+    # No-op when serve.py already built them in the preloading parent
+    prefixes = warm_static_prefixes(SORTING_ALGORITHMS)
+    progress = get_progress_writer()
+    progress_flusher = None
+    if progress is not None:
+        # Turns a crashed worker logged but never wrote
+        recovered = await asyncio.to_thread(progress.recover)
+        if recovered:
+            log_fields(logger, logging.WARNING, "recovered progress", turns=recovered)
+        progress_flusher = asyncio.create_task(progress.run())
+    leaderboard = get_leaderboard()
+    learners = await asyncio.to_thread(leaderboard.sync)
+    leaderboard_sync = asyncio.create_task(
+        leaderboard.run_sync(float(os.getenv("LEADERBOARD_FLUSH_INTERVAL", 30)))
+    )
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    app.state.warmup_seconds = round(time.perf_counter() - started, 3)
+    app.state.ready = True
+    log_fields(
+        logger, logging.INFO, "ready",
+        pid=os.getpid(), warmupSeconds=app.state.warmup_seconds, prefixes=prefixes,
+        learners=learners,
+    )
+    yield
+    # The server has stopped accepting and finished in-flight requests by now
+    app.state.ready = False
+    cancelled = await feedback_jobs.drain(float(os.getenv("FEEDBACK_DRAIN_TIMEOUT", 5)))
+    log_fields(logger, logging.INFO, "drained", pid=os.getpid(), cancelledFeedbackJobs=cancelled)
+    if progress_flusher is not None:
+        progress_flusher.cancel()
+        await asyncio.to_thread(progress.close)
+    leaderboard_sync.cancel()
+    # Ranks for XP awarded since the last interval
+    await asyncio.to_thread(leaderboard.sync)
+    lag_monitor.cancel()
+    get_complexity_lab().close()
+    get_trace_builder().close()
+    client.close()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Socratic Sort AI Backend",
-    description="LangChain-powered Socratic tutoring for sorting algorithms",
+    description="Socratic tutoring for sorting algorithms",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware - Allow all origins for debugging
@@ -31,6 +111,43 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """
+    Tag every log record of a request with its id (X-Request-ID or a new one)
+    and record its latency.
+    """
+    request_id = request.headers.get("x-request-id") or new_request_id()
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        request_id_var.reset(token)
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=str(status),
+        )
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """Shed load with a fast 429 the client can retry after."""
+    return JSONResponse(
+        {"detail": "Too many requests", "reason": exc.reason},
+        status_code=429,
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -42,17 +159,54 @@ async def root():
 
 
 @app.get("/health")
-async def health():
-    """Health check for monitoring."""
-    return {"status": "healthy"}
+async def health(request: Request):
+    """
+    Readiness check: 503 until the worker has warmed up (and while it shuts
+    down), so load balancers only route to workers that can answer at once.
+    """
+    if not getattr(request.app.state, "ready", False):
+        draining = getattr(request.app.state, "warmup_seconds", None) is not None
+        return JSONResponse({"status": "draining" if draining else "starting"}, status_code=503)
+    return {"status": "healthy", "warmupSeconds": request.app.state.warmup_seconds}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the backend's counters and histograms."""
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/health/llm")
+async def llm_stats():
+    """Connection pool and latency stats for the shared model client."""
+    return get_model_client().stats()
+
+
+@app.get("/health/progress")
+async def progress_stats():
+    """Write-behind queue and flush counters for learner progress."""
+    writer = get_progress_writer()
+    return writer.stats() if writer is not None else {"enabled": False}
+
+
+@app.get("/health/admission")
+async def admission_stats():
+    """Rate-limit and token-budget queue state."""
+    return get_admission().stats()
 
 
 # Include API routes
 app.include_router(chat_router, prefix="/api/v1", tags=["Chat"])
 app.include_router(quiz_router, prefix="/api/v1", tags=["Quiz"])
+app.include_router(trace_router, prefix="/api/v1", tags=["Trace"])
+app.include_router(complexity_router, prefix="/api/v1", tags=["Complexity"])
+app.include_router(leaderboard_router, prefix="/api/v1", tags=["Leaderboard"])
 
 
 if __name__ == "__main__":
+    # Development server with auto-reload; production uses serve.py
     import uvicorn
     
     port = int(os.getenv("PORT", 8001))
@@ -0,0 +1,169 @@
+"""
+Production server for the Socratic Sort backend
+
+Runs the app under gunicorn with uvicorn workers:
+- one worker by default. Chat sessions (core/sessions.py) and quiz
+  feedback jobs (core/quiz_feedback.py) live in the memory of the worker
+  that created them, so a request for them that lands on another worker
+  gets a 404. More workers are only started with STICKY_ROUTING=true,
+  i.e. when the proxy in front pins each learner to one worker; then the
+  default is one per available core (cgroup CPU quota and CPU affinity
+  are respected, so containers don't oversubscribe)
+- the app is imported once in the master before forking (preload), and the
+  prompt prefixes and the LLM provider's SDK are loaded there too, so
+  workers share them copy-on-write
+- each worker configures its own LLM client in the app lifespan; /health
+  answers 503 until that's done
+- SIGTERM drains: workers stop accepting, finish in-flight requests for up
+  to GRACEFUL_TIMEOUT seconds, then wait for background feedback jobs
+
+Without gunicorn (Windows) it falls back to uvicorn's own multi-process
+mode, which imports the app separately in each worker. `python main.py`
+remains the auto-reloading development server.
+
+Usage (from backend/):
+    python serve.py
+
+Settings:
+    HOST              interface to bind (0.0.0.0)
+    PORT              port to bind (8001)
+    WEB_CONCURRENCY   worker processes (1; available cores with STICKY_ROUTING)
+    STICKY_ROUTING    the proxy routes each learner to the same worker, so
+                      more than one may run (false)
+    GRACEFUL_TIMEOUT  seconds to finish in-flight requests on shutdown (30)
+    KEEPALIVE         seconds to hold idle keep-alive connections (5)
+"""
+
+import gc
+import importlib.util
+import os
+from typing import Optional
+
+from core.env import load_env
+
+load_env()
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota of the container (cgroup v2 or v1), or None if unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cores() -> int:
+    """Cores this process may actually use."""
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cores = min(cores, max(1, int(limit)))
+    return max(1, cores)
+
+
+def worker_count() -> int:
+    """
+    Worker processes to start.
+
+    Raises:
+        SystemExit: More than one worker without STICKY_ROUTING
+    """
+    sticky = os.getenv("STICKY_ROUTING", "false").lower() in ("1", "true", "yes")
+    configured = os.getenv("WEB_CONCURRENCY")
+    workers = int(configured) if configured else (available_cores() if sticky else 1)
+    if workers > 1 and not sticky:
+        raise SystemExit(
+            f"WEB_CONCURRENCY={workers} needs STICKY_ROUTING=true: sessions and quiz "
+            "feedback jobs are kept per worker, so each learner must reach the same one"
+        )
+    return max(1, workers)
+
+
+def _warm_master(server) -> None:
+    """gunicorn when_ready hook: runs in the master after preload, before forking."""
+    from core.prompts import warm_static_prefixes
+    from core.providers import preload_provider_sdk
+    from core.sort_engine import SORTING_ALGORITHMS
+
+    warm_static_prefixes(SORTING_ALGORITHMS)
+    # Import only: clients (and any connections) are made per worker
+    sdk = preload_provider_sdk(os.getenv("LLM_PROVIDER", "gemini"))
+    # Keep the preloaded objects out of the collector so its bookkeeping
+    # doesn't touch (and copy) their pages in every worker
+    gc.freeze()
+    server.log.info(
+        "warmed prompt prefixes and %s, forking %s workers", sdk or "no SDK", server.num_workers
+    )
+
+
+def run_gunicorn(host: str, port: int, workers: int, graceful_timeout: int, keepalive: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": "uvicorn.workers.UvicornWorker",
+                "preload_app": True,
+                "graceful_timeout": graceful_timeout,
+                "keepalive": keepalive,
+                # Streams can stay open for a whole LLM answer
+                "timeout": max(60, graceful_timeout),
+                "when_ready": _warm_master,
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+    Server().run()
+
+
+def run_uvicorn(host: str, port: int, workers: int, graceful_timeout: int, keepalive: int) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        timeout_graceful_shutdown=graceful_timeout,
+        timeout_keep_alive=keepalive,
+        log_level="info",
+    )
+
+
+def main() -> None:
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", 8001))
+    graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+    keepalive = int(os.getenv("KEEPALIVE", 5))
+    workers = worker_count()
+    # Read by the app, e.g. to split the admission token budget per worker
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if importlib.util.find_spec("gunicorn") is not None:
+        run_gunicorn(host, port, workers, graceful_timeout, keepalive)
+    else:
+        run_uvicorn(host, port, workers, graceful_timeout, keepalive)
+
+
+if __name__ == "__main__":
+    main()